@@ -13,18 +13,24 @@ import math
 import smtplib
 import ssl
 import uuid
+import time
+import mimetypes
 import asyncio
+import logging
 from email.message import EmailMessage
 from datetime import datetime
 from pathlib import Path
 from typing import Annotated, List, Dict, Any, Optional, Union
 from typing_extensions import TypedDict
+from contextlib import asynccontextmanager
 import subprocess
 
 # --- Web Framework Imports ---
 from fastapi import FastAPI, HTTPException, UploadFile, File, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from starlette.responses import JSONResponse, FileResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 import uvicorn
 from pydantic import BaseModel, Field
 
@@ -32,40 +38,28 @@ from pydantic import BaseModel, Field
 from dotenv import load_dotenv
 
 # --- Third-Party Library Imports ---
-import boto3
 from botocore.exceptions import ClientError
 from github import Github, GithubException
 
 # --- Langchain Imports ---
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_together import ChatTogether
-from langchain_groq import ChatGroq
-from langchain_deepseek import ChatDeepSeek
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langchain_community.tools import BraveSearch
 from langchain_core.messages import BaseMessage, ToolMessage, HumanMessage, AIMessage, SystemMessage
 from langchain_core.tools import InjectedToolCallId, tool
+from langchain_core.callbacks import adispatch_custom_event
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.prebuilt import ToolNode, tools_condition
-from langchain_community.chat_message_histories import SQLChatMessageHistory
 
-# --- RAG Tools Imports ---
-from tools.rag_tools import index_document, query_documents, initialize_rag_components
+# --- Tool Registry ---
+# Tool modules and third-party tools are described up front and imported on first call
+from utils.tool_registry import tool_registry, bindable
 
-# --- Wikipedia Tool Imports ---
-from langchain_community.tools import WikipediaQueryRun
-from langchain_community.utilities import WikipediaAPIWrapper
-
-# --- YouTube Search Tool Imports ---
-from langchain_community.tools import YouTubeSearchTool
-
-# --- Python REPL Tool Imports ---
-from langchain_experimental.utilities import PythonREPL  # Ensure this module is installed
-from langchain_core.tools import Tool
-
-# --- Image Generation Tool Import ---
-from tools.image_generation_tool import generate_image_gemini
+# --- Background Warm-up ---
+from utils.warmup import warmup
+from utils.async_io import run_blocking, shutdown as shutdown_io_pool
+from tools.rag_ingest import resolve_files, get_job, shutdown as shutdown_loader_pool
+from utils.uploads import ContentStore, UploadTooLarge, UnsupportedUpload
+from utils.file_serving import file_response
+from utils.json_response import FastJSONResponse
+from utils.loop_monitor import loop_monitor, LOOP_MONITOR_ENABLED
 
 # --- Environment Setup ---
 load_dotenv()
@@ -110,89 +104,72 @@ WORKSPACE_DIR = Path("./raiden_workspace_srv")
 WORKSPACE_DIR.mkdir(exist_ok=True)
 print(color_text(f"Server Workspace: {WORKSPACE_DIR.resolve()}", "YELLOW"))
 
-# --- Global Clients Initialization ---
+# --- Global Clients ---
+# Built by the background warm-up (see warmup.register below) once the server is listening,
+# so a slow or unreachable service never delays startup
 github_client = None
-if github_token:
-    try:
-        github_client = Github(github_token)
-        _ = github_client.get_rate_limit() # Test connection
-        print(color_text("GitHub client initialized.", "GREEN"))
-    except Exception as e:
-        print(color_text(f"Warning: Failed to initialize GitHub client: {e}", "YELLOW"))
-        github_client = None
-else:
-     print(color_text("GitHub client NOT initialized (No GITHUB_TOKEN).", "YELLOW"))
-
 rekognition_client = None
-if aws_access_key_found and aws_secret_key_found:
-    try:
-        rekognition_client = boto3.client(
-            'rekognition', region_name=aws_region,
-            aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
-            aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
-        )
-        print(color_text("AWS Rekognition client initialized.", "GREEN"))
-    except Exception as e:
-        print(color_text(f"Warning: Failed to initialize AWS Rekognition client: {e}", "YELLOW"))
-        rekognition_client = None
-else:
-     print(color_text("AWS Rekognition client NOT initialized (AWS keys missing).", "YELLOW"))
+
+def _init_github_client():
+    """Builds the GitHub client and checks the token. Returns False without GITHUB_TOKEN."""
+    global github_client
+    if not github_token:
+        print(color_text("GitHub client NOT initialized (No GITHUB_TOKEN).", "YELLOW"))
+        return False
+    client = Github(github_token)
+    _ = client.get_rate_limit() # Test connection
+    github_client = client
+    print(color_text("GitHub client initialized.", "GREEN"))
+
+def _init_rekognition_client():
+    """Builds the Rekognition client. Returns False without AWS credentials."""
+    global rekognition_client
+    if not (aws_access_key_found and aws_secret_key_found):
+        print(color_text("AWS Rekognition client NOT initialized (AWS keys missing).", "YELLOW"))
+        return False
+    import boto3  # Deferred: loading botocore's service models is slow
+    rekognition_client = boto3.client(
+        'rekognition', region_name=aws_region,
+        aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID"),
+        aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY"),
+    )
+    print(color_text("AWS Rekognition client initialized.", "GREEN"))
+
+def _github_client():
+    """The GitHub client, waiting briefly if warm-up is still building it.
+
+    A failed warm-up (e.g. GitHub unreachable at startup) is retried here on
+    each use, as _polly_available() does for Polly, until one succeeds.
+    """
+    if github_client is None:
+        warmup.wait_for("github")
+    if github_client is None:
+        warmup.retry("github")
+    return github_client
+
+def _rekognition_client():
+    """The Rekognition client, waiting briefly if warm-up is still building it"""
+    if rekognition_client is None:
+        warmup.wait_for("rekognition")
+    return rekognition_client
 
 
 # --- LLM Selection & Initialization ---
-# Select ONE LLM model when the server starts
-# Prioritize keys: Groq > Google > Together > DeepSeek
-selected_llm_instance = None
-llm_name = "None"
-
-if groq_api_key_found:
-    print(color_text("Using Groq Llama 3 (llama3-70b-8192) as default LLM.", "GREEN"))
-    selected_llm_instance = ChatGroq(temperature=0.7, model_name="deepseek-r1-distill-llama-70b", max_tokens=8192)
-    llm_name = "Groq Llama 3"
-elif google_api_key_found:
-    print(color_text("Using Google Gemini Flash (gemini-2.0-flash) as LLM.", "GREEN"))
-    selected_llm_instance = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7, max_tokens=4096)
-    llm_name = "Google Gemini Flash"
-elif together_api_key_found:
-    print(color_text("Using Together Llama 3 (meta-llama/Llama-3-70b-chat-hf) as LLM.", "GREEN"))
-    selected_llm_instance = ChatTogether(model="meta-llama/Llama-3-70b-chat-hf", temperature=0.7, max_tokens=4096)
-    llm_name = "Together Llama 3"
-elif deepseek_api_key_found:
-    print(color_text("Using DeepSeek Chat (deepseek-chat) as LLM.", "GREEN"))
-    selected_llm_instance = ChatDeepSeek(model="deepseek-chat", temperature=0.7, max_tokens=4096)
-    llm_name = "DeepSeek Chat"
-else:
+# Clients are built once by the model registry and chosen per request.
+# The default follows key priority: Groq > Google > Together > DeepSeek
+from utils.model_registry import model_registry
+
+default_model_key = model_registry.default_key
+if default_model_key is None:
     print(color_text("CRITICAL ERROR: No suitable LLM API key found. Backend cannot function.", "RED"))
     # Exit or handle gracefully - exiting for clarity here
     exit(1)
 
-print(color_text(f"Selected LLM: {llm_name}", "GREEN"))
+# Default model, used when a request does not name one (and by tools such as email_drafter);
+# its client is built on first use
+llm_name = model_registry.display_name(default_model_key)
 
-# --- Initialize RAG Components ---
-initialize_rag_components()
-
-# Initialize Wikipedia tool
-wikipedia_tool = WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
-
-# Initialize YouTube search tool
-youtube_search_tool = YouTubeSearchTool()
-
-# Initialize Python REPL tool
-python_repl = PythonREPL()
-repl_tool = Tool(
-    name="python_repl",
-    description="""A Python shell for executing Python commands, with special support for data visualization:
-    - Create plots using matplotlib, seaborn, or plotly
-    - Save plots using plt.savefig('plot_name.png')
-    - All plots will be automatically displayed in the chat
-    - For best results, use light colors and clear labels
-    - Always close plots using plt.close() to free memory""",
-    func=python_repl.run,
-    coroutine=None,
-    args_schema=None,
-    return_direct=False,
-    verbose=True,  # Enable verbose mode for better error reporting
-)
+print(color_text(f"Selected LLM: {llm_name}", "GREEN"))
 
 # --- Initialize SQLite Chat Memory ---
 chat_memory = None
@@ -230,19 +207,57 @@ def _resolve_safe_path(filename: str) -> Path:
     return target_path
 
 
-# --- Search Tools ---
-tavily_tool = TavilySearchResults(
-    max_results=1,
-    include_answer=True,
-    include_raw_content=False,
-    search_depth="advanced",
-)
+# --- Third-Party Tools (built on first call by the tool registry) ---
+def _tavily_tool():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    return TavilySearchResults(
+        max_results=1,
+        include_answer=True,
+        include_raw_content=False,
+        search_depth="advanced",
+    )
 
-brave_search_tool = BraveSearch.from_api_key(
-    api_key=os.environ.get("BRAVE_SEARCH_API_KEY"),
-    search_kwargs={"count": 2},
-    name="brave_web_search" # Ensure name consistency
-)
+def _brave_search_tool():
+    from langchain_community.tools import BraveSearch
+    return BraveSearch.from_api_key(
+        api_key=os.environ.get("BRAVE_SEARCH_API_KEY"),
+        search_kwargs={"count": 2},
+        name="brave_web_search" # Ensure name consistency
+    )
+
+def _wikipedia_tool():
+    from langchain_community.tools import WikipediaQueryRun
+    from langchain_community.utilities import WikipediaAPIWrapper
+    return WikipediaQueryRun(api_wrapper=WikipediaAPIWrapper())
+
+def _youtube_search_tool():
+    from langchain_community.tools import YouTubeSearchTool
+    return YouTubeSearchTool()
+
+PYTHON_REPL_DESCRIPTION = """A Python shell for executing Python commands, with special support for data visualization:
+    - Create plots using matplotlib, seaborn, or plotly
+    - Save plots using plt.savefig('plot_name.png')
+    - All plots will be automatically displayed in the chat
+    - For best results, use light colors and clear labels
+    - Always close plots using plt.close() to free memory"""
+
+def _python_repl_tool():
+    from langchain_experimental.utilities import PythonREPL  # Ensure this module is installed
+    from langchain_core.tools import Tool
+    python_repl = PythonREPL()
+    return Tool(
+        name="python_repl",
+        description=PYTHON_REPL_DESCRIPTION,
+        func=python_repl.run,
+        coroutine=None,
+        args_schema=None,
+        return_direct=False,
+        verbose=True,  # Enable verbose mode for better error reporting
+    )
+
+# Schemas the model sees for single-string-input tools
+_QUERY_SCHEMA = {"type": "object", "properties": {"query": {"type": "string"}}, "required": ["query"]}
+_REPL_SCHEMA = {"type": "object", "properties": {"__arg1": {"type": "string"}}, "required": ["__arg1"]}
 
 # --- Calculator Tool ---
 @tool
@@ -278,8 +293,9 @@ def get_current_datetime() -> str:
 @tool
 def email_drafter(recipient: str, subject: str, prompt: str) -> str:
     """Drafts an email based on a prompt, recipient, and subject."""
-    global selected_llm_instance
-    if not selected_llm_instance:
+    try:
+        draft_llm = model_registry.get(default_model_key)
+    except Exception:
         return "Error: Email drafter cannot function, base LLM not selected."
 
     print(color_text(f"--- Drafting Email to {recipient} about '{subject}' ---", "CYAN"))
@@ -291,7 +307,7 @@ Content Prompt/Goal: {prompt}
 Draft the email body below:"""
     try:
         # Use the base LLM instance for drafting
-        response = selected_llm_instance.invoke([HumanMessage(content=draft_prompt)])
+        response = draft_llm.invoke([HumanMessage(content=draft_prompt)])
         draft = response.content
         full_draft = f"To: {recipient}\nSubject: {subject}\n\n{draft}"
         print(color_text("Draft complete.", "GREEN"))
@@ -360,7 +376,7 @@ def list_directory(path: str = ".") -> str:
 @tool
 def list_repo_contents(repo_name: str, path: str = "") -> str:
     """Lists files/dirs in a GitHub repo path. repo_name='owner/repo'."""
-    global github_client
+    github_client = _github_client()
     if not github_client: return "Error: GitHub client not available (Check GITHUB_TOKEN)."
     print(color_text(f"--- Listing GitHub Repo: {repo_name}, Path: '{path}' ---", "CYAN"))
     try:
@@ -383,7 +399,7 @@ def list_repo_contents(repo_name: str, path: str = "") -> str:
 @tool
 def get_repo_file_content(repo_name: str, file_path: str) -> str:
     """Gets the content of a file from a GitHub repo. repo_name='owner/repo'."""
-    global github_client
+    github_client = _github_client()
     if not github_client: return "Error: GitHub client not available."
     print(color_text(f"--- Getting GitHub File: {repo_name}/{file_path} ---", "CYAN"))
     try:
@@ -407,7 +423,7 @@ def get_repo_file_content(repo_name: str, file_path: str) -> str:
 @tool
 def create_or_update_repo_file(repo_name: str, file_path: str, content: str, commit_message: str) -> str:
     """Creates or updates a file in a GitHub repo. repo_name='owner/repo'."""
-    global github_client
+    github_client = _github_client()
     if not github_client: return "Error: GitHub client not available."
     print(color_text(f"--- Creating/Updating GitHub File: {repo_name}/{file_path} ---", "CYAN"))
     try:
@@ -441,7 +457,7 @@ def create_or_update_repo_file(repo_name: str, file_path: str, content: str, com
 @tool
 def delete_repo_file(repo_name: str, file_path: str, commit_message: str) -> str:
     """Deletes a file from a GitHub repo. repo_name='owner/repo'."""
-    global github_client
+    github_client = _github_client()
     if not github_client: return "Error: GitHub client not available."
     print(color_text(f"--- Deleting GitHub File: {repo_name}/{file_path} ---", "CYAN"))
     try:
@@ -465,7 +481,7 @@ def delete_repo_file(repo_name: str, file_path: str, commit_message: str) -> str
 @tool
 def analyze_image(image_path: str, analysis_types: str = "labels,text,objects,faces") -> str:
     """Analyzes an image using AWS Rekognition. Path is relative to workspace."""
-    global rekognition_client
+    rekognition_client = _rekognition_client()
     if not rekognition_client: return "Error: AWS Rekognition client unavailable."
     print(color_text(f"--- Analyzing Image: {image_path} | Types: {analysis_types} ---", "CYAN"))
     try:
@@ -517,7 +533,7 @@ def analyze_image(image_path: str, analysis_types: str = "labels,text,objects,fa
 @tool
 def compare_faces(source_image_path: str, target_image_path: str, similarity_threshold: float = 80.0) -> str:
     """Compares faces between two images using AWS Rekognition."""
-    global rekognition_client
+    rekognition_client = _rekognition_client()
     if not rekognition_client: return "Error: AWS Rekognition client unavailable."
     print(color_text(f"--- Comparing Faces: {source_image_path} vs {target_image_path} ---", "CYAN"))
     try:
@@ -547,7 +563,7 @@ def compare_faces(source_image_path: str, target_image_path: str, similarity_thr
 @tool
 def detect_personal_protective_equipment(image_path: str) -> str:
     """Detects PPE (face, hand, head covers) in an image using AWS Rekognition."""
-    global rekognition_client
+    rekognition_client = _rekognition_client()
     if not rekognition_client: return "Error: AWS Rekognition client unavailable."
     print(color_text(f"--- Detecting PPE in Image: {image_path} ---", "CYAN"))
     try:
@@ -699,11 +715,19 @@ def confirm_user_action(action_description: str, tool_name: str, tool_args: dict
 # --- TOOL LISTS & MAPS (Defined *AFTER* all @tool functions) ---
 # ==============================================================================
 
-# Tools available for the LLM to *know about* and potentially *call* (directly or via request_confirmation)
-# CRITICAL: This list MUST contain the variable names of the defined tools.
-available_tools_list = [
-    tavily_tool,
-    brave_search_tool,
+# Tools available for the LLM to *know about* and potentially *call* (directly or via request_confirmation).
+# Registration order is the order tools are listed in the system prompt.
+tool_registry.add_lazy(
+    "tavily_search_results_json",
+    "A search engine optimized for comprehensive, accurate, and trusted results. "
+    "Useful for when you need to answer questions about current events. Input should be a search query.",
+    _QUERY_SCHEMA, _tavily_tool)
+tool_registry.add_lazy(
+    "brave_web_search",
+    "A search engine. Useful for when you need to answer questions about current events. "
+    "Input should be a search query.",
+    _QUERY_SCHEMA, _brave_search_tool)
+for _app_tool in [
     calculator,
     get_current_datetime,
     read_file,
@@ -723,148 +747,45 @@ available_tools_list = [
     delete_file_confirmed,
     send_gmail_confirmed,
     open_application_confirmed,
-]
-
-# Add the new tools to the available tools list
-available_tools_list.extend([
     create_or_update_repo_file,
     delete_repo_file,
-    index_document,
-    query_documents
-])
-
-# Add the image generation tool to the available tools list
-available_tools_list.extend([
-    generate_image_gemini
-])
-
-# Add the Wikipedia tool to the available tools list
-available_tools_list.extend([
-    wikipedia_tool
-])
-
-# Add the YouTube search tool and Python REPL tool to the available tools list
-available_tools_list.extend([
-    youtube_search_tool,
-    repl_tool
-])
-
-# Import new tools
-from tools.weather_tools import get_weather, get_location_info
-from tools.image_processing import resize_image, apply_filter, adjust_image
-from tools.pdf_tools import merge_pdfs, add_watermark, extract_pdf_pages
-from tools.network_tools import check_website, analyze_domain, test_network_speed
-from tools.monitor_tools import get_system_info, get_resource_usage, list_running_processes, monitor_network_connections
-
-# Add to available_tools_list
-available_tools_list.extend([
-    # Weather Tools
-    get_weather,
-    get_location_info,
-    
-    # Image Processing Tools
-    resize_image,
-    apply_filter,
-    adjust_image,
-    
-    # PDF Tools
-    merge_pdfs,
-    add_watermark,
-    extract_pdf_pages,
-    
-    # Network Tools
-    check_website,
-    analyze_domain,
-    test_network_speed,
-    
-    # Monitor Tools
-    get_system_info,
-    get_resource_usage,
-    list_running_processes,
-    monitor_network_connections
-])
-
-# Import conversion tools
-from tools.conversion_tools import convert_document, convert_image, convert_data_format
-
-# Add to available_tools_list
-available_tools_list.extend([
-    convert_document,
-    convert_image,
-    convert_data_format
-])
-
-# Map of tool names (strings) to the actual callable tool functions
-# Used by the ToolNode and the /confirm endpoint for execution.
-# CRITICAL: This map MUST contain the correct string names matching tool.name and the variable names.
-executable_tools_map = {
-    # Search
-    "tavily_search_results_json": tavily_tool, # Default name for Tavily
-    "brave_web_search": brave_search_tool, # Name defined in BraveSearch tool
-    # Basic
-    "calculator": calculator,
-    "get_current_datetime": get_current_datetime,
-    "email_drafter": email_drafter,
-    # Safe File I/O
-    "read_file": read_file,
-    "list_directory": list_directory,
-    # GitHub
-    "list_repo_contents": list_repo_contents,
-    "get_repo_file_content": get_repo_file_content,
-    "create_or_update_repo_file": create_or_update_repo_file,
-    "delete_repo_file": delete_repo_file,
-    # Image Analysis
-    "analyze_image": analyze_image,
-    "compare_faces": compare_faces,
-    "detect_personal_protective_equipment": detect_personal_protective_equipment,
-    # --- Confirmed Actions ---
-    "write_file_confirmed": write_file_confirmed,
-    "delete_file_confirmed": delete_file_confirmed,
-    "send_gmail_confirmed": send_gmail_confirmed,
-    "open_application_confirmed": open_application_confirmed,
-    # --- Confirmation Trigger (Not typically executed directly, but map doesn't hurt) ---
-    "request_confirmation": request_confirmation,
-    # RAG Tools
-    "index_document": index_document,
-    "query_documents": query_documents,
-    # Image Generation
-    "generate_image_gemini": generate_image_gemini,
-    # Wikipedia
-    "wikipedia": wikipedia_tool,
-    "wikipedia_query_run": wikipedia_tool,
-    # YouTube Search
-    "youtube_search_tool": youtube_search_tool,
-    # Python REPL
-    "python_repl": repl_tool,
-    # Weather Tools
-    "get_weather": get_weather,
-    "get_location_info": get_location_info,
-    # Image Processing Tools
-    "resize_image": resize_image,
-    "apply_filter": apply_filter,
-    "adjust_image": adjust_image,
-    # PDF Tools
-    "merge_pdfs": merge_pdfs,
-    "add_watermark": add_watermark,
-    "extract_pdf_pages": extract_pdf_pages,
-    # Network Tools
-    "check_website": check_website,
-    "analyze_domain": analyze_domain,
-    "test_network_speed": test_network_speed,
-    # Monitor Tools
-    "get_system_info": get_system_info,
-    "get_resource_usage": get_resource_usage,
-    "list_running_processes": list_running_processes,
-    "monitor_network_connections": monitor_network_connections,
-    # Conversion Tools
-    "convert_document": convert_document,
-    "convert_image": convert_image,
-    "convert_data_format": convert_data_format
-}
-
-
-# --- Bind Tools to LLM ---
-llm_with_tools = selected_llm_instance.bind_tools(available_tools_list)
+]:
+    tool_registry.add(_app_tool)
+
+tool_registry.add_module("tools.rag_tools", ["index_document", "index_documents", "ingestion_status",
+                                              "query_documents"])
+tool_registry.add_module("tools.image_generation_tool", ["generate_image_gemini"])
+tool_registry.add_lazy(
+    "wikipedia",
+    "A wrapper around Wikipedia. Useful for when you need to answer general questions about people, places, "
+    "companies, facts, historical events, or other subjects. Input should be a search query.",
+    _QUERY_SCHEMA, _wikipedia_tool, aliases=["wikipedia_query_run"])
+tool_registry.add_lazy(
+    "youtube_search",
+    "Search for YouTube videos associated with a person. The input to this tool should be a comma separated list, "
+    "the first part contains a person name and the second a number that is the maximum number of video results "
+    "to return aka num_results. The second part is optional.",
+    _QUERY_SCHEMA, _youtube_search_tool, aliases=["youtube_search_tool"])
+tool_registry.add_lazy("python_repl", PYTHON_REPL_DESCRIPTION, _REPL_SCHEMA, _python_repl_tool)
+tool_registry.add_module("tools.weather_tools", ["get_weather", "get_location_info"])
+tool_registry.add_module("tools.image_processing", ["resize_image", "apply_filter", "adjust_image"])
+tool_registry.add_module("tools.pdf_tools", ["merge_pdfs", "add_watermark", "extract_pdf_pages"])
+tool_registry.add_module("tools.network_tools", ["check_website", "analyze_domain", "test_network_speed"])
+tool_registry.add_module("tools.monitor_tools", ["get_system_info", "get_resource_usage",
+                                                 "list_running_processes", "monitor_network_connections"])
+tool_registry.add_module("tools.conversion_tools", ["convert_document", "convert_image", "convert_data_format"])
+
+available_tools_list = tool_registry.tools()
+
+# Map of tool names (and aliases) to tools, used by the ToolNode and the /confirm endpoint for execution
+executable_tools_map = tool_registry.executable_map()
+
+# Cache repeat calls of read-only tools (per-tool TTL/key in utils/tool_cache.TOOL_CACHE_POLICIES)
+from utils.tool_cache import tool_cache
+from utils.embedding_cache import embedding_cache
+from utils.shared_state import shared_state
+executable_tools_map = tool_cache.wrap_tools(executable_tools_map, resolve_path=_resolve_safe_path)
+
 
 
 # --- System Message ---
@@ -910,7 +831,7 @@ You have access to the following tools:
 
 - Use `generate_image_gemini` to generate images based on textual prompts. The generated images are saved in the workspace.
 - Use `wikipedia_query_run` to fetch summaries and information from Wikipedia pages based on a query.
-- Use `youtube_search_tool` to search for YouTube videos based on a query.
+- Use `youtube_search` to search for YouTube videos based on a query.
 - Use `python_repl` to execute Python commands and also for data visualization and analysis:
   * Create charts using libraries like matplotlib, seaborn, or plotly
   * Generate graphs and network visualizations
@@ -957,6 +878,7 @@ You have access to the following tools:
 8. **Communication Assistance:** Draft emails with the `email_drafter` tool.
 9. **Retrieval-Augmented Generation (RAG):**
    - Use `index_document` to index documents (PDF, DOCX, TXT, MD, CSV) from the workspace into a vector store for semantic search.
+   - Use `index_documents` to index many documents at once from a workspace glob (e.g. `reports/**/*.pdf`); large jobs continue in the background and `ingestion_status` reports their progress.
    - Use `query_documents` to answer questions based on the content of indexed documents.
 
 # PROTOCOL FOR SENSITIVE OPERATIONS
@@ -980,26 +902,92 @@ Your communication reflects your unique personality - thoughtful, empathetic, an
 
 system_message = SystemMessage(content=create_system_message_content(available_tools_list))
 
+# --- Per-turn Tool Routing ---
+# Binds only the tools relevant to the current turn (TOOL_ROUTER_TOP_K=0 binds all of them)
+from utils.tool_router import ToolRouter
+tool_router = ToolRouter(available_tools_list, create_system_message_content)
+
 
 # --- LangGraph State Definition ---
 class GraphState(TypedDict):
     messages: Annotated[List[Union[HumanMessage, AIMessage, ToolMessage, SystemMessage]], add_messages]
     requires_confirmation: Optional[Dict[str, Any]] = None
     session_id: Optional[str] = None  # Add session_id to state
+    model: Optional[str] = None  # Model registry key chosen for this request
+
+# --- Context Window Management ---
+from utils.context_manager import context_manager, INTERNAL_RUN_TAG
+from utils.response_cache import response_cache, RESPONSE_CACHE_ENABLED
+
+# Custom graph event sent when a provider fails and the next one is tried
+MODEL_RETRY_EVENT = "model_retry"
 
 # --- LangGraph Nodes ---
 async def chatbot_node(state: GraphState) -> Dict[str, Any]:
     """Invokes the LLM, handles potential confirmation requests."""
     print(color_text("--- Node: Chatbot ---", "BLUE"))
     current_messages = state['messages']
+    routed_tools = tool_router.select(current_messages)
+    routed_system_message = tool_router.system_message(routed_tools)
+    print(color_text(f"Routed {len(routed_tools)} tool(s): {', '.join(routed_tools)}", "BLUE"))
     # Ensure system message is present, ideally first
     if not current_messages or not isinstance(current_messages[0], SystemMessage):
-        messages_to_send = [system_message] + current_messages
+        messages_to_send = [routed_system_message] + current_messages
+    elif current_messages[0].content == system_message.content:
+        # Swap the full-catalogue prompt for one that lists only the routed tools
+        messages_to_send = [routed_system_message] + current_messages[1:]
     else:
         messages_to_send = current_messages # Assume client might send it or it's already there
 
     try:
-        response = await llm_with_tools.ainvoke(messages_to_send) # Use async invoke
+        # Requested model first unless its circuit is open, then the healthiest/fastest provider
+        response, last_error = None, None
+
+        async def prepare(model_key: str):
+            # Per-request model from the registry; nothing global is switched
+            llm = model_registry.get(model_key)
+            # Keep the prompt within the provider's token budget; older turns become a rolling summary
+            fitted_messages = await context_manager.fit(
+                state.get("session_id"), messages_to_send, llm, memory_instance
+            )
+            return tool_router.bind(llm, routed_tools), fitted_messages
+
+        route = model_manager.route(state.get("model"))
+        # Repeated tool-free questions are answered from the cache without a provider round-trip
+        use_cache = RESPONSE_CACHE_ENABLED and response_cache.cacheable_temperature(model_registry.get(route[0]))
+        if use_cache:
+            # Standalone questions are shared across sessions; others are keyed on the session, history and summary
+            cache_summary = await context_manager.get_summary(state.get("session_id"))
+            response = await response_cache.aget(messages_to_send, state.get("model"),
+                                                 state.get("session_id"), cache_summary)
+            if response is not None:
+                print(color_text("Response cache hit", "GREEN"))
+                return {"messages": [response], "requires_confirmation": None}
+
+        tried = set()
+        for position, model_key in enumerate(route):
+            if model_key in tried:
+                continue  # Already called as a hedge
+            try:
+                # With HEDGE_REQUESTS on, a late first token also sends the request to the next provider
+                answered_by, response = await model_manager.ainvoke_hedged(
+                    model_key, [m for m in route[position + 1:] if m not in tried], prepare, tried
+                )
+                break
+            except Exception as model_error:
+                last_error = model_error
+                print(color_text(f"Model {model_key} failed, trying next provider: {model_error}", "YELLOW"))
+                # The failed call may have streamed tokens already (e.g. a hedge winner failing mid-answer);
+                # /chat/stream drops them and streams the next provider's answer instead
+                try:
+                    await adispatch_custom_event(MODEL_RETRY_EVENT, {"model": model_key, "error": str(model_error)})
+                except Exception:
+                    pass  # No run to report to (called outside the graph)
+        if response is None:
+            raise RuntimeError(f"All models failed. Last error: {last_error}")
+        if use_cache and response_cache.cacheable_temperature(model_registry.get(answered_by)):
+            await response_cache.aput(messages_to_send, state.get("model"), response,
+                                      state.get("session_id"), cache_summary)
 
         # --- Intercept Confirmation Request ---
         if response.tool_calls:
@@ -1049,6 +1037,7 @@ async def chatbot_node(state: GraphState) -> Dict[str, Any]:
 
 # Import the visualization utils
 from tools.visualization_utils import format_tool_output
+from utils.tool_executor import tool_executor
 
 async def tool_node(state: GraphState) -> Dict[str, List[ToolMessage]]:
     """Executes tools based on the last AIMessage tool calls (excluding confirmation requests)."""
@@ -1065,29 +1054,44 @@ async def tool_node(state: GraphState) -> Dict[str, List[ToolMessage]]:
          print(color_text("No executable tool calls found.", "YELLOW"))
          return {"messages": []}
 
+    # Resolve tools first; unknown tools are reported without being scheduled
+    scheduled = []
     for tool_call in tool_calls_to_execute:
-        tool_name = tool_call["name"]
         tool_args = tool_call["args"]
+        # Remove `selected_llm_instance` if it's not required by the tool
+        if "selected_llm_instance" in tool_args:
+            del tool_args["selected_llm_instance"]
+        selected_tool = executable_tools_map.get(tool_call["name"])
+        if selected_tool:
+            scheduled.append((tool_call["name"], selected_tool, tool_args))
+
+    # Independent calls run concurrently; stateful and same-path calls keep their order.
+    # Results keep the order of `scheduled`.
+    if len(scheduled) > 1:
+        phases = tool_executor.plan(scheduled)
+        print(color_text(f"Running {len(scheduled)} tool calls in {len(phases)} phase(s).", "CYAN"))
+    raw_results = iter(await tool_executor.run_many(scheduled))
+
+    for tool_call in tool_calls_to_execute:
+        tool_name = tool_call["name"]
         tool_id = tool_call.get("id")
 
-        selected_tool = executable_tools_map.get(tool_name)
-        if not selected_tool:
-             result = f"Error: Tool '{tool_name}' not found or not executable."
-             print(color_text(result, "RED"))
+        if tool_name not in executable_tools_map:
+            result = f"Error: Tool '{tool_name}' not found or not executable."
+            print(color_text(result, "RED"))
         else:
-            try:
-                # Remove `selected_llm_instance` if it's not required by the tool
-                if "selected_llm_instance" in tool_args:
-                    del tool_args["selected_llm_instance"]
-
-                # Execute tool and format its output
-                raw_result = await asyncio.to_thread(selected_tool.invoke, tool_args)
+            raw_result = next(raw_results)
+            if isinstance(raw_result, asyncio.TimeoutError):
+                result = f"Error executing tool '{tool_name}': timed out after {tool_executor.timeout:g}s"
+                print(color_text(result, "RED"))
+            elif isinstance(raw_result, BaseException):
+                result = f"Error executing tool '{tool_name}': {raw_result}"
+                print(color_text(result, "RED"))
+                traceback.print_exception(type(raw_result), raw_result, raw_result.__traceback__)
+            else:
+                # Format the tool's output
                 result = format_tool_output(tool_name, raw_result)
                 print(color_text(f"Tool '{tool_name}' executed.", "GREEN"))
-            except Exception as e:
-                result = f"Error executing tool '{tool_name}': {e}"
-                print(color_text(result, "RED"))
-                traceback.print_exc()
 
         tool_messages.append(ToolMessage(content=str(result), tool_call_id=tool_id))
 
@@ -1135,7 +1139,39 @@ graph = graph_builder.compile()
 # --- FastAPI App Setup & Endpoints ---
 # ==============================================================================
 
-app = FastAPI(title="Raiden Agent Backend", version="1.0.1") # Incremented version
+def _init_polly_client():
+    if not (aws_access_key_found and aws_secret_key_found):
+        return False
+    from tools.speech_tools import init_polly_client
+    return init_polly_client()
+
+def _init_rag_components():
+    from tools import rag_tools
+    rag_tools.initialize_rag_components()
+    if rag_tools.vector_store is None or rag_tools.embedding_function is None:
+        raise RuntimeError("RAG components unavailable (see log)")
+
+# Components warmed concurrently after the port is bound; state is reported on /ping
+warmup.register("llm", lambda: model_registry.get(default_model_key))
+warmup.register("github", _init_github_client)
+warmup.register("rekognition", _init_rekognition_client)
+warmup.register("polly", _init_polly_client)
+warmup.register("rag", _init_rag_components)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    warmup.start()  # Returns immediately; requests are served while components warm up
+    yield
+    await warmup.stop()
+    await loop_monitor.stop()
+    shutdown_io_pool()
+    shutdown_loader_pool()
+
+# orjson renders ApiResponse bodies (falls back to json when orjson is missing)
+app = FastAPI(title="Raiden Agent Backend", version="1.0.1", lifespan=lifespan,
+              default_response_class=FastJSONResponse) # Incremented version
 
 # CORS Middleware (Allow frontend access)
 app.add_middleware(
@@ -1148,6 +1184,10 @@ app.add_middleware(
 
 from utils.session import SessionManager
 from middleware.security import SecurityHeadersMiddleware
+from middleware.compression import CompressionMiddleware
+from middleware.upload_limit import UploadLimitMiddleware
+from utils.admission import admission, rate_limiter, check_rate_limits, RateLimitExceeded
+from error_handlers import rate_limit_handler
 
 # Initialize SessionManager
 session_manager = SessionManager(
@@ -1157,6 +1197,15 @@ session_manager = SessionManager(
 # Add SecurityHeadersMiddleware
 app.add_middleware(SecurityHeadersMiddleware)
 
+# Brotli/gzip for JSON and text bodies over COMPRESSION_MIN_SIZE (SSE and media are left alone)
+app.add_middleware(CompressionMiddleware)
+
+# Oversized /upload bodies get 413 while arriving, before FastAPI spools them to disk
+app.add_middleware(UploadLimitMiddleware)
+
+# Refused requests (token buckets, in-flight cap) become 429 with Retry-After
+app.add_exception_handler(RateLimitExceeded, rate_limit_handler)
+
 # --- Pydantic Models for API Payloads ---
 class ClientMessage(BaseModel):
     role: str
@@ -1169,6 +1218,9 @@ class ClientMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ClientMessage]
     model: Optional[str] = None  # Add model field to the request
+    session_id: Optional[str] = None
+    # When True, `messages` holds only the new turn; prior state is rebuilt server-side
+    delta: bool = False
 
 class ConfirmationDetails(BaseModel):
     prompt: str
@@ -1180,11 +1232,17 @@ class ApiResponse(BaseModel):
     messages: List[Dict[str, Any]] = []
     requires_confirmation: Optional[ConfirmationDetails] = None
     error: Optional[str] = None
+    session_id: Optional[str] = None
 
 class ConfirmRequest(BaseModel):
     confirmed: bool
     action_details: ConfirmationDetails
 
+class IngestRequest(BaseModel):
+    # Workspace-relative paths and/or a workspace glob such as "reports/**/*.pdf"
+    paths: List[str] = []
+    pattern: Optional[str] = None
+
 # --- Helper: Convert Client Messages to Langchain ---
 def convert_client_to_langchain(client_messages: List[ClientMessage]) -> List[BaseMessage]:
     lc_messages = []
@@ -1215,8 +1273,9 @@ def convert_client_to_langchain(client_messages: List[ClientMessage]) -> List[Ba
 # --- API Endpoints ---
 @app.get("/ping")
 async def ping():
-    """Simple health check endpoint."""
-    return {"status": "ok", "llm": llm_name}
+    """Liveness plus per-component readiness; answers while background warm-up is still running."""
+    return {"status": "ok", "llm": llm_name, "models": model_registry.available(),
+            "ready": warmup.ready, "components": warmup.status()}
 
 from utils.server_monitor import ServerMonitor
 from utils.model_fallback import ModelFallbackManager
@@ -1225,144 +1284,55 @@ from utils.model_fallback import ModelFallbackManager
 model_manager = ModelFallbackManager()
 model_manager.initialize_models()
 
-# Update chat endpoint to use model fallback
+@app.get("/models/health")
+async def models_health():
+    """Per-provider circuit state, error rate and p50/p95 latency, plus the current routing order."""
+    return {"default": default_model_key, "routing_order": model_manager.route(),
+            "providers": model_manager.stats(), "response_cache": response_cache.stats(),
+            "tool_cache": tool_cache.stats(), "embedding_cache": embedding_cache.stats(),
+            "shared_state": shared_state.status(), "worker_pid": os.getpid(),
+            "admission": admission.stats(), "rate_limits": rate_limiter.stats(), "event_loop": loop_monitor.stats()}
+
 @app.post("/chat", response_model=ApiResponse)
 async def chat_endpoint(request: Request, chat_request: ChatRequest):
-    """Handles user messages with fallback and recovery"""
-    try:
+    """Handles user messages; provider fallback happens per model call inside the chatbot node"""
+    if not chat_request.session_id:
+        chat_request.session_id = request.cookies.get("session_id") or str(uuid.uuid4())
+    await check_rate_limits(request.headers, request.client.host if request.client else None, chat_request.session_id)
+    async with admission.slot(chat_request.session_id):
+        # handle_chat answers failures itself (500 with the error); retrying the whole graph here would rerun tools
         return await handle_chat(chat_request)
-    except Exception as e:
-        logging.error(f"Chat endpoint error: {e}")
-        try:
-            # Try with model fallback
-            return await model_manager.execute_with_fallback(handle_chat, chat_request)
-        except RuntimeError as re:
-            return JSONResponse(
-                status_code=500,
-                content={"error": f"All models failed: {str(re)}"}
-            )
 
 # Add import for our enhanced memory system
 from memory.sqlite_memory import memory_instance
+from memory.conversation_window import conversation_window
 
 # --- Update the chat endpoint ---
-async def handle_chat(chat_request: ChatRequest):
-    """Handles user messages with advanced memory persistence"""
-    global selected_llm_instance, llm_name, llm_with_tools
-    
-    print(color_text(f"Received /chat request with {len(chat_request.messages)} message(s)", "GREEN"))
+async def handle_chat(chat_request: ChatRequest, model: Optional[str] = None):
+    """Handles user messages with advanced memory persistence. `model` overrides chat_request.model."""
+    mode = "delta" if chat_request.delta else "full"
+    print(color_text(f"Received /chat request with {len(chat_request.messages)} message(s) ({mode} mode)", "GREEN"))
 
     try:
-        # Model switching code remains the same
-        if chat_request.model and chat_request.model != llm_name.lower().replace(" ", "-"):
-            if chat_request.model == "groq-llama" and groq_api_key_found:
-                selected_llm_instance = ChatGroq(temperature=0.7, model_name="deepseek-r1-distill-llama-70b", max_tokens=8192)
-                llm_name = "Groq Llama 3"
-            elif chat_request.model == "google-gemini" and google_api_key_found:
-                selected_llm_instance = ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7, max_tokens=4096)
-                llm_name = "Google Gemini Flash"
-            elif chat_request.model == "together-llama" and together_api_key_found:
-                selected_llm_instance = ChatTogether(model="meta-llama/Llama-3-70b-chat-hf", temperature=0.7, max_tokens=4096)
-                llm_name = "Together Llama 3"
-            elif chat_request.model == "deepseek-chat" and deepseek_api_key_found:
-                selected_llm_instance = ChatDeepSeek(model="deepseek-chat", temperature=0.7, max_tokens=4096)
-                llm_name = "DeepSeek Chat"
-            else:
-                return JSONResponse(
-                    status_code=400, 
-                    content={"error": f"Model '{chat_request.model}' is not supported or API key is missing."}
-                )
-            
-            # Rebind tools to new LLM instance
-            llm_with_tools = selected_llm_instance.bind_tools(available_tools_list)
-            print(color_text(f"Switched to model: {llm_name}", "GREEN"))
-            
-        # Filter and convert messages
-        chat_request.messages = [
-            msg for msg in chat_request.messages 
-            if msg.content or (msg.role == 'assistant' and msg.tool_calls)
-        ]
-        
-        # Initialize or get existing session_id from request
-        session_id = request.cookies.get("session_id")
-        if not session_id:
-            session_id = str(uuid.uuid4())
-            
-        # Get existing conversation context
-        context = memory_instance.load_context(session_id)
-        if context:
-            print(color_text(f"Loaded existing context for session {session_id}", "CYAN"))
-            
-        # Convert and filter messages
-        langchain_messages = convert_client_to_langchain(chat_request.messages)
-        if not langchain_messages or not isinstance(langchain_messages[0], SystemMessage):
-            langchain_messages.insert(0, system_message)
-
-        # Initialize graph state with session context
-        initial_state: GraphState = {
-            "messages": langchain_messages,
-            "requires_confirmation": None,
-            "session_id": session_id
-        }
+        model_key, model_error = _resolve_model(model or chat_request.model)
+        if model_error:
+            return JSONResponse(status_code=400, content={"error": model_error})
+
+        session_id, incoming_messages, initial_state = await _prepare_chat_state(chat_request, model_key)
 
         try:
             # Execute graph
             final_state = await graph.ainvoke(initial_state)
             print(color_text(f"Graph finished. Final state keys: {final_state.keys()}", "GREEN"))
 
-            # Process messages from final state
-            response_messages = []
             new_lc_messages = final_state.get('messages', [])
-            start_index = len(initial_state['messages'])
-            added_messages = new_lc_messages[start_index:]
-
-            # Save new messages to memory
-            memory_instance.save_conversation(session_id, added_messages)
-            
-            # Extract and save entities (simplified example)
-            topics = []
-            for msg in added_messages:
-                if isinstance(msg, HumanMessage):
-                    # Simple topic extraction - you might want to use a more sophisticated method
-                    words = msg.content.lower().split()
-                    potential_topics = [w for w in words if len(w) > 4]  # Simple example
-                    topics.extend(potential_topics[:3])  # Take first 3 longer words as topics
-                    
-            # Update context with new topics
-            memory_instance.save_context(
-                session_id=session_id,
-                context={"last_interaction": datetime.now().isoformat()},
-                topics=list(set(topics))  # Deduplicate topics
-            )
-
-            # Convert messages for API response
-            for msg in added_messages:
-                msg_dict = {"role": "assistant" if isinstance(msg, AIMessage) else "tool",
-                           "content": msg.content}
-                
-                if isinstance(msg, AIMessage) and hasattr(msg, 'tool_calls') and msg.tool_calls:
-                    msg_dict["tool_calls"] = msg.tool_calls
-                elif isinstance(msg, ToolMessage) and hasattr(msg, 'tool_call_id'):
-                    msg_dict["tool_call_id"] = msg.tool_call_id
-                    if hasattr(msg, 'name'):
-                        msg_dict["name"] = msg.name
-                
-                response_messages.append(msg_dict)
-
-            # Generate and save conversation summary if enough messages
-            if len(new_lc_messages) > 5:  # Only summarize longer conversations
-                # This is a simplified summary - you might want to use the LLM for better summarization
-                summary = f"Conversation with {len(new_lc_messages)} messages"
-                key_points = list(set(topics))[:5]  # Use top 5 topics as key points
-                memory_instance.save_conversation_summary(
-                    session_id=session_id,
-                    summary=summary,
-                    key_points=key_points
-                )
+            added_messages = new_lc_messages[len(initial_state['messages']):]
+            await _persist_chat_turn(chat_request, session_id, incoming_messages, added_messages)
 
             return ApiResponse(
-                messages=response_messages,
-                requires_confirmation=final_state.get("requires_confirmation")
+                messages=_to_client_messages(added_messages),
+                requires_confirmation=final_state.get("requires_confirmation"),
+                session_id=session_id
             )
 
         except Exception as graph_err:
@@ -1378,47 +1348,303 @@ async def handle_chat(chat_request: ChatRequest):
             content={"error": f"An internal error occurred: {error_msg}"}
         )
 
+def _resolve_model(requested_model: Optional[str]):
+    """Maps a requested model to a registry key. Returns (model_key, error message).
+
+    No requested model gives (None, None): the chatbot node then routes to the healthiest provider.
+    """
+    if not requested_model:
+        return None, None
+    model_key = requested_model
+    if not model_registry.is_available(model_key):
+        return None, f"Model '{requested_model}' is not supported or API key is missing."
+    return model_key, None
+
+def _system_notes_as_human(messages: List[BaseMessage], keep_first: bool = False) -> List[BaseMessage]:
+    """Turns client system messages (upload notices etc.) into user-role notes.
+
+    Mid-history system messages are rejected by some providers and would give
+    client-supplied text the authority of the agent prompt. With `keep_first`,
+    a leading system message (a full-mode client prompt) is left as is.
+    """
+    converted = []
+    for index, msg in enumerate(messages):
+        if isinstance(msg, SystemMessage) and not (keep_first and index == 0):
+            msg = HumanMessage(content=f"[Note from the app] {msg.content}")
+        converted.append(msg)
+    return converted
+
+async def _prepare_chat_state(chat_request: ChatRequest, model_key: Optional[str] = None):
+    """Builds the initial graph state for a chat request. Returns (session_id, incoming_messages, initial_state)."""
+    # Filter and convert messages
+    chat_request.messages = [
+        msg for msg in chat_request.messages 
+        if msg.content or (msg.role == 'assistant' and msg.tool_calls)
+    ]
+    
+    # Session id is resolved by the endpoint (body, then cookie, then new)
+    session_id = chat_request.session_id or str(uuid.uuid4())
+        
+    # Get existing conversation context
+    context = await memory_instance.aload_context(session_id)
+    if context:
+        print(color_text(f"Loaded existing context for session {session_id}", "CYAN"))
+        
+    # Convert and filter messages
+    # Client system notes travel as user-role notes, so only the agent prompt is a system message
+    incoming_messages = _system_notes_as_human(convert_client_to_langchain(chat_request.messages),
+                                               keep_first=not chat_request.delta)
+    if chat_request.delta:
+        # Client sent only the new turn; prepend the cached window of prior messages.
+        # Client-side system notes (uploads etc.) must not displace the agent prompt.
+        prior_messages = await conversation_window.aget(session_id)
+        print(color_text(f"Rebuilt {len(prior_messages)} prior message(s) for session {session_id}", "CYAN"))
+        # Windows stored before notes were converted may still hold system messages
+        langchain_messages = [system_message] + _system_notes_as_human(prior_messages) + incoming_messages
+    else:
+        langchain_messages = list(incoming_messages)
+    if not langchain_messages or not isinstance(langchain_messages[0], SystemMessage):
+        langchain_messages.insert(0, system_message)
+
+    # Initialize graph state with session context
+    initial_state: GraphState = {
+        "messages": langchain_messages,
+        "requires_confirmation": None,
+        "session_id": session_id,
+        "model": model_key
+    }
+    return session_id, incoming_messages, initial_state
+
+async def _persist_chat_turn(chat_request: ChatRequest, session_id: str, incoming_messages: List[BaseMessage],
+                       added_messages: List[BaseMessage]) -> None:
+    """Saves a finished turn to memory, along with topics and the session summary, in one transaction."""
+    # Save new messages to memory; in delta mode the client turn is new as well
+    turn_messages = (incoming_messages + added_messages) if chat_request.delta else added_messages
+    if chat_request.delta:
+        await conversation_window.aappend(session_id, turn_messages)
+    
+    # Extract and save entities (simplified example)
+    topics = []
+    for msg in turn_messages:
+        if isinstance(msg, HumanMessage):
+            # Simple topic extraction - you might want to use a more sophisticated method
+            words = msg.content.lower().split()
+            potential_topics = [w for w in words if len(w) > 4]  # Simple example
+            topics.extend(potential_topics[:3])  # Take first 3 longer words as topics
+    topics = list(set(topics))  # Deduplicate topics
+
+    # Rolling summary of turns folded out of the context window (None until the budget is exceeded)
+    summary = await context_manager.get_summary(session_id)
+
+    await memory_instance.asave_turn(
+        session_id=session_id,
+        messages=turn_messages,
+        context={"last_interaction": datetime.now().isoformat()},
+        topics=topics,
+        summary=summary,
+        key_points=topics[:5]  # Use top 5 topics as key points
+    )
+
+def _to_client_messages(added_messages: List[BaseMessage]) -> List[Dict[str, Any]]:
+    """Converts messages for API response"""
+    response_messages = []
+    for msg in added_messages:
+        msg_dict = {"role": "assistant" if isinstance(msg, AIMessage) else "tool",
+                   "content": msg.content}
+        
+        if isinstance(msg, AIMessage) and hasattr(msg, 'tool_calls') and msg.tool_calls:
+            msg_dict["tool_calls"] = msg.tool_calls
+        elif isinstance(msg, ToolMessage) and hasattr(msg, 'tool_call_id'):
+            msg_dict["tool_call_id"] = msg.tool_call_id
+            if hasattr(msg, 'name'):
+                msg_dict["name"] = msg.name
+        
+        response_messages.append(msg_dict)
+    return response_messages
+
+# --- Streaming Chat (Server-Sent Events) ---
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Formats one Server-Sent Events frame."""
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+def _chunk_text(content: Any) -> str:
+    """Extracts text from a model chunk (plain string or provider content blocks)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for part in content if isinstance(part, (str, dict))
+        )
+    return ""
+
+async def stream_chat_events(chat_request: ChatRequest, model_key: str):
+    """Runs the graph with astream_events and yields SSE frames as tokens and tool events arrive."""
+    try:
+        session_id, incoming_messages, initial_state = await _prepare_chat_state(chat_request, model_key)
+        yield _sse_event("session", {"session_id": session_id})
+
+        added_messages: List[BaseMessage] = []
+        requires_confirmation = None
+        token_run_id = None  # Model run whose tokens are forwarded in the current chatbot step
+        async for event in graph.astream_events(initial_state, version="v2"):
+            kind = event["event"]
+            node = event.get("metadata", {}).get("langgraph_node")
+
+            if kind == "on_chain_start" and event["name"] == "chatbot" and node == "chatbot":
+                token_run_id = None
+
+            # Tokens from the agent model only (not from tools that call an LLM internally)
+            elif kind == "on_chat_model_stream" and node == "chatbot" and INTERNAL_RUN_TAG not in event.get("tags", []):
+                # A hedged or retried call runs several models; the first to stream is the one kept
+                token_run_id = token_run_id or event["run_id"]
+                if event["run_id"] != token_run_id:
+                    continue
+                text = _chunk_text(event["data"]["chunk"].content)
+                if text:
+                    yield _sse_event("token", {"content": text})
+
+            # A provider failed, possibly after streaming part of its answer: forward the next one's tokens
+            elif kind == "on_custom_event" and event["name"] == MODEL_RETRY_EVENT and node == "chatbot":
+                if token_run_id is not None:
+                    token_run_id = None
+                    yield _sse_event("retry", {"model": event["data"].get("model")})
+
+            # Node outputs carry the new messages exactly once per node run
+            elif kind == "on_chain_end" and event["name"] in ("chatbot", "tools") and node == event["name"]:
+                output = event["data"].get("output") or {}
+                node_messages = output.get("messages", []) if isinstance(output, dict) else []
+                added_messages.extend(node_messages)
+
+                if event["name"] == "chatbot":
+                    for msg in node_messages:
+                        for tc in getattr(msg, "tool_calls", None) or []:
+                            yield _sse_event("tool_start", {"id": tc.get("id"), "name": tc["name"], "args": tc["args"]})
+                    if output.get("requires_confirmation"):
+                        requires_confirmation = output["requires_confirmation"]
+                        yield _sse_event("confirmation", requires_confirmation)
+                else:
+                    for msg in node_messages:
+                        yield _sse_event("tool_end", {"tool_call_id": msg.tool_call_id, "content": msg.content})
+
+        await _persist_chat_turn(chat_request, session_id, incoming_messages, added_messages)
+
+        final_response = ApiResponse(
+            messages=_to_client_messages(added_messages),
+            requires_confirmation=requires_confirmation,
+            session_id=session_id
+        )
+        yield _sse_event("done", final_response)
+    except Exception as e:
+        print(color_text(f"Error during /chat/stream processing: {e}", "RED"))
+        traceback.print_exc()
+        yield _sse_event("error", {"error": f"An internal error occurred: {e}"})
+
+@app.post("/chat/stream")
+async def chat_stream_endpoint(request: Request, chat_request: ChatRequest):
+    """Streams LLM tokens, tool start/end events and confirmation requests as Server-Sent Events."""
+    if not chat_request.session_id:
+        chat_request.session_id = request.cookies.get("session_id") or str(uuid.uuid4())
+    print(color_text(f"Received /chat/stream request with {len(chat_request.messages)} message(s)", "GREEN"))
+
+    model_key, model_error = _resolve_model(chat_request.model)
+    if model_error:
+        return JSONResponse(status_code=400, content={"error": model_error})
+
+    await check_rate_limits(request.headers, request.client.host if request.client else None, chat_request.session_id)
+    # Taken before the response starts so an overloaded server refuses with 429, not a broken stream
+    await admission.acquire(chat_request.session_id)
+
+    started = time.monotonic()
+    released = False
+
+    async def release_slot():
+        nonlocal released
+        if not released:
+            released = True
+            admission.release(chat_request.session_id, time.monotonic() - started)
+
+    async def admitted_events():
+        try:
+            async for event in stream_chat_events(chat_request, model_key):
+                yield event
+        finally:
+            await release_slot()
+
+    # The background task also frees the slot if the client disconnects before the stream starts
+    return StreamingResponse(
+        admitted_events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(release_slot)
+    )
+
+upload_store = ContentStore(WORKSPACE_DIR)
+
 @app.post("/upload", response_model=ApiResponse)
-async def upload_image(file: UploadFile = File(...)):
-    """Handles image uploads to the server's workspace."""
-    if not file.content_type or not file.content_type.startswith("image/"):
-         raise HTTPException(status_code=400, detail="Invalid file type. Only images are allowed.")
-    file_extension = Path(file.filename).suffix if file.filename else ".png" # Default extension
-    safe_filename = f"upload_{uuid.uuid4().hex}{file_extension}" # Use hex for cleaner name
-    save_path = WORKSPACE_DIR / safe_filename
+async def upload_file(file: UploadFile = File(...)):
+    """Handles image and document uploads into the workspace's content-addressed store."""
+    try:
+        kind = upload_store.kind(file.filename, file.content_type)
+    except UnsupportedUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    file_extension = Path(file.filename or "").suffix or mimetypes.guess_extension(file.content_type or "") or ".png"
 
     try:
-        content = await file.read()
-        with open(save_path, "wb") as buffer:
-             buffer.write(content)
-        print(color_text(f"Image uploaded successfully: {safe_filename}", "GREEN"))
-        relative_path = safe_filename
-        # Inform the user via a system message structure in the response
-        return ApiResponse(messages=[
-            {"role": "system", "content": f"File '{file.filename or 'image'}' uploaded as '{relative_path}'. You can now reference it using this path for analysis."}
-        ])
+        stored = await upload_store.save(file, file_extension)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
     except Exception as e:
         print(color_text(f"Error during file upload: {e}", "RED"))
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Could not save uploaded file: {e}")
 
-@app.get("/workspace/{filename}")
-async def get_workspace_file(filename: str):
-    """Serves files from the workspace directory (needed for plot images)."""
+    relative_path = stored["path"]
+    note = " (identical file already stored)" if stored["deduplicated"] else ""
+    print(color_text(f"Upload stored: {relative_path}, {stored['size']} bytes{note}", "GREEN"))
+    if kind == "document":
+        hint = "You can index it with index_document and then search it with query_documents."
+    else:
+        hint = "You can now reference it using this path for analysis."
+    # Inform the user via a system message structure in the response
+    return ApiResponse(messages=[
+        {"role": "system", "content": f"File '{file.filename or kind}' uploaded as '{relative_path}'. {hint}"}
+    ])
+
+@app.api_route("/workspace/{filename:path}", methods=["GET", "HEAD"])
+async def get_workspace_file(request: Request, filename: str):
+    """Serves workspace files (plots, generated media, uploads) with ETag/304, byte ranges and caching headers."""
     try:
         safe_path = _resolve_safe_path(filename)
-        if not safe_path.is_file():
-            raise HTTPException(status_code=404, detail="File not found")
-        
-        # Determine content type
-        content_type = "image/png"  # Default for plots
-        if filename.endswith('.jpg') or filename.endswith('.jpeg'):
-            content_type = "image/jpeg"
-        
-        return FileResponse(safe_path, media_type=content_type)
+        return await file_response(safe_path, filename, request.headers, request.method)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/rag/ingest", status_code=202)
+async def start_ingest(request: IngestRequest):
+    """Starts a background job indexing many workspace documents; poll GET /rag/ingest/{job_id} for progress."""
+    from tools import rag_tools  # Imported lazily: rag_tools imports from app
+    if not request.paths and not request.pattern:
+        raise HTTPException(status_code=400, detail="Provide 'paths' or 'pattern'")
+    files = await run_blocking(resolve_files, WORKSPACE_DIR, pattern=request.pattern, paths=request.paths)
+    if not files:
+        raise HTTPException(status_code=400, detail="No supported documents (PDF, DOCX, TXT, MD, CSV) matched")
+    try:
+        progress, _ = await rag_tools.start_ingestion(files)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return progress.snapshot()
+
+@app.get("/rag/ingest/{job_id}")
+async def get_ingest(job_id: str):
+    """Progress and throughput (chunks/s, tokens/s) of an ingestion job, from any worker."""
+    status = await get_job(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return status
+
 @app.post("/confirm", response_model=ApiResponse)
 async def confirm_endpoint(request: ConfirmRequest):
     """Handles user confirmations for sensitive actions."""
@@ -1435,8 +1661,9 @@ async def confirm_endpoint(request: ConfirmRequest):
         if not tool:
             raise ValueError(f"Tool '{request.action_details.tool_name}' not found")
             
-        # Execute the confirmed action
-        result = await asyncio.to_thread(tool.invoke, request.action_details.tool_args)
+        # Execute the confirmed action (async tools are awaited natively); approved actions are not timed out
+        result = await tool_executor.run(request.action_details.tool_name, tool, request.action_details.tool_args,
+                                         timed=False)
         
         return ApiResponse(messages=[
             {"role": "system", "content": f"Action completed: {request.action_details.prompt}"},
@@ -1455,18 +1682,25 @@ async def confirm_endpoint(request: ConfirmRequest):
 async def clear_memory_endpoint(request: Request):
     """Clears chat history from SQLite database"""
     try:
-        session_id = request.cookies.get("session_id")
+        session_id = request.cookies.get("session_id") or request.query_params.get("session_id")
         if not session_id:
             return JSONResponse(
                 status_code=400,
                 content={"error": "No session ID found"}
             )
             
-        message_history = SQLChatMessageHistory(
-            session_id=session_id,
-            connection_string=f"sqlite:///{db_path}"
-        )
-        message_history.clear()
+        def clear_message_history():
+            from langchain_community.chat_message_histories import SQLChatMessageHistory  # Only needed here
+            message_history = SQLChatMessageHistory(
+                session_id=session_id,
+                connection_string=f"sqlite:///{db_path}"
+            )
+            message_history.clear()
+
+        # Creating the engine and clearing both touch SQLite synchronously
+        await run_blocking(clear_message_history)
+        await memory_instance.aclear_session(session_id)
+        await conversation_window.ainvalidate(session_id)
         
         return JSONResponse(content={"status": "success"})
     except Exception as e:
@@ -1475,13 +1709,36 @@ async def clear_memory_endpoint(request: Request):
             content={"error": f"Failed to clear memory: {str(e)}"}
         )
 
+# --- Server Settings ---
+# "production" runs several workers without auto-reload or tracemalloc; also enabled by --production
+RAIDEN_ENV = os.environ.get("RAIDEN_ENV", "development").lower()
+SERVER_HOST = os.environ.get("HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("PORT", "5000"))
+
+
+def _production_workers() -> int:
+    """WEB_CONCURRENCY if set, else one worker per CPU (at least 2)"""
+    configured = os.environ.get("WEB_CONCURRENCY")
+    if configured:
+        return max(1, int(configured))
+    return max(2, os.cpu_count() or 1)
+
+
 # --- Run the Server ---
 if __name__ == "__main__":
-    print(color_text("Starting FastAPI server...", "GREEN"))
+    import sys
+    production = RAIDEN_ENV == "production" or "--production" in sys.argv[1:]
+    workers = _production_workers() if production else 1
+    # Workers are separate processes: they read this to check that shared state is configured
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    print(color_text(f"Starting FastAPI server ({'production, %d workers' % workers if production else 'development'})...", "GREEN"))
+    if production and not os.environ.get("SHARED_STATE_URL") and not os.environ.get("REDIS_URL"):
+        print(color_text("Warning: SHARED_STATE_URL not set; session windows bypass the cache and caches are per worker", "YELLOW"))
     
-    # Enable memory tracking
+    # Enable memory tracking (development only: it slows every allocation)
     import tracemalloc
-    tracemalloc.start()
+    if not production:
+        tracemalloc.start()
     
     try:
         # Initialize monitor in a separate process using static method
@@ -1494,18 +1751,19 @@ if __name__ == "__main__":
         
         # Run FastAPI with uvicorn
         uvicorn.run(
-            "app:app",  # Use string notation for reload support
-            host="0.0.0.0",
-            port=5000,
-            reload=True,
+            "app:app",  # Use string notation for reload and worker support
+            host=SERVER_HOST,
+            port=SERVER_PORT,
+            reload=not production,
             log_level="info",
-            workers=1
+            workers=workers
         )
     except KeyboardInterrupt:
         print(color_text("\nShutting down gracefully...", "YELLOW"))
     finally:
         # Cleanup
-        tracemalloc.stop()
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
         if 'monitor_process' in locals():
             try:
                 monitor_process.terminate()
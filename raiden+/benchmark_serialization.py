@@ -0,0 +1,101 @@
+"""Serialization and compression benchmark for /chat response bodies.
+
+Builds ApiResponse-shaped payloads of increasing size from the kinds of tool
+output /chat returns (analyze_image JSON, format_tool_output markdown tables,
+read_file text) and reports, per size, the time to render them with the
+standard json encoder and with orjson, and the time and ratio of gzip and
+brotli compression.
+
+    python benchmark_serialization.py
+    python benchmark_serialization.py --sizes 1 16 256 --runs 200
+"""
+import sys
+import json
+import time
+import zlib
+import argparse
+import statistics
+
+from utils.json_response import dumps, orjson
+from middleware.compression import GZIP_LEVEL, BROTLI_QUALITY, brotli
+
+
+def _image_analysis(i: int) -> str:
+    labels = [{"Name": f"Label{j}", "Confidence": 99.0 - j * 0.7, "Instances": [], "Parents": [{"Name": "Thing"}]}
+              for j in range(10)]
+    return json.dumps({"image": f"uploads/{i:024x}.png", "labels": labels, "text": ["EXIT", "Floor 2"]}, indent=2)
+
+
+def _markdown_table(i: int) -> str:
+    rows = "\n".join(f"| {i}-{r} | host{r}.example.com | {r * 13 % 97} ms | {'up' if r % 5 else 'down'} |"
+                     for r in range(20))
+    return "| # | Host | Latency | Status |\n|---|---|---|---|\n" + rows
+
+
+def _file_text(i: int) -> str:
+    line = f"{i}: The quick brown fox jumps over the lazy dog; résumé naïve café. "
+    return (line * 80)[:5000]
+
+
+def build_payload(target_bytes: int) -> dict:
+    """ApiResponse-shaped dict of roughly `target_bytes` once rendered"""
+    makers = (_image_analysis, _markdown_table, _file_text)
+    messages = [{"role": "user", "content": "Check these files and summarize"}]
+    i = 0
+    size = 0
+    while size < target_bytes:
+        content = makers[i % len(makers)](i)
+        messages.append({"role": "tool", "content": content, "tool_call_id": f"call_{i}", "name": makers[i % 3].__name__})
+        size += len(content.encode("utf-8")) + 64
+        i += 1
+    messages.append({"role": "assistant", "content": "Here is the summary.", "tool_calls": None})
+    return {"messages": messages, "requires_confirmation": None, "error": None, "session_id": "bench"}
+
+
+def stdlib_render(content: dict) -> bytes:
+    # What starlette's JSONResponse does
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def time_call(func, arg, runs: int) -> float:
+    """Median seconds per call"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func(arg)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure /chat response serialization and compression cost")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16, 64, 256, 1024], help="Payload sizes in KB")
+    parser.add_argument("--runs", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"orjson: {'yes' if orjson is not None else 'not installed'}, "
+          f"brotli: {'yes' if brotli is not None else 'not installed'}")
+    header = f"{'size':>8} {'json ms':>9} {'orjson ms':>10} {'speedup':>8} {'gzip ms':>9} {'gzip %':>7}"
+    if brotli is not None:
+        header += f" {'br ms':>8} {'br %':>6}"
+    print(header)
+
+    for kb in args.sizes:
+        payload = build_payload(kb * 1024)
+        body = stdlib_render(payload)
+        json_seconds = time_call(stdlib_render, payload, args.runs)
+        fast_seconds = time_call(dumps, payload, args.runs)
+        gzip_seconds = time_call(lambda b: zlib.compress(b, GZIP_LEVEL), body, args.runs)
+        gzip_ratio = len(zlib.compress(body, GZIP_LEVEL)) / len(body)
+        row = (f"{len(body) / 1024:7.0f}K {json_seconds * 1000:9.3f} {fast_seconds * 1000:10.3f} "
+               f"{json_seconds / fast_seconds:7.1f}x {gzip_seconds * 1000:9.3f} {gzip_ratio * 100:6.1f}%")
+        if brotli is not None:
+            br_seconds = time_call(lambda b: brotli.compress(b, quality=BROTLI_QUALITY), body, args.runs)
+            br_ratio = len(brotli.compress(body, quality=BROTLI_QUALITY)) / len(body)
+            row += f" {br_seconds * 1000:8.3f} {br_ratio * 100:5.1f}%"
+        print(row)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
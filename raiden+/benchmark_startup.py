@@ -0,0 +1,112 @@
+"""Startup-time benchmark for the Raiden backend.
+
+Measures, in fresh interpreters, how long `import app` takes and (with
+--serve) how long until GET /ping answers. Exits with status 1 when the
+median exceeds --max-seconds so CI can catch cold-start regressions.
+
+    python benchmark_startup.py                 # import time, 5 runs
+    python benchmark_startup.py --serve         # also time-to-/ping via uvicorn
+    python benchmark_startup.py --profile       # slowest imports (python -X importtime)
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+import urllib.request
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent
+
+IMPORT_SNIPPET = (
+    "import time; started = time.perf_counter(); import app; "
+    "print('IMPORT_SECONDS', time.perf_counter() - started)"
+)
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    # Clients are built lazily, so a placeholder key only satisfies the startup check
+    if not any(env.get(k) for k in ("GROQ_API_KEY", "GOOGLE_API_KEY", "TOGETHER_API_KEY", "DEEPSEEK_API_KEY")):
+        env["GROQ_API_KEY"] = "benchmark-placeholder"
+    return env
+
+
+def time_import() -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], cwd=APP_DIR, env=_env(),
+                            capture_output=True, text=True)
+    for line in result.stdout.splitlines():
+        if line.startswith("IMPORT_SECONDS"):
+            return float(line.split()[1])
+    raise RuntimeError(f"import app failed:\n{result.stderr[-2000:]}")
+
+
+def time_to_ping(port: int, timeout: float = 60.0) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=APP_DIR, env=_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError("uvicorn exited before /ping answered")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ping", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError(f"/ping did not answer within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def print_import_profile(top: int = 15) -> None:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=APP_DIR,
+                            env=_env(), capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        # "import time:  self [us] | cumulative | imported package"
+        _, self_us, cumulative_us, name = line.replace("import time:", "|", 1).split("|")
+        rows.append((int(cumulative_us), name.strip()))
+    print("Slowest imports (cumulative):")
+    for cumulative_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Measure Raiden backend cold-start time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0,
+                        help="Fail when the median exceeds this (default 1.0)")
+    parser.add_argument("--serve", action="store_true", help="Also measure time until /ping answers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--profile", action="store_true", help="List the slowest imports")
+    args = parser.parse_args()
+
+    if args.profile:
+        print_import_profile()
+
+    import_times = [time_import() for _ in range(args.runs)]
+    median = statistics.median(import_times)
+    print(f"import app: median {median:.3f}s, min {min(import_times):.3f}s, max {max(import_times):.3f}s")
+
+    if args.serve:
+        ping_times = [time_to_ping(args.port) for _ in range(args.runs)]
+        median = statistics.median(ping_times)
+        print(f"time to /ping: median {median:.3f}s, min {min(ping_times):.3f}s, max {max(ping_times):.3f}s")
+
+    if median > args.max_seconds:
+        print(f"FAIL: {median:.3f}s exceeds the {args.max_seconds:.3f}s budget")
+        return 1
+    print(f"OK: within the {args.max_seconds:.3f}s budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
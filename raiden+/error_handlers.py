@@ -30,10 +30,13 @@ async def generic_error_handler(request: Request, exc: Exception) -> JSONRespons
 
 async def rate_limit_handler(request: Request, exc: Exception) -> JSONResponse:
     """Handle rate limit exceptions"""
+    # RateLimitExceeded carries the reason and seconds until a retry can succeed
+    retry_after = getattr(exc, "retry_after", 60)
     return JSONResponse(
         status_code=status.HTTP_429_TOO_MANY_REQUESTS,
         content={
-            "error": "Rate limit exceeded",
-            "retry_after": 60  # seconds
-        }
+            "error": getattr(exc, "reason", "Rate limit exceeded"),
+            "retry_after": retry_after  # seconds
+        },
+        headers={"Retry-After": str(retry_after)}
     )
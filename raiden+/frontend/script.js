@@ -19,12 +19,15 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Configuration ---
     const API_BASE_URL = 'http://localhost:5000'; // Ensure this matches your FastAPI backend
     const CHAT_ENDPOINT = `${API_BASE_URL}/chat`;
+    const CHAT_STREAM_ENDPOINT = `${API_BASE_URL}/chat/stream`;
     const CONFIRM_ENDPOINT = `${API_BASE_URL}/confirm`;
     const UPLOAD_ENDPOINT = `${API_BASE_URL}/upload`;
     const PING_ENDPOINT = `${API_BASE_URL}/ping`;
 
     // --- State ---
     let messageHistory = []; // Store message objects { role: 'user'/'assistant'/'tool'/'system', content: '...' }
+    let sessionId = null; // Assigned by the backend on the first /chat response
+    let syncedCount = 0; // Number of messageHistory entries the backend already holds
     let isWaitingForResponse = false;
     let isWaitingForConfirmation = false;
     let currentActionData = null; // Store data for confirmation { prompt: ..., tool_name: ..., tool_args: ... }
@@ -268,21 +271,30 @@ document.addEventListener('DOMContentLoaded', () => {
             adjustTextareaHeight();
             setLoadingState(true);
 
-            const response = await fetch(CHAT_ENDPOINT, {
+            // Send only messages the backend has not seen yet; it rebuilds the rest from the session
+            const pendingMessages = messageHistory.slice(syncedCount).filter(msg => msg.role !== 'error');
+            const response = await fetch(CHAT_STREAM_ENDPOINT, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', },
-                // Send the *entire* message history and selected model
-                body: JSON.stringify({ messages: messageHistory, model: selectedModel }),
+                body: JSON.stringify({
+                    messages: pendingMessages,
+                    model: selectedModel,
+                    session_id: sessionId,
+                    delta: true
+                }),
             });
 
-            const data = await response.json(); // Always try to parse JSON
-
             if (!response.ok) {
+                const data = await response.json();
                  // Use error detail from API response if available
                 throw new Error(data.error || data.detail || `Server error: ${response.status}`);
             }
 
+            const data = await readChatStream(response);
+            if (data.session_id) { sessionId = data.session_id; }
             handleApiResponse(data);
+            // A failed turn never reached the backend's history; resend it with the next message
+            if (!data.error) { syncedCount = messageHistory.length; }
 
         } catch (error) {
             console.error('Chat Error:', error);
@@ -297,6 +309,88 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // --- Function: Read Streamed Chat Events (SSE) ---
+    // Shows tokens as they arrive and resolves with the final ApiResponse payload.
+    async function readChatStream(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let finalData = null;
+        let liveDiv = null;
+
+        const removeLiveDiv = () => {
+            if (liveDiv) { liveDiv.remove(); liveDiv = null; }
+        };
+
+        try {
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const frame = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let dataLines = [];
+                    frame.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                    });
+                    const payload = dataLines.length ? JSON.parse(dataLines.join('\n')) : {};
+
+                    switch (eventName) {
+                        case 'session':
+                            sessionId = payload.session_id;
+                            break;
+                        case 'token':
+                            if (!liveDiv) {
+                                liveDiv = document.createElement('div');
+                                liveDiv.classList.add('message', 'agent-message');
+                                const liveContent = document.createElement('div');
+                                liveContent.classList.add('message-content');
+                                liveDiv.appendChild(liveContent);
+                                chatDisplay.appendChild(liveDiv);
+                            }
+                            liveDiv.firstChild.textContent += payload.content;
+                            chatDisplay.scrollTo({ top: chatDisplay.scrollHeight });
+                            break;
+                        case 'retry':
+                            // The model failed mid-answer; the next provider's tokens follow
+                            removeLiveDiv();
+                            break;
+                        case 'tool_start':
+                            // Tokens so far belong to the tool-calling turn; the final render replaces them
+                            removeLiveDiv();
+                            setStatus('pending', `Running ${payload.name}...`);
+                            break;
+                        case 'tool_end':
+                            setStatus('pending', 'Raiden is thinking...');
+                            break;
+                        case 'confirmation':
+                            setStatus('pending', 'Confirmation Required');
+                            break;
+                        case 'done':
+                            finalData = payload;
+                            break;
+                        case 'error':
+                            finalData = { messages: [], error: payload.error };
+                            break;
+                    }
+                }
+            }
+        } finally {
+            removeLiveDiv();
+        }
+
+        if (!finalData) {
+            throw new Error('Stream ended before the response completed');
+        }
+        return finalData;
+    }
+
     // --- Function: Handle API Response (Chat & Confirm) ---
     function handleApiResponse(data) {
          if (data.error) {
@@ -384,7 +478,7 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // --- Function: Upload Image ---
+    // --- Function: Upload Image or Document ---
     async function uploadImage(file) {
         if (!file) return;
         
@@ -425,7 +519,8 @@ document.addEventListener('DOMContentLoaded', () => {
     // --- Function: Clear Memory ---
     async function clearMemory() {
         try {
-            const response = await fetch(`${API_BASE_URL}/clear-memory`, {
+            const query = sessionId ? `?session_id=${encodeURIComponent(sessionId)}` : '';
+            const response = await fetch(`${API_BASE_URL}/clear-memory${query}`, {
                 method: 'POST',
                 credentials: 'include'
             });
@@ -435,6 +530,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 throw new Error(error.detail || 'Failed to clear memory');
             }
             
+            sessionId = null;
+            syncedCount = messageHistory.length;
             addMessage("Memory has been cleared. Starting fresh conversation.", 'system');
             setStatus('connected', 'Memory Cleared');
             
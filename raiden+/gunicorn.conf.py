@@ -0,0 +1,14 @@
+# Production server via gunicorn with uvicorn workers (pip install gunicorn):
+#     gunicorn -c gunicorn.conf.py app:app
+# Equivalent to `RAIDEN_ENV=production python app.py`; set SHARED_STATE_URL so workers share state.
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", str(max(2, os.cpu_count() or 1))))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Streamed chats can run for minutes
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "300"))
+graceful_timeout = 30
+keepalive = 5
+# Workers check this to decide whether per-process caches are safe
+raw_env = [f"WEB_CONCURRENCY={workers}"]
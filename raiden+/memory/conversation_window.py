@@ -0,0 +1,96 @@
+import os
+import json
+from typing import List
+
+from langchain_core.messages import BaseMessage, ToolMessage, messages_from_dict, messages_to_dict
+
+from memory.sqlite_memory import memory_instance, RaidenMemory
+from utils.shared_state import shared_state, acall
+
+# Number of recent messages kept per session when rebuilding graph state
+CONVERSATION_WINDOW_SIZE = int(os.environ.get("CONVERSATION_WINDOW_SIZE", "50"))
+# Number of sessions whose window is kept in process before falling back to SQLite
+CONVERSATION_CACHE_SESSIONS = int(os.environ.get("CONVERSATION_CACHE_SESSIONS", "256"))
+# Seconds an idle session window stays in the shared backend
+CONVERSATION_CACHE_TTL = float(os.environ.get("CONVERSATION_CACHE_TTL", "86400"))
+
+
+class ConversationWindowCache:
+    """Recent messages per session, backed by RaidenMemory.
+
+    Lets /chat accept only the new turn: prior state comes from this cache,
+    or from SQLite on a miss, instead of being re-sent by the client. The
+    cache lives in the shared state backend so every worker sees the same
+    window; in process it is an LRU of `max_sessions` sessions.
+    """
+
+    def __init__(self, memory: RaidenMemory, window_size: int = CONVERSATION_WINDOW_SIZE,
+                 max_sessions: int = CONVERSATION_CACHE_SESSIONS):
+        self.memory = memory
+        self.window_size = window_size
+        self.max_sessions = max_sessions
+        self.store = shared_state.namespace("window", max_local_entries=max_sessions)
+        # Several workers with per-process caches would each hold a stale copy of the window
+        self.enabled = self.store.shared or shared_state.status()["workers"] <= 1
+
+    def _trim(self, messages: List[BaseMessage]) -> List[BaseMessage]:
+        """Keep the newest messages without leaving an orphaned tool result at the head"""
+        window = messages[-self.window_size:]
+        while window and isinstance(window[0], ToolMessage):
+            window = window[1:]
+        return window
+
+    @staticmethod
+    def _dump(messages: List[BaseMessage]) -> List[str]:
+        return [json.dumps(d) for d in messages_to_dict(messages)]
+
+    def _load(self, raw: List[str]) -> List[BaseMessage]:
+        # Appends trim by count only, so the head may be a tool result whose call was dropped
+        return self._trim(messages_from_dict([json.loads(r) for r in raw]))
+
+    def get(self, session_id: str) -> List[BaseMessage]:
+        """Return the recent messages of a session, oldest first"""
+        raw = self.store.list_get(session_id) if self.enabled else None
+        if raw is not None:
+            return self._load(raw)
+
+        window = self._trim(self.memory.load_recent_conversation(session_id, self.window_size))
+        if self.enabled:
+            self.store.list_set(session_id, self._dump(window), self.window_size, CONVERSATION_CACHE_TTL)
+        return window
+
+    async def aget(self, session_id: str) -> List[BaseMessage]:
+        """Async variant of get(); a cache miss loads from SQLite off the event loop"""
+        raw = await acall(self.store, "list_get", session_id) if self.enabled else None
+        if raw is not None:
+            return self._load(raw)
+
+        window = self._trim(await self.memory.aload_recent_conversation(session_id, self.window_size))
+        if self.enabled:
+            await acall(self.store, "list_set", session_id, self._dump(window), self.window_size,
+                        CONVERSATION_CACHE_TTL)
+        return window
+
+    def append(self, session_id: str, messages: List[BaseMessage]) -> None:
+        """Extend a cached window with the messages of a finished turn"""
+        if not self.enabled:
+            return
+        # Not cached: nothing is written and the next get() reloads it from SQLite
+        self.store.list_append_existing(session_id, self._dump(list(messages)), self.window_size,
+                                        CONVERSATION_CACHE_TTL)
+
+    async def aappend(self, session_id: str, messages: List[BaseMessage]) -> None:
+        if self.enabled:
+            await acall(self.store, "list_append_existing", session_id, self._dump(list(messages)),
+                        self.window_size, CONVERSATION_CACHE_TTL)
+
+    def invalidate(self, session_id: str) -> None:
+        if self.enabled:
+            self.store.delete(session_id)
+
+    async def ainvalidate(self, session_id: str) -> None:
+        if self.enabled:
+            await acall(self.store, "delete", session_id)
+
+
+conversation_window = ConversationWindowCache(memory_instance)
@@ -1,10 +1,15 @@
 import os
 import json
+import queue
+import asyncio
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any, Optional
 import sqlite3
 from pathlib import Path
-from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
 from langchain_community.chat_message_histories import SQLChatMessageHistory
 
 try:
@@ -13,28 +18,108 @@ except ImportError:
     WORKSPACE_DIR = Path("./raiden_workspace_srv")
     WORKSPACE_DIR.mkdir(exist_ok=True)
 
+MEMORY_POOL_SIZE = int(os.environ.get("MEMORY_POOL_SIZE", "4"))
+
+# Bump SCHEMA_VERSION and add an entry to RaidenMemory._MIGRATIONS when the schema changes
+SCHEMA_VERSION = 3
+
+CONVERSATIONS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,   -- Per-session monotonic message number
+        message_type TEXT NOT NULL,
+        content TEXT NOT NULL,
+        tool_calls TEXT,
+        entities TEXT,  -- Store extracted entities/topics
+        sentiment TEXT, -- Store message sentiment
+        timestamp TEXT NOT NULL,
+        tool_call_id TEXT
+    )
+"""
+CONVERSATIONS_INDEX_SQL = """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_conversations_session_seq
+    ON conversations (session_id, seq)
+"""
+
+# Statements are kept as module constants so sqlite3's per-connection statement cache reuses them
+INSERT_CONVERSATION_SQL = """INSERT INTO conversations 
+   (session_id, seq, message_type, content, tool_calls, entities, sentiment, timestamp, tool_call_id)
+   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+NEXT_SEQ_SQL = "SELECT COALESCE(MAX(seq), 0) FROM conversations WHERE session_id = ?"
+UPSERT_CONTEXT_SQL = """INSERT OR REPLACE INTO context 
+   (session_id, data, preferences, topics, last_updated)
+   VALUES (?, ?, ?, ?, ?)"""
+# Leaves `folded` alone: only the context window manager, which folds messages into the summary, writes it
+UPSERT_SUMMARY_SQL = """INSERT INTO conversation_summaries
+   (session_id, summary, key_points, last_updated)
+   VALUES (?, ?, ?, ?)
+   ON CONFLICT(session_id) DO UPDATE SET
+   summary = excluded.summary, key_points = excluded.key_points, last_updated = excluded.last_updated"""
+UPSERT_ROLLING_SUMMARY_SQL = """INSERT INTO conversation_summaries
+   (session_id, summary, folded, last_updated)
+   VALUES (?, ?, ?, ?)
+   ON CONFLICT(session_id) DO UPDATE SET
+   summary = excluded.summary, folded = excluded.folded, last_updated = excluded.last_updated"""
+
+
+class SQLiteConnectionPool:
+    """Small pool of long-lived SQLite connections in WAL mode"""
+
+    def __init__(self, db_path: Path, size: int = MEMORY_POOL_SIZE):
+        self.db_path = db_path
+        self._pool: "queue.Queue[sqlite3.Connection]" = queue.Queue(maxsize=max(1, size))
+        for _ in range(max(1, size)):
+            self._pool.put(self._connect())
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False, cached_statements=128)
+        conn.execute("PRAGMA journal_mode=WAL")   # Readers no longer block the writer
+        conn.execute("PRAGMA synchronous=NORMAL") # WAL keeps this crash-safe with far fewer fsyncs
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; the block runs as one transaction"""
+        conn = self._pool.get()
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self._pool.put(conn)
+
+    def close(self):
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+
 class RaidenMemory:
-    def __init__(self, workspace_dir: Path = WORKSPACE_DIR):
+    def __init__(self, workspace_dir: Path = WORKSPACE_DIR, pool_size: int = MEMORY_POOL_SIZE):
         self.db_path = workspace_dir / "raiden_memory.db"
+        self._pool = SQLiteConnectionPool(self.db_path, pool_size)
+        # Writes are serialized on one thread so they never block the event loop or each other
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="raiden-memory-writer")
         self._initialize_db()
         
     def _initialize_db(self):
         """Initialize SQLite database with enhanced tables for conversation memory"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._pool.connection() as conn:
             cursor = conn.cursor()
-            # Create conversations table with additional fields
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS conversations (
-                    session_id TEXT,
-                    message_type TEXT NOT NULL,
-                    content TEXT NOT NULL,
-                    tool_calls TEXT,
-                    entities TEXT,  -- Store extracted entities/topics
-                    sentiment TEXT, -- Store message sentiment
-                    timestamp TEXT NOT NULL,
-                    PRIMARY KEY (session_id, timestamp)
-                )
-            """)
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'conversations'")
+            conversations_exist = cursor.fetchone() is not None
+            version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+            if not conversations_exist:
+                # Fresh database: create the conversations table at the current schema
+                cursor.execute(CONVERSATIONS_TABLE_SQL.format(table="conversations"))
+                cursor.execute(CONVERSATIONS_INDEX_SQL)
+            else:
+                for target in range(version + 1, SCHEMA_VERSION + 1):
+                    print(f"Migrating memory database to schema version {target}")
+                    self._MIGRATIONS[target](self, cursor)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
             
             # Create context table for session memory
             cursor.execute("""
@@ -65,100 +150,185 @@ class RaidenMemory:
                     session_id TEXT PRIMARY KEY,
                     summary TEXT NOT NULL,
                     key_points TEXT,
-                    last_updated TEXT NOT NULL
+                    last_updated TEXT NOT NULL,
+                    folded TEXT        -- Fingerprints of the messages folded into the summary
                 )
             """)
-            conn.commit()
+
+    # --- Schema migrations (each runs inside the initialization transaction) ---
+    def _migrate_add_tool_call_id(self, cursor):
+        """v1: store tool_call_id so ToolMessages can be restored"""
+        cursor.execute("PRAGMA table_info(conversations)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if "tool_call_id" not in columns:
+            cursor.execute("ALTER TABLE conversations ADD COLUMN tool_call_id TEXT")
+
+    def _migrate_add_seq(self, cursor):
+        """v2: replace the (session_id, timestamp) key with a per-session sequence"""
+        cursor.execute(CONVERSATIONS_TABLE_SQL.format(table="conversations_v2"))
+        # Number existing rows in their stored order; rowid breaks timestamp ties. The v1 column
+        # allowed NULL session ids, which the new NOT NULL column takes as the 'legacy' session.
+        cursor.execute("""
+            INSERT INTO conversations_v2
+                (session_id, seq, message_type, content, tool_calls, entities, sentiment, timestamp, tool_call_id)
+            SELECT COALESCE(session_id, 'legacy'),
+                   ROW_NUMBER() OVER (PARTITION BY COALESCE(session_id, 'legacy') ORDER BY timestamp, rowid),
+                   message_type, content, tool_calls, entities, sentiment, timestamp, tool_call_id
+            FROM conversations
+        """)
+        cursor.execute("DROP TABLE conversations")
+        cursor.execute("ALTER TABLE conversations_v2 RENAME TO conversations")
+        cursor.execute(CONVERSATIONS_INDEX_SQL)
+
+    def _migrate_add_summary_folded(self, cursor):
+        """v3: keep the rolling summary's folded-message fingerprints with it"""
+        cursor.execute("PRAGMA table_info(conversation_summaries)")
+        columns = {row[1] for row in cursor.fetchall()}
+        if columns and "folded" not in columns:
+            cursor.execute("ALTER TABLE conversation_summaries ADD COLUMN folded TEXT")
+
+    _MIGRATIONS = {
+        1: _migrate_add_tool_call_id,
+        2: _migrate_add_seq,
+        3: _migrate_add_summary_folded,
+    }
     
+    def _insert_messages(self, conn: sqlite3.Connection, session_id: str, messages: List[BaseMessage]) -> None:
+        """Append messages to a session with consecutive sequence numbers"""
+        if not conn.in_transaction:
+            conn.execute("BEGIN IMMEDIATE")  # Reserve the write lock before reading MAX(seq)
+        last_seq = conn.execute(NEXT_SEQ_SQL, (session_id,)).fetchone()[0]
+        conn.executemany(INSERT_CONVERSATION_SQL, self._conversation_rows(session_id, messages, last_seq + 1))
+
+    def _conversation_rows(self, session_id: str, messages: List[BaseMessage], first_seq: int) -> List[tuple]:
+        """Build conversations rows with enhanced metadata"""
+        rows = []
+        for seq, msg in enumerate(messages, start=first_seq):
+            tool_calls = json.dumps(msg.tool_calls) if getattr(msg, 'tool_calls', None) else None
+            tool_call_id = msg.tool_call_id if isinstance(msg, ToolMessage) else None
+            rows.append((
+                session_id, seq, msg.__class__.__name__, msg.content, tool_calls,
+                "[]",       # Placeholder for entity extraction
+                "neutral",  # Default sentiment
+                datetime.now().isoformat(), tool_call_id
+            ))
+        return rows
+
     def save_conversation(self, session_id: str, messages: List[BaseMessage]) -> bool:
         """Save conversation history with enhanced metadata"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Insert new messages with metadata
-                for msg in messages:
-                    msg_data = {
-                        "type": msg.__class__.__name__,
-                        "content": msg.content,
-                        "timestamp": datetime.now().isoformat(),
-                        "entities": "[]",  # Placeholder for entity extraction
-                        "sentiment": "neutral"  # Default sentiment
-                    }
-                    
-                    if hasattr(msg, 'tool_calls') and msg.tool_calls:
-                        msg_data["tool_calls"] = json.dumps(msg.tool_calls)
-                    
-                    cursor.execute(
-                        """INSERT INTO conversations 
-                           (session_id, message_type, content, tool_calls, entities, sentiment, timestamp)
-                           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-                        (session_id, msg_data["type"], msg_data["content"],
-                         msg_data.get("tool_calls"), msg_data["entities"],
-                         msg_data["sentiment"], msg_data["timestamp"])
-                    )
-                conn.commit()
+            with self._pool.connection() as conn:
+                self._insert_messages(conn, session_id, messages)
                 return True
         except Exception as e:
             print(f"Error saving conversation: {e}")
             return False
+
+    def save_turn(self, session_id: str, messages: List[BaseMessage], context: Dict[str, Any],
+                  topics: List[str] = None, summary: str = None, key_points: List[str] = None) -> bool:
+        """Save a whole chat turn (messages, context and optional summary) in one transaction"""
+        try:
+            with self._pool.connection() as conn:
+                now = datetime.now().isoformat()
+                if messages:
+                    self._insert_messages(conn, session_id, messages)
+                conn.execute(
+                    UPSERT_CONTEXT_SQL,
+                    (session_id, json.dumps(context), json.dumps({}), json.dumps(topics or []), now)
+                )
+                if summary is not None:
+                    conn.execute(UPSERT_SUMMARY_SQL, (session_id, summary, json.dumps(key_points or []), now))
+                return True
+        except Exception as e:
+            print(f"Error saving chat turn: {e}")
+            return False
     
-    def load_conversation(self, session_id: str, limit: int = None) -> List[BaseMessage]:
-        """Load conversation history with optional limit"""
+    def load_conversation(self, session_id: str, after_seq: int = 0, limit: int = None) -> List[BaseMessage]:
+        """Load conversation history after `after_seq`, oldest first.
+
+        Keyset pagination: pass the `seq` of the last message of a page
+        (additional_kwargs["seq"]) as `after_seq` to fetch the next page.
+        """
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 query = """
-                    SELECT message_type, content, tool_calls, entities, sentiment 
+                    SELECT seq, message_type, content, tool_calls, entities, sentiment, tool_call_id 
                     FROM conversations 
-                    WHERE session_id = ?
-                    ORDER BY timestamp
+                    WHERE session_id = ? AND seq > ?
+                    ORDER BY seq
                 """
+                params = [session_id, int(after_seq)]
                 if limit:
-                    query += f" LIMIT {int(limit)}"
-                    
-                cursor.execute(query, (session_id,))
-                rows = cursor.fetchall()
-                
-                messages = []
-                for msg_type, content, tool_calls, entities, sentiment in rows:
-                    additional_kwargs = {
-                        "entities": json.loads(entities) if entities else [],
-                        "sentiment": sentiment
-                    }
+                    query += " LIMIT ?"
+                    params.append(int(limit))
                     
-                    if msg_type == "HumanMessage":
-                        msg = HumanMessage(content=content, additional_kwargs=additional_kwargs)
-                    elif msg_type == "AIMessage":
-                        if tool_calls:
-                            additional_kwargs["tool_calls"] = json.loads(tool_calls)
-                        msg = AIMessage(content=content, additional_kwargs=additional_kwargs)
-                    elif msg_type == "SystemMessage":
-                        msg = SystemMessage(content=content, additional_kwargs=additional_kwargs)
-                    messages.append(msg)
-                return messages
+                cursor.execute(query, params)
+                return self._rows_to_messages(cursor.fetchall())
         except Exception as e:
             print(f"Error loading conversation: {e}")
             return []
+
+    def load_recent_conversation(self, session_id: str, limit: int) -> List[BaseMessage]:
+        """Load the newest `limit` messages of a session, oldest first"""
+        try:
+            with self._pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    """SELECT seq, message_type, content, tool_calls, entities, sentiment, tool_call_id
+                       FROM conversations
+                       WHERE session_id = ?
+                       ORDER BY seq DESC
+                       LIMIT ?""",
+                    (session_id, int(limit))
+                )
+                return self._rows_to_messages(reversed(cursor.fetchall()))
+        except Exception as e:
+            print(f"Error loading recent conversation: {e}")
+            return []
+
+    def _rows_to_messages(self, rows) -> List[BaseMessage]:
+        """Rebuild LangChain messages from conversations rows"""
+        messages = []
+        for seq, msg_type, content, tool_calls, entities, sentiment, tool_call_id in rows:
+            additional_kwargs = {
+                "entities": json.loads(entities) if entities else [],
+                "sentiment": sentiment,
+                "seq": seq
+            }
+            
+            if msg_type == "HumanMessage":
+                msg = HumanMessage(content=content, additional_kwargs=additional_kwargs)
+            elif msg_type == "AIMessage":
+                msg = AIMessage(
+                    content=content,
+                    tool_calls=json.loads(tool_calls) if tool_calls else [],
+                    additional_kwargs=additional_kwargs
+                )
+            elif msg_type == "SystemMessage":
+                msg = SystemMessage(content=content, additional_kwargs=additional_kwargs)
+            elif msg_type == "ToolMessage" and tool_call_id:
+                msg = ToolMessage(content=content, tool_call_id=tool_call_id, additional_kwargs=additional_kwargs)
+            else:
+                continue  # Unknown type or tool result without its call id
+            messages.append(msg)
+        return messages
     
     def save_context(self, session_id: str, context: Dict[str, Any], 
                     preferences: Dict = None, topics: List[str] = None) -> bool:
         """Save session context with enhanced metadata"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().isoformat()
                 
                 cursor.execute(
-                    """INSERT OR REPLACE INTO context 
-                       (session_id, data, preferences, topics, last_updated)
-                       VALUES (?, ?, ?, ?, ?)""",
+                    UPSERT_CONTEXT_SQL,
                     (session_id, json.dumps(context),
                      json.dumps(preferences or {}),
                      json.dumps(topics or []),
                      now)
                 )
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error saving context: {e}")
@@ -167,7 +337,7 @@ class RaidenMemory:
     def load_context(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Load session context with enhanced metadata"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT data, preferences, topics 
@@ -191,7 +361,7 @@ class RaidenMemory:
                          data: Dict[str, Any]) -> bool:
         """Save or update entity memory"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().isoformat()
                 
@@ -220,7 +390,6 @@ class RaidenMemory:
                            VALUES (?, ?, ?, ?, ?)""",
                         (entity_id, entity_type, json.dumps(data), now, now)
                     )
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error saving entity memory: {e}")
@@ -229,7 +398,7 @@ class RaidenMemory:
     def get_entity_memory(self, entity_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve entity memory"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """SELECT entity_type, data, last_mentioned, mention_count, first_seen
@@ -255,31 +424,39 @@ class RaidenMemory:
                                 key_points: List[str] = None) -> bool:
         """Save a summary of the conversation"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 now = datetime.now().isoformat()
                 
                 cursor.execute(
-                    """INSERT OR REPLACE INTO conversation_summaries
-                       (session_id, summary, key_points, last_updated)
-                       VALUES (?, ?, ?, ?)""",
+                    UPSERT_SUMMARY_SQL,
                     (session_id, summary, 
                      json.dumps(key_points or []), 
                      now)
                 )
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error saving conversation summary: {e}")
             return False
     
+    def save_rolling_summary(self, session_id: str, summary: str, folded: List[str]) -> bool:
+        """Save the context window's rolling summary with the fingerprints of the messages it covers"""
+        try:
+            with self._pool.connection() as conn:
+                conn.execute(UPSERT_ROLLING_SUMMARY_SQL,
+                             (session_id, summary, json.dumps(folded), datetime.now().isoformat()))
+                return True
+        except Exception as e:
+            print(f"Error saving rolling summary: {e}")
+            return False
+
     def get_conversation_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
         """Retrieve conversation summary"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
-                    """SELECT summary, key_points, last_updated
+                    """SELECT summary, key_points, last_updated, folded
                        FROM conversation_summaries 
                        WHERE session_id = ?""",
                     (session_id,)
@@ -289,7 +466,8 @@ class RaidenMemory:
                     return {
                         "summary": row[0],
                         "key_points": json.loads(row[1]) if row[1] else [],
-                        "last_updated": row[2]
+                        "last_updated": row[2],
+                        "folded": json.loads(row[3]) if row[3] else []
                     }
                 return None
         except Exception as e:
@@ -299,16 +477,48 @@ class RaidenMemory:
     def clear_session(self, session_id: str) -> bool:
         """Clear all data for a session"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._pool.connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
                 cursor.execute("DELETE FROM context WHERE session_id = ?", (session_id,))
                 cursor.execute("DELETE FROM conversation_summaries WHERE session_id = ?", (session_id,))
-                conn.commit()
                 return True
         except Exception as e:
             print(f"Error clearing session: {e}")
             return False
 
+    # --- Async API: reads use a worker thread, writes go through the single writer thread ---
+    async def _run_write(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, functools.partial(func, *args, **kwargs))
+
+    async def asave_turn(self, session_id: str, messages: List[BaseMessage], context: Dict[str, Any],
+                         topics: List[str] = None, summary: str = None, key_points: List[str] = None) -> bool:
+        return await self._run_write(self.save_turn, session_id, messages, context,
+                                     topics=topics, summary=summary, key_points=key_points)
+
+    async def asave_conversation(self, session_id: str, messages: List[BaseMessage]) -> bool:
+        return await self._run_write(self.save_conversation, session_id, messages)
+
+    async def asave_rolling_summary(self, session_id: str, summary: str, folded: List[str]) -> bool:
+        return await self._run_write(self.save_rolling_summary, session_id, summary, folded)
+
+    async def aclear_session(self, session_id: str) -> bool:
+        return await self._run_write(self.clear_session, session_id)
+
+    async def aload_context(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.load_context, session_id)
+
+    async def aload_recent_conversation(self, session_id: str, limit: int) -> List[BaseMessage]:
+        return await asyncio.to_thread(self.load_recent_conversation, session_id, limit)
+
+    async def aget_conversation_summary(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.get_conversation_summary, session_id)
+
+    def close(self):
+        """Flush pending writes and close pooled connections"""
+        self._writer.shutdown(wait=True)
+        self._pool.close()
+
 # Create a singleton instance
 memory_instance = RaidenMemory()
\ No newline at end of file
@@ -0,0 +1,110 @@
+import os
+import zlib
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Responses smaller than this are sent uncompressed (headers and CPU outweigh the saving)
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", "6"))
+# Brotli quality 4-5 compresses better than gzip -6 at similar speed; 11 is for static assets only
+BROTLI_QUALITY = int(os.environ.get("BROTLI_QUALITY", "4"))
+
+# Only text-like bodies are compressed: images, audio and PDFs are compressed already
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+# Streamed token by token; compressing would buffer events
+EXCLUDED_TYPES = ("text/event-stream",)
+
+
+def _accepted_encodings(scope) -> set:
+    for name, value in scope.get("headers", []):
+        if name == b"accept-encoding":
+            return {part.split(";")[0].strip() for part in value.decode("latin-1").lower().split(",")}
+    return set()
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._br = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gz = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # wbits 31: gzip container
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            out = self._br.process(data)
+            return out + (self._br.finish() if final else self._br.flush())
+        out = self._gz.compress(data)
+        return out + self._gz.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Brotli (when installed and accepted) or gzip for text-like responses of at least `minimum_size` bytes.
+
+    Single-body responses under the threshold pass through untouched;
+    streamed responses are compressed chunk by chunk and flushed as they go.
+    Ranges, 304s, event streams and already-encoded bodies are left alone.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = _accepted_encodings(scope)
+        encoding = "br" if brotli is not None and "br" in accepted else "gzip" if "gzip" in accepted else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+                passthrough = (
+                    message["status"] in (204, 206, 304)
+                    or b"content-encoding" in headers
+                    or content_type.startswith(EXCLUDED_TYPES)
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)
+                )
+                if passthrough:
+                    await send(message)
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                if not more_body and len(body) < self.minimum_size:
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers = [(k, v) for k, v in start_message.get("headers", []) if k.lower() != b"content-length"]
+                headers.append((b"content-encoding", encoding.encode("latin-1")))
+                headers.append((b"vary", b"Accept-Encoding"))
+                compressed = compressor.compress(body, final=not more_body)
+                if not more_body:
+                    headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+                await send({**start_message, "headers": headers})
+                await send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+                return
+            await send({"type": "http.response.body", "body": compressor.compress(body, final=not more_body),
+                        "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,72 @@
+import os
+
+from utils.uploads import MAX_UPLOAD_MB
+
+# Multipart framing (boundaries, part headers, small form fields) allowed on top of MAX_UPLOAD_MB
+UPLOAD_BODY_OVERHEAD = int(os.environ.get("UPLOAD_BODY_OVERHEAD", str(64 * 1024)))
+
+
+class UploadLimitMiddleware:
+    """Refuses request bodies over the upload limit with 413 while they are still being received.
+
+    FastAPI spools an UploadFile parameter completely before the endpoint
+    runs, so a check in the endpoint comes too late. This middleware rejects
+    a too-large Content-Length before any body is read, and counts the bytes
+    of chunked bodies as they arrive, answering 413 as soon as they overflow.
+    ContentStore still enforces the exact file size.
+    """
+
+    def __init__(self, app, paths=("/upload",), max_bytes: int = int(MAX_UPLOAD_MB * 1024 * 1024) + UPLOAD_BODY_OVERHEAD):
+        self.app = app
+        self.paths = tuple(paths)
+        self.max_bytes = max_bytes
+        self.rejected = 0
+
+    async def _reject(self, send):
+        self.rejected += 1
+        body = b'{"detail":"Upload exceeds the %g MB limit"}' % ((self.max_bytes - UPLOAD_BODY_OVERHEAD) / (1024 * 1024))
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") not in ("POST", "PUT") or scope.get("path") not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(send)
+                return
+
+        received = 0
+        rejected = False
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    rejected = True
+                    if not response_started:
+                        await self._reject(send)
+                    # Ends the app's body read; it cannot tell this from a client that went away
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def guarded_send(message):
+            nonlocal response_started
+            if rejected:
+                return  # The 413 has been sent; drop whatever the app answers
+            response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, guarded_send)
+        except Exception:
+            if not rejected:
+                raise
@@ -4,6 +4,8 @@ from typing import Optional
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Security, HTTPException, status
 
+from utils.admission import rate_limiter, RateLimitExceeded, RATE_LIMIT_ENABLED
+
 security = HTTPBearer()
 
 class SecurityManager:
@@ -15,21 +17,28 @@ class SecurityManager:
         """Generate a secure API key"""
         return secrets.token_urlsafe(32)
         
+    def is_valid_key(self, api_key: str) -> bool:
+        return bool(api_key) and api_key in self._api_keys
+
     def verify_api_key(self, credentials: HTTPAuthorizationCredentials) -> bool:
         """Verify API key and enforce rate limits"""
         if not credentials or not credentials.credentials:
             return False
             
         api_key = credentials.credentials
-        if api_key not in self._api_keys:
+        if not self.is_valid_key(api_key):
             return False
             
-        # Implement rate limiting
-        return True
+        return self.enforce_rate_limit(api_key)
         
     def enforce_rate_limit(self, api_key: str) -> bool:
-        """Enforce rate limits per API key"""
-        # Implement rate limiting logic
+        """Enforce rate limits per API key; raises RateLimitExceeded when the key's bucket is empty"""
+        if not RATE_LIMIT_ENABLED:
+            return True
+        key_id = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+        wait = rate_limiter.check("key", key_id)
+        if wait > 0:
+            raise RateLimitExceeded("Rate limit exceeded", wait)
         return True
 
 security_manager = SecurityManager()
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from utils.admission import AdmissionController, RateLimitExceeded, TokenBucketLimiter, client_identity
+
+
+def test_unvalidated_keys_share_the_client_bucket():
+    identities = {client_identity({"x-api-key": f"rotated-{i}"}, "10.0.0.1", key_validator=lambda key: False)
+                  for i in range(5)}
+    assert identities == {("client", "10.0.0.1")}
+
+
+def test_validated_key_gets_key_bucket():
+    kind, identity = client_identity({"authorization": "Bearer secret"}, "10.0.0.1",
+                                     key_validator=lambda key: key == "secret")
+    assert kind == "key"
+    assert "secret" not in identity
+
+
+def test_bucket_refuses_after_burst():
+    limiter = TokenBucketLimiter(limits={"client": (60.0, 2.0)}, backend="memory")
+    assert limiter.check("client", "a") == 0
+    assert limiter.check("client", "a") == 0
+    assert limiter.check("client", "a") > 0
+    assert limiter.check("client", "b") == 0
+    assert limiter.stats()["rejected"]["client"] == 1
+
+
+def test_session_cap():
+    admission = AdmissionController(max_inflight=4, queue_size=0, queue_timeout=0.1, per_session=1)
+
+    async def run():
+        async with admission.slot("s1"):
+            with pytest.raises(RateLimitExceeded):
+                await admission.acquire("s1")
+            await admission.acquire("s2")
+            admission.release("s2")
+        assert admission.inflight == 0
+
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage, HumanMessage
+
+from utils.context_manager import ContextWindowManager
+
+
+class _Memory:
+    """Stands in for RaidenMemory's rolling-summary storage"""
+
+    def __init__(self):
+        self.rows = {}
+
+    async def asave_rolling_summary(self, session_id, summary, folded):
+        self.rows[session_id] = {"summary": summary, "folded": folded}
+
+    async def aget_conversation_summary(self, session_id):
+        return self.rows.get(session_id)
+
+
+class _Summarizer:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages, config=None):
+        self.calls += 1
+        return AIMessage(content=f"summary {self.calls}")
+
+
+def test_folded_messages_are_not_summarized_again_after_the_cache_is_lost():
+    manager, memory, llm = ContextWindowManager(), _Memory(), _Summarizer()
+    dropped = [HumanMessage(content="I'm Alice"), AIMessage(content="Hi Alice!")]
+    assert asyncio.run(manager._fold("s", dropped, llm, memory)) == "summary 1"
+
+    # A new process starts without the shared-state entry (as after a restart or TTL expiry); the database copy remains
+    restarted = ContextWindowManager()
+    assert asyncio.run(restarted._fold("s", dropped, llm, memory)) == "summary 1"
+    assert llm.calls == 1
@@ -0,0 +1,15 @@
+import pytest
+
+pytest.importorskip("starlette")
+from utils.file_serving import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, cache_control
+
+
+def test_only_server_generated_names_are_immutable():
+    for name in ("uploads/" + "a" * 24 + ".png", "gemini_image_" + "0f" * 16 + ".png", "speech_casual_1a2b3c4d.mp3"):
+        assert cache_control(name) == IMMUTABLE_CACHE_CONTROL, name
+
+
+def test_user_files_with_date_or_number_suffixes_are_revalidated():
+    for name in ("backup_20231015.csv", "report-12345678.pdf", "plot.png",
+                 "notes/speech_casual_1a2b3c4d.mp3", "uploads/report.pdf"):
+        assert cache_control(name) == REVALIDATE_CACHE_CONTROL, name
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from utils.model_fallback import CircuitBreaker, CircuitOpenError, ModelFallbackManager
+
+
+class _SlowRunnable:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(0.05)
+        return "ok"
+
+
+def _half_open_manager():
+    manager = ModelFallbackManager()
+    breaker = manager._health("flaky").breaker
+    breaker.trip()
+    breaker.opened_at -= breaker.recovery_timeout
+    return manager, breaker
+
+
+def test_only_one_request_probes_a_half_open_provider():
+    manager, breaker = _half_open_manager()
+    runnable = _SlowRunnable()
+
+    async def run():
+        return await asyncio.gather(*(manager.ainvoke("flaky", runnable, []) for _ in range(3)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert results.count("ok") == 1
+    assert sum(isinstance(r, CircuitOpenError) for r in results) == 2
+    assert runnable.calls == 1
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_claimed_probe_is_excluded_from_routing_until_it_resolves():
+    manager, breaker = _half_open_manager()
+    manager.models = [{"name": "flaky"}, {"name": "steady"}]
+    assert "flaky" in manager.route()
+    assert breaker.begin_call()
+    assert manager.route() == ["steady"]
+    breaker.release()
+    assert "flaky" in manager.route()
+
+
+class _StreamRunnable:
+    def __init__(self, delay, fail_after_first=False):
+        self.delay = delay
+        self.fail_after_first = fail_after_first
+
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+        await asyncio.sleep(self.delay)
+        yield AIMessageChunk(content="partial")
+        if self.fail_after_first:
+            await asyncio.sleep(0.05)
+            raise ConnectionError("stream dropped")
+        yield AIMessageChunk(content=" answer")
+
+
+def test_hedge_winner_failing_after_first_token_reports_every_provider_tried(monkeypatch):
+    from utils import model_fallback
+    monkeypatch.setattr(model_fallback, "HEDGE_REQUESTS", True)
+    monkeypatch.setattr(model_fallback, "HEDGE_DEFAULT_DELAY", 0.01)
+    manager = ModelFallbackManager()
+    runnables = {"slow": _StreamRunnable(1.0), "hedge": _StreamRunnable(0.0, fail_after_first=True)}
+
+    async def prepare(name):
+        return runnables[name], []
+
+    tried = set()
+    with pytest.raises(ConnectionError):
+        asyncio.run(manager.ainvoke_hedged("slow", ["hedge", "spare"], prepare, tried))
+    # The caller's fallback chain continues with "spare"
+    assert tried == {"slow", "hedge"}
@@ -0,0 +1,62 @@
+import sqlite3
+
+import pytest
+
+from tools.rag_bm25 import KeywordIndex, fuse, is_keyword_query
+
+
+def _fts5_available():
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(x)")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+needs_fts5 = pytest.mark.skipif(not _fts5_available(), reason="SQLite built without FTS5")
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    vector = ["a", "b", "c"]
+    keyword = ["c", "d", "a"]
+    fused = fuse([vector, keyword])
+    assert fused[:2] == ["a", "c"]  # In both rankings
+    assert set(fused) == {"a", "b", "c", "d"}
+
+
+def test_rrf_uses_key_and_keeps_first_item():
+    fused = fuse([[("x", "vector")], [("x", "keyword"), ("y", "keyword")]], key=lambda item: item[0])
+    assert fused == [("x", "vector"), ("y", "keyword")]
+
+
+def test_keyword_query_detection():
+    assert is_keyword_query("ERR_CONNECTION_RESET")
+    assert is_keyword_query('where is "max_retries" set')
+    assert is_keyword_query("config.yaml")
+    assert not is_keyword_query("how does the ingestion pipeline handle failures")
+
+
+@needs_fts5
+def test_bm25_finds_identifiers_and_tracks_updates(tmp_path):
+    index = KeywordIndex(tmp_path / "keywords.sqlite3")
+    index.upsert([
+        ("a.md#1", "Set max_retries to 5 to survive ERR_TIMEOUT", "docs/a.md"),
+        ("b.md#1", "Retries are described elsewhere", "docs/b.md"),
+    ])
+    assert [hit[0] for hit in index.search("max_retries", 5)] == ["a.md#1"]
+    assert index.search("ERR_TIMEOUT", 5)[0][3] > 0  # Higher is better
+
+    index.upsert([("a.md#1", "Nothing about that any more", "docs/a.md")])
+    assert index.search("max_retries", 5) == []
+    assert index.count() == 2
+
+    index.delete(["b.md#1"])
+    index.delete_source("docs/a.md")
+    assert index.count() == 0
+
+
+@needs_fts5
+def test_bm25_matches_file_paths(tmp_path):
+    index = KeywordIndex(tmp_path / "keywords.sqlite3")
+    index.upsert([("r.md#1", "release notes", "notes/release_2024.md"), ("o.md#1", "other", "notes/other.md")])
+    assert index.search("release_2024", 5)[0][0] == "r.md#1"
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip("langchain_chroma")
+pytest.importorskip("langchain_huggingface")
+
+from tools import rag_tools
+
+
+def test_google_model_keeps_the_original_collection():
+    assert rag_tools.collection_for(rag_tools.EMBEDDING_MODEL) == "raiden_collection"
+    assert rag_tools.store_path("manifest", "raiden_collection").name == "manifest.sqlite3"
+
+
+def test_int8_variant_gets_its_own_collection_and_stores():
+    plain = rag_tools.collection_for("sentence-transformers/all-MiniLM-L6-v2")
+    quantized = rag_tools.collection_for("sentence-transformers/all-MiniLM-L6-v2-int8")
+    assert plain == "raiden_collection_all-MiniLM-L6-v2"
+    assert quantized != plain
+    assert rag_tools.store_path("keywords", quantized) != rag_tools.store_path("keywords", plain)
+    assert rag_tools.store_path("manifest", quantized) != rag_tools.store_path("manifest", plain)
+
+
+def test_long_model_ids_stay_distinct():
+    first = rag_tools.collection_for("org/" + "x" * 50 + "-a")
+    second = rag_tools.collection_for("org/" + "x" * 50 + "-b")
+    assert first != second
+    assert len(first) <= 63  # Chroma's name limit
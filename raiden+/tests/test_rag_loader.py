@@ -0,0 +1,59 @@
+import io
+
+from tools.rag_ingest import LoaderPool
+from tools.rag_loader import read_frame, write_frame
+
+
+def test_frames_round_trip():
+    stream = io.BytesIO()
+    write_frame(stream, ("ok", [("a.md#1", "text", {"page": 1})]))
+    write_frame(stream, ("error", "boom"))
+    stream.seek(0)
+    assert read_frame(stream) == ("ok", [("a.md#1", "text", {"page": 1})])
+    assert read_frame(stream) == ("error", "boom")
+    assert read_frame(stream) is None
+
+
+def test_loader_errors_are_reported_and_the_process_is_reused(tmp_path):
+    unsupported = tmp_path / "notes.xyz"
+    unsupported.write_text("hello")
+    pool = LoaderPool(1)
+    try:
+        pids = set()
+        for _ in range(2):
+            try:
+                pool.load(str(unsupported), "notes.xyz", 100, 0)
+            except RuntimeError as e:
+                assert "Error" in str(e)
+            else:
+                raise AssertionError("expected the loader to report an error")
+            pids.update(loader.process.pid for loader in pool._processes)
+        assert len(pids) == 1
+    finally:
+        pool.shutdown()
+
+
+def test_dead_loader_is_replaced(tmp_path):
+    unsupported = tmp_path / "notes.xyz"
+    unsupported.write_text("hello")
+    pool = LoaderPool(1)
+    try:
+        try:
+            pool.load(str(unsupported), "notes.xyz", 100, 0)
+        except RuntimeError:
+            pass
+        first = pool._processes[0]
+        first.process.kill()
+        first.process.wait()
+        try:
+            pool.load(str(unsupported), "notes.xyz", 100, 0)
+        except RuntimeError as e:
+            assert "exited" in str(e)
+        assert pool._processes == []
+        try:
+            pool.load(str(unsupported), "notes.xyz", 100, 0)
+        except RuntimeError as e:
+            assert "exited" not in str(e)
+        assert len(pool._processes) == 1 and pool._processes[0] is not first
+    finally:
+        pool.shutdown()
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from utils.response_cache import ResponseCache, RESPONSE_CACHE_MAX_TEMPERATURE
+
+
+def _cache():
+    cache = ResponseCache(semantic=False)
+    cache._shared = None  # Per-process layer only
+    return cache
+
+
+def test_contextual_answer_is_not_shared_across_sessions():
+    cache = _cache()
+    turn = [SystemMessage(content="You are Raiden"), HumanMessage(content="I'm Alice"), AIMessage(content="Hi!"),
+            HumanMessage(content="What's my name?")]
+    asyncio.run(cache.aput(turn, None, AIMessage(content="Your name is Alice."), "session-a"))
+
+    assert asyncio.run(cache.aget(turn, None, "session-a")).content == "Your name is Alice."
+    assert asyncio.run(cache.aget(turn, None, "session-b")) is None
+
+
+def test_standalone_question_is_shared_across_sessions():
+    cache = _cache()
+    question = [SystemMessage(content="You are Raiden"), HumanMessage(content="What is the capital of France?")]
+    asyncio.run(cache.aput(question, "gemini", AIMessage(content="Paris."), "session-a"))
+
+    reworded = [SystemMessage(content="You are Raiden"), HumanMessage(content="  what is the capital of France ")]
+    assert asyncio.run(cache.aget(reworded, "gemini", "session-b")).content == "Paris."
+    # Another model, another system prompt or a rolling summary is a different context
+    assert asyncio.run(cache.aget(question, "groq", "session-b")) is None
+    assert asyncio.run(cache.aget([SystemMessage(content="other"), question[1]], "gemini", "session-b")) is None
+    assert asyncio.run(cache.aget(question, "gemini", "session-b", "earlier turns")) is None
+
+
+def test_key_covers_earlier_history_and_summary():
+    cache = _cache()
+    first = [SystemMessage(content="sys"), HumanMessage(content="I'm Alice"), AIMessage(content="Hi!"),
+             HumanMessage(content="What's my name?")]
+    other = [SystemMessage(content="sys"), HumanMessage(content="I'm Bob"), AIMessage(content="Hi!"),
+             HumanMessage(content="What's my name?")]
+    asyncio.run(cache.aput(first, None, AIMessage(content="Alice"), "s", "summary one"))
+
+    assert asyncio.run(cache.aget(other, None, "s", "summary one")) is None
+    assert asyncio.run(cache.aget(first, None, "s", "summary two")) is None
+    assert asyncio.run(cache.aget(first, None, "s", "summary one")).content == "Alice"
+
+
+def test_temperature_gate_admits_the_registered_models():
+    class Model:
+        temperature = 0.7
+
+    assert RESPONSE_CACHE_MAX_TEMPERATURE >= 0.7
+    assert ResponseCache.cacheable_temperature(Model())
@@ -0,0 +1,86 @@
+import asyncio
+
+from utils.tool_executor import ToolExecutor
+
+
+class _Tool:
+    """Sync tool that records when it starts and finishes"""
+
+    def __init__(self, log, name, seconds=0.02):
+        self.log = log
+        self.name = name
+        self.seconds = seconds
+
+    def invoke(self, args):
+        import time
+        self.log.append(("start", self.name))
+        time.sleep(self.seconds)
+        self.log.append(("end", self.name))
+        return self.name
+
+
+def _calls(log, spec):
+    return [(name, _Tool(log, f"{name}:{i}"), args) for i, (name, args) in enumerate(spec)]
+
+
+def test_plan_keeps_same_path_calls_in_order_and_isolates_stateful_tools():
+    calls = _calls([], [
+        ("write_file_confirmed", {"filename": "notes.txt", "content": "x"}),
+        ("read_file", {"filename": "./notes.txt"}),
+        ("get_weather", {"location": "Oslo"}),
+        ("list_directory", {"path": "."}),
+        ("python_repl", {"query": "print(1)"}),
+        ("read_file", {"filename": "a.txt"}),
+        ("resize_image", {"image_path": "img/a.png", "width": 1, "height": 1}),
+        ("list_directory", {"path": "img"}),
+    ])
+    assert ToolExecutor.plan(calls) == [
+        [[0]],
+        [[1, 3], [2]],  # notes.txt is read before the workspace root is listed
+        [[4]],
+        [[5], [6, 7]],
+    ]
+
+
+def test_run_many_orders_dependent_calls_and_returns_results_in_call_order():
+    log = []
+    calls = _calls(log, [
+        ("read_file", {"filename": "out.txt"}),
+        ("get_weather", {"location": "Oslo"}),
+        ("convert_document", {"input_path": "out.txt", "output_format": "pdf"}),
+    ])
+    results = asyncio.run(ToolExecutor().run_many(calls))
+    assert results == ["read_file:0", "get_weather:1", "convert_document:2"]
+    assert log.index(("end", "read_file:0")) < log.index(("start", "convert_document:2"))
+    # The unrelated call overlapped the chain
+    assert log.index(("start", "get_weather:1")) < log.index(("end", "read_file:0"))
+
+
+def test_confirmation_gated_tools_are_not_timed_out():
+    executor = ToolExecutor(timeout=0.01)
+    slow = _Tool([], "write", seconds=0.05)
+    assert asyncio.run(executor.run("write_file_confirmed", slow, {})) == "write"
+    assert asyncio.run(executor.run("read_file", slow, {}, timed=False)) == "write"
+    try:
+        asyncio.run(executor.run("read_file", slow, {}))
+    except asyncio.TimeoutError:
+        pass
+    else:
+        raise AssertionError("expected a timeout")
+
+
+def test_timed_out_thread_keeps_its_concurrency_slot():
+    log = []
+    executor = ToolExecutor(timeout=0.01)
+    first, second = _Tool(log, "first", seconds=0.1), _Tool(log, "second", seconds=0.01)
+
+    async def scenario():
+        try:
+            await executor.run("python_repl", first, {})
+        except asyncio.TimeoutError:
+            pass
+        return await executor.run("python_repl", second, {}, timed=False)
+
+    assert asyncio.run(scenario()) == "second"
+    # python_repl allows one call at a time; the second waited for the timed-out thread
+    assert log.index(("end", "first")) < log.index(("start", "second"))
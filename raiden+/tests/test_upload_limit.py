@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("fastapi")
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+
+from middleware.upload_limit import UploadLimitMiddleware
+
+LIMIT = 1024
+
+
+def _client():
+    app = FastAPI()
+    seen = []
+
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        data = await file.read()
+        seen.append(len(data))
+        return {"size": len(data)}
+
+    middleware = UploadLimitMiddleware(app, max_bytes=LIMIT)
+    return TestClient(middleware), middleware, seen
+
+
+def test_small_upload_passes():
+    client, middleware, seen = _client()
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * 100)})
+    assert response.status_code == 200
+    assert seen == [100]
+
+
+def test_declared_length_over_limit_is_refused_before_the_endpoint():
+    client, middleware, seen = _client()
+    response = client.post("/upload", files={"file": ("a.txt", b"x" * (LIMIT * 4))})
+    assert response.status_code == 413
+    assert seen == []
+    assert middleware.rejected == 1
+
+
+def test_chunked_body_is_cut_off_while_streaming():
+    client, middleware, seen = _client()
+
+    def body():
+        for _ in range(64):
+            yield b"y" * 256
+
+    response = client.post("/upload", content=body(), headers={"content-type": "multipart/form-data; boundary=b"})
+    assert response.status_code == 413
+    assert seen == []
+
+
+def test_other_paths_are_not_limited():
+    client, middleware, seen = _client()
+    assert client.post("/other", content=b"z" * (LIMIT * 4)).status_code == 404
@@ -0,0 +1,36 @@
+import time
+import asyncio
+
+from utils.warmup import FAILED, READY, TIMEOUT, WarmupManager
+
+
+def test_failed_component_is_retried_until_it_is_ready():
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("unreachable")
+
+    manager = WarmupManager()
+    manager.register("github", connect)
+    asyncio.run(manager._warm("github"))
+    assert manager.state("github") == FAILED
+
+    assert manager.retry("github")
+    assert manager.state("github") == READY
+    assert manager.retry("github") and len(attempts) == 2  # A ready component is not initialized again
+
+
+def test_slow_component_reports_its_final_state_after_timing_out():
+    manager = WarmupManager(timeout=0.01)
+    manager.register("slow", lambda: time.sleep(0.05))
+
+    async def scenario():
+        await manager._warm("slow")
+        timed_out = manager.state("slow")
+        await asyncio.sleep(0.1)
+        return timed_out
+
+    assert asyncio.run(scenario()) == TIMEOUT
+    assert manager.state("slow") == READY
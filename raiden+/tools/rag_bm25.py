@@ -0,0 +1,155 @@
+"""BM25 keyword index kept next to the Chroma collection.
+
+Dense retrieval misses exact identifiers, error codes and file names; a
+SQLite FTS5 table ranks those with BM25. The ingestion pipeline updates it
+chunk by chunk alongside Chroma, and query_documents fuses both rankings
+with reciprocal rank fusion. Keyword-heavy queries are answered from this
+index alone, without embedding the query.
+"""
+import re
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Reciprocal rank fusion constant (60 is the value from the original RRF paper)
+RRF_K = 60
+# Weight of a match in the chunk's file path relative to one in its text
+SOURCE_WEIGHT = 0.5
+
+_TOKEN = re.compile(r"[\w][\w.\-/:#]*[\w]|[\w]")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it me my of on or show tell that the this to "
+    "was what when where which who why with you about find document documents file files".split()
+)
+
+
+def _rowid(chunk_id: str) -> int:
+    # Deterministic 60-bit rowid, so a chunk is deleted or replaced without an id lookup table
+    return int(hashlib.sha256(chunk_id.encode("utf-8")).hexdigest()[:15], 16)
+
+
+def query_terms(query: str) -> List[str]:
+    return [t for t in _TOKEN.findall(query) if len(t) > 1 and t.lower() not in _STOPWORDS]
+
+
+def _identifier_like(term: str) -> bool:
+    """Error codes, file names, snake/camel case identifiers, versions, hex ids"""
+    return (any(c.isdigit() for c in term) or "_" in term or any(c in term for c in ".-/:#")
+            or (term.isupper() and len(term) > 1) or (term[0].islower() and any(c.isupper() for c in term[1:])))
+
+
+def is_keyword_query(query: str) -> bool:
+    """True when exact terms, not meaning, decide relevance (quoted text or mostly identifier-like terms)"""
+    if re.search(r'"[^"]+"|`[^`]+`', query):
+        return True
+    terms = query_terms(query)
+    if not terms:
+        return False
+    identifiers = sum(1 for t in terms if _identifier_like(t))
+    return identifiers >= max(1, len(terms) / 2) or (len(terms) == 1 and identifiers == 1)
+
+
+def fuse(rankings: Iterable[List[Any]], key=lambda item: item, k: int = RRF_K) -> List[Any]:
+    """Reciprocal rank fusion: items ordered by the sum of 1 / (k + rank) over the rankings they appear in"""
+    scores: Dict[Any, float] = {}
+    first: Dict[Any, Any] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            item_key = key(item)
+            scores[item_key] = scores.get(item_key, 0.0) + 1.0 / (k + rank)
+            first.setdefault(item_key, item)
+    return [first[item_key] for item_key in sorted(scores, key=scores.get, reverse=True)]
+
+
+class KeywordIndex:
+    """BM25 over chunk text and file path in an FTS5 table; postings are stored delta-encoded by SQLite"""
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # tokenchars "_" keeps snake_case identifiers whole; dotted names match as phrases
+        self._db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+            chunk_id UNINDEXED, source, text,
+            tokenize = "unicode61 tokenchars '_'"
+        )
+        ''')
+        self._db.commit()
+
+    def upsert(self, chunks: List[Tuple[str, str, str]]) -> None:
+        """(chunk id, text, workspace-relative source path) tuples"""
+        if not chunks:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE rowid = ?", [(_rowid(cid),) for cid, _, _ in chunks])
+            self._db.executemany(
+                "INSERT INTO chunks (rowid, chunk_id, source, text) VALUES (?, ?, ?, ?)",
+                [(_rowid(cid), cid, source, text) for cid, text, source in chunks]
+            )
+            self._db.commit()
+
+    def delete(self, chunk_ids: List[str]) -> None:
+        if not chunk_ids:
+            return
+        with self._lock:
+            self._db.executemany("DELETE FROM chunks WHERE rowid = ?", [(_rowid(cid),) for cid in chunk_ids])
+            self._db.commit()
+
+    def delete_source(self, source: str) -> None:
+        phrase = '"' + source.replace('"', '""') + '"'
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM chunks WHERE rowid IN (SELECT rowid FROM chunks WHERE chunks MATCH ?) AND source = ?",
+                (f"source : {phrase}", source)
+            )
+            self._db.commit()
+
+    def search(self, query: str, k: int) -> List[Tuple[str, str, str, float]]:
+        """(chunk id, text, source, BM25 score) best first; higher scores are better"""
+        terms = query_terms(query)
+        if not terms:
+            return []
+        match = " OR ".join('"' + t.replace('"', '""') + '"' for t in dict.fromkeys(terms))
+        with self._lock:
+            try:
+                rows = self._db.execute(
+                    "SELECT chunk_id, text, source, bm25(chunks, 0.0, ?, 1.0) AS score FROM chunks "
+                    "WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+                    (SOURCE_WEIGHT, match, k)
+                ).fetchall()
+            except sqlite3.OperationalError as e:
+                print(f"Keyword search failed for {match!r}: {e}")
+                return []
+        # FTS5's bm25() is negative (more negative is better)
+        return [(cid, text, source, -score) for cid, text, source, score in rows]
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def optimize(self) -> None:
+        """Merges FTS5 segments (after a large ingestion or backfill)"""
+        with self._lock:
+            self._db.execute("INSERT INTO chunks (chunks) VALUES ('optimize')")
+            self._db.commit()
+
+
+def backfill(index: KeywordIndex, collection: Any, page_size: int = 1000) -> int:
+    """Fills an empty index from an existing Chroma collection; returns the number of chunks added"""
+    added = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if not ids:
+            break
+        index.upsert([(cid, text or "", (meta or {}).get("source_rel_path", ""))
+                      for cid, text, meta in zip(ids, page["documents"], page["metadatas"])])
+        added += len(ids)
+        offset += len(ids)
+    if added:
+        index.optimize()
+    return added
@@ -0,0 +1,634 @@
+"""Batched document ingestion for the RAG vector store.
+
+Loading and splitting run in a process pool, one file per task. Chunks are
+batched as files complete, embedded with bounded concurrency and
+retry/backoff, and upserted into Chroma in batches. With an IndexManifest,
+unchanged files are skipped and only new chunks of a changed file are
+embedded; its removed chunks are deleted. A KeywordIndex (BM25), when
+given, is kept in step with the collection. This module is imported
+by the loader processes, so it keeps its top-level imports light. Loaders
+run `python -m tools.rag_loader` rather than multiprocessing workers, which
+would re-import the main module (app.py and all of its setup) in each one.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import sqlite3
+import asyncio
+import queue
+import hashlib
+import threading
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Loader processes for bulk ingestion (parsing PDFs and DOCX files is CPU-bound)
+INGEST_LOADER_PROCESSES = int(os.environ.get("INGEST_LOADER_PROCESSES", str(min(4, os.cpu_count() or 1))))
+# Chunks per embedding request, capped by characters as well (Google's batch limit is 100 texts)
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "100"))
+EMBED_BATCH_MAX_CHARS = int(os.environ.get("EMBED_BATCH_MAX_CHARS", "200000"))
+# Embedding requests in flight at once
+EMBED_CONCURRENCY = int(os.environ.get("EMBED_CONCURRENCY", "4"))
+# Retries of a rate-limited or failing embedding request, with exponential backoff and jitter
+EMBED_MAX_RETRIES = int(os.environ.get("EMBED_MAX_RETRIES", "5"))
+EMBED_BACKOFF_SECONDS = float(os.environ.get("EMBED_BACKOFF_SECONDS", "1.0"))
+EMBED_MAX_BACKOFF_SECONDS = 30.0
+# Chunks written to Chroma per upsert
+UPSERT_BATCH_SIZE = int(os.environ.get("UPSERT_BATCH_SIZE", "256"))
+# Most files one ingestion job accepts
+INGEST_MAX_FILES = int(os.environ.get("INGEST_MAX_FILES", "1000"))
+# Seconds job progress stays readable after the last update
+INGEST_JOB_TTL = 86400
+
+# Types index_document can load
+SUPPORTED_EXTENSIONS = (".pdf", ".docx", ".txt", ".md", ".csv")
+# Workspace directories never ingested (the vector store itself, upload temp files)
+EXCLUDED_DIRS = ("vectorstore", "uploads/.tmp")
+
+_RETRYABLE_MARKERS = ("429", "rate limit", "ratelimit", "quota", "resource exhausted", "resourceexhausted", "503", "unavailable",
+                      "deadline", "timeout", "timed out", "500 internal")
+
+
+def _get_document_loader(file_path: Path):
+    from langchain_community.document_loaders import (
+        PyMuPDFLoader, Docx2txtLoader, TextLoader, UnstructuredMarkdownLoader, CSVLoader,
+    )
+    extension = file_path.suffix.lower()
+    str_file_path = str(file_path.resolve())
+    if extension == ".pdf":
+        return PyMuPDFLoader(str_file_path)
+    elif extension == ".docx":
+        return Docx2txtLoader(str_file_path)
+    elif extension == ".txt":
+        return TextLoader(str_file_path, encoding="utf-8")
+    elif extension == ".md":
+        return UnstructuredMarkdownLoader(str_file_path, mode="elements")
+    elif extension == ".csv":
+        return CSVLoader(str_file_path, encoding="utf-8")
+    else:
+        print(f"Unsupported file type: {extension}")
+        return None
+
+
+def _plain_metadata(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Chroma accepts only str, int, float and bool metadata values"""
+    plain = {}
+    for key, value in metadata.items():
+        if isinstance(value, (str, int, float, bool)):
+            plain[key] = value
+        elif value is not None:
+            plain[key] = json.dumps(value, default=str)[:1000]
+    return plain
+
+
+def chunk_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_digest(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_and_split(path: str, rel_path: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Loads one file and splits it; returns (chunk id, text, metadata) tuples. Runs in a loader process.
+
+    Chunk ids are derived from the chunk's content, so an unchanged chunk
+    keeps its id when text is inserted or removed before it.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    loader = _get_document_loader(Path(path))
+    if loader is None:
+        raise ValueError(f"Unsupported file type for document: '{rel_path}'")
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              length_function=len, add_start_index=True)
+    chunks = []
+    seen: Dict[str, int] = {}
+    # lazy_load keeps one page/element in memory at a time for loaders that stream
+    for doc in loader.lazy_load():
+        doc.metadata["source_rel_path"] = rel_path
+        for piece in splitter.split_documents([doc]):
+            digest = chunk_hash(piece.page_content)
+            repeat = seen.get(digest, 0)
+            seen[digest] = repeat + 1
+            chunk_id = f"{rel_path}#{digest[:16]}" + (f"-{repeat}" if repeat else "")
+            metadata = _plain_metadata(piece.metadata)
+            metadata["chunk_hash"] = digest
+            chunks.append((chunk_id, piece.page_content, metadata))
+    return chunks
+
+
+class IndexManifest:
+    """What is indexed per workspace file: mtime, size, content hash and its chunks (id -> chunk hash).
+
+    SQLite next to the vector store; an entry is written only once all of a
+    file's new chunks are upserted, so a failed run is picked up next time.
+    """
+
+    def __init__(self, db_path: Path):
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute('''
+        CREATE TABLE IF NOT EXISTS documents (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            chunks TEXT NOT NULL,
+            indexed_at REAL NOT NULL
+        )
+        ''')
+        self._db.commit()
+
+    def get(self, path: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT mtime_ns, size, sha256, chunks FROM documents WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"mtime_ns": row[0], "size": row[1], "sha256": row[2], "chunks": json.loads(row[3])}
+
+    def record(self, path: str, mtime_ns: int, size: int, sha256: str, chunks: Dict[str, str]) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO documents (path, mtime_ns, size, sha256, chunks, indexed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (path, mtime_ns, size, sha256, json.dumps(chunks), time.time())
+            )
+            self._db.commit()
+
+    def touch(self, path: str, mtime_ns: int) -> None:
+        """Same content under a new mtime (e.g. the file was copied over itself)"""
+        with self._lock:
+            self._db.execute("UPDATE documents SET mtime_ns = ? WHERE path = ?", (mtime_ns, path))
+            self._db.commit()
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM documents WHERE path = ?", (path,))
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            documents, = self._db.execute("SELECT COUNT(*) FROM documents").fetchone()
+        return {"documents": documents}
+
+
+class _LoaderProcess:
+    """One `python -m tools.rag_loader` subprocess; serves one file at a time"""
+
+    def __init__(self):
+        env = dict(os.environ)
+        package_dir = str(Path(__file__).resolve().parents[1])
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_dir, env.get("PYTHONPATH")]))
+        # fork+exec: nothing of the server (threads, locks, app.py) is carried over
+        self.process = subprocess.Popen([sys.executable, "-m", "tools.rag_loader"], env=env,
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def load(self, path: str, rel: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+        from tools.rag_loader import read_frame, write_frame
+        try:
+            write_frame(self.process.stdin, (path, rel, chunk_size, chunk_overlap))
+            result = read_frame(self.process.stdout)
+        except (BrokenPipeError, OSError):
+            result = None
+        if result is None:
+            raise RuntimeError(f"Loader process exited with code {self.process.wait()}")
+        status, value = result
+        if status != "ok":
+            raise RuntimeError(value)
+        return value
+
+    def close(self) -> None:
+        try:
+            self.process.stdin.close()  # The loader exits at end of input
+            self.process.wait(timeout=5)
+        except Exception:
+            self.process.kill()
+
+
+class LoaderPool:
+    """Up to `size` loader subprocesses, started on first use and reused across jobs.
+
+    load() blocks until a loader is free; callers run it in a thread. A
+    loader that dies (e.g. a parser crash) is replaced on the next call.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: "queue.Queue[_LoaderProcess]" = queue.Queue()
+        self._processes: List[_LoaderProcess] = []
+        self._lock = threading.Lock()
+
+    def _checkout(self) -> _LoaderProcess:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._processes) < self.size:
+                loader = _LoaderProcess()
+                self._processes.append(loader)
+                return loader
+        return self._idle.get()
+
+    def load(self, path: str, rel: str, chunk_size: int, chunk_overlap: int) -> List[Tuple[str, str, Dict[str, Any]]]:
+        loader = self._checkout()
+        try:
+            return loader.load(path, rel, chunk_size, chunk_overlap)
+        finally:
+            if loader.alive:
+                self._idle.put(loader)
+            else:
+                with self._lock:
+                    self._processes.remove(loader)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for loader in processes:
+            loader.close()
+
+
+_loader_pool: Optional[LoaderPool] = None
+
+
+def loader_pool() -> Optional[LoaderPool]:
+    global _loader_pool
+    if _loader_pool is None and INGEST_LOADER_PROCESSES > 0:
+        _loader_pool = LoaderPool(INGEST_LOADER_PROCESSES)
+    return _loader_pool
+
+
+def shutdown() -> None:
+    global _loader_pool
+    if _loader_pool is not None:
+        _loader_pool.shutdown()
+        _loader_pool = None
+
+
+def resolve_files(workspace_dir: Path, pattern: Optional[str] = None, paths: Optional[List[str]] = None) -> List[Tuple[Path, str]]:
+    """(absolute path, workspace-relative path) of the supported files matching a glob or listed explicitly"""
+    base = Path(workspace_dir).resolve()
+    candidates = []
+    if paths:
+        candidates.extend(base / p.strip().lstrip("/") for p in paths)
+    if pattern:
+        candidates.extend(base.glob(pattern.strip().lstrip("/")))
+    files, seen = [], set()
+    for candidate in candidates:
+        resolved = candidate.resolve()
+        try:
+            rel = resolved.relative_to(base).as_posix()
+        except ValueError:
+            continue  # Outside the workspace
+        if rel in seen or any(rel == d or rel.startswith(d + "/") for d in EXCLUDED_DIRS):
+            continue
+        if resolved.suffix.lower() in SUPPORTED_EXTENSIONS and resolved.is_file():
+            seen.add(rel)
+            files.append((resolved, rel))
+    return sorted(files, key=lambda f: f[1])[:INGEST_MAX_FILES]
+
+
+def _is_retryable(error: Exception) -> bool:
+    if getattr(error, "code", None) in (429, 500, 503) or getattr(error, "status_code", None) in (429, 500, 503):
+        return True
+    message = f"{type(error).__name__} {error}".lower()
+    return any(marker in message for marker in _RETRYABLE_MARKERS)
+
+
+class IngestionProgress:
+    """Counters of one ingestion job; snapshots are published to the shared state backend"""
+
+    def __init__(self, job_id: str, files_total: int):
+        self.job_id = job_id
+        self.state = "running"
+        self.files_total = files_total
+        self.files_done = 0
+        self.files_failed = 0
+        self.files_unchanged = 0
+        self.chunks_total = 0
+        self.chunks_reused = 0
+        self.chunks_deleted = 0
+        self.chunks_embedded = 0
+        self.chunks_upserted = 0
+        self.chunks_failed = 0
+        self.tokens_embedded = 0
+        self.retries = 0
+        self.errors: List[str] = []
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        self._published = 0.0
+
+    def error(self, message: str) -> None:
+        print(f"Ingestion {self.job_id}: {message}")
+        if len(self.errors) < 20:
+            self.errors.append(message)
+
+    def snapshot(self) -> Dict[str, Any]:
+        elapsed = (self.finished or time.monotonic()) - self.started
+        rate = (lambda n: round(n / elapsed, 1) if elapsed > 0 else 0.0)
+        return {
+            "job_id": self.job_id, "state": self.state, "elapsed_seconds": round(elapsed, 2),
+            "files_total": self.files_total, "files_done": self.files_done, "files_failed": self.files_failed,
+            "files_unchanged": self.files_unchanged, "chunks_reused": self.chunks_reused,
+            "chunks_deleted": self.chunks_deleted,
+            "chunks_total": self.chunks_total, "chunks_embedded": self.chunks_embedded,
+            "chunks_upserted": self.chunks_upserted, "chunks_failed": self.chunks_failed,
+            "tokens_embedded": self.tokens_embedded, "retries": self.retries,
+            "chunks_per_second": rate(self.chunks_upserted), "tokens_per_second": rate(self.tokens_embedded),
+            "errors": list(self.errors),
+        }
+
+    async def publish(self, force: bool = False) -> None:
+        """Writes the snapshot at most once a second (always with force)"""
+        now = time.monotonic()
+        if not force and now - self._published < 1.0:
+            return
+        self._published = now
+        from utils.shared_state import acall
+        await acall(_jobs(), "set", self.job_id, json.dumps(self.snapshot()), INGEST_JOB_TTL)
+
+
+_job_store = None
+
+
+def _jobs():
+    global _job_store
+    if _job_store is None:
+        from utils.shared_state import shared_state
+        _job_store = shared_state.namespace("ingest", max_local_entries=256)
+    return _job_store
+
+
+async def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    from utils.shared_state import acall
+    raw = await acall(_jobs(), "get", job_id)
+    return json.loads(raw) if raw else None
+
+
+class IngestionPipeline:
+    """Loads, splits, embeds and upserts a list of files into a Chroma vector store.
+
+    With a manifest, a file whose mtime and size (or else content hash) match
+    its entry is skipped; for a changed file only chunks missing from its
+    entry are embedded, and chunks no longer produced are deleted.
+    """
+
+    def __init__(self, embeddings: Any, vector_store: Any, chunk_size: int, chunk_overlap: int,
+                 manifest: Optional[IndexManifest] = None, keyword_index: Any = None,
+                 batch_size: int = EMBED_BATCH_SIZE, concurrency: int = EMBED_CONCURRENCY,
+                 upsert_batch_size: int = UPSERT_BATCH_SIZE):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.manifest = manifest
+        self.keyword_index = keyword_index
+        self.batch_size = batch_size
+        self.upsert_batch_size = upsert_batch_size
+        self._embed_slots = asyncio.Semaphore(concurrency)
+        self._load_slots = asyncio.Semaphore(max(1, INGEST_LOADER_PROCESSES))
+        self._max_pending = max(1, concurrency) * 2
+        self._upsert_lock = asyncio.Lock()
+        self._to_upsert: List[Tuple[str, str, Dict[str, Any], List[float]]] = []
+        # rel path -> chunks still to upsert, whether any failed, and its manifest entry once they are in
+        self._open_files: Dict[str, Dict[str, Any]] = {}
+
+    # --- Loading ---
+    def _changed(self, path: Path, rel: str) -> Optional[Dict[str, Any]]:
+        """None when the manifest shows the file is already indexed as is; else its new manifest fields"""
+        file_stat = path.stat()
+        previous = self.manifest.get(rel) if self.manifest is not None else None
+        if previous and previous["mtime_ns"] == file_stat.st_mtime_ns and previous["size"] == file_stat.st_size:
+            return None
+        sha256 = file_digest(path) if self.manifest is not None else ""
+        if previous and previous["sha256"] == sha256:
+            self.manifest.touch(rel, file_stat.st_mtime_ns)
+            return None
+        return {"mtime_ns": file_stat.st_mtime_ns, "size": file_stat.st_size, "sha256": sha256, "previous": previous}
+
+    async def _load(self, path: Path, rel: str, use_processes: bool):
+        pool = loader_pool() if use_processes else None
+        try:
+            state = await asyncio.to_thread(self._changed, path, rel)
+            if state is None:
+                return rel, None, None, None
+            if pool is not None:
+                # Bounded, so files waiting for a loader do not hold threads of the default executor
+                async with self._load_slots:
+                    try:
+                        chunks = await asyncio.to_thread(pool.load, str(path), rel, self.chunk_size, self.chunk_overlap)
+                    except OSError as e:
+                        print(f"Warning: Loader processes unavailable ({e}); loading in threads")
+                        chunks = await asyncio.to_thread(load_and_split, str(path), rel,
+                                                         self.chunk_size, self.chunk_overlap)
+            else:
+                chunks = await asyncio.to_thread(load_and_split, str(path), rel, self.chunk_size, self.chunk_overlap)
+            return rel, state, chunks, None
+        except Exception as e:
+            return rel, None, None, e
+
+    # --- Reconciling with the manifest ---
+    async def _reconcile(self, rel: str, state: Dict[str, Any], chunks: List[Tuple[str, str, Dict[str, Any]]],
+                         progress: IngestionProgress) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """Deletes the file's stale chunks and refreshes kept ones' metadata; returns the chunks to embed"""
+        if self.manifest is None:
+            return chunks
+        collection = self.vector_store._collection
+        previous = state["previous"]
+        new_ids = {cid for cid, _, _ in chunks}
+        async with self._upsert_lock:
+            if previous is None:
+                # Not in the manifest: clear whatever an earlier indexer (positional ids) left for this file
+                await asyncio.to_thread(collection.delete, where={"source_rel_path": rel})
+                if self.keyword_index is not None:
+                    await asyncio.to_thread(self.keyword_index.delete_source, rel)
+                fresh = chunks
+            else:
+                old_ids = set(previous["chunks"])
+                stale = list(old_ids - new_ids)
+                kept = [chunk for chunk in chunks if chunk[0] in old_ids]
+                fresh = [chunk for chunk in chunks if chunk[0] not in old_ids]
+                for i in range(0, len(stale), self.upsert_batch_size):
+                    await asyncio.to_thread(collection.delete, ids=stale[i:i + self.upsert_batch_size])
+                if self.keyword_index is not None:
+                    await asyncio.to_thread(self.keyword_index.delete, stale)
+                # Same text, possibly at a new position: metadata (e.g. start_index) is updated without re-embedding
+                for i in range(0, len(kept), self.upsert_batch_size):
+                    part = kept[i:i + self.upsert_batch_size]
+                    await asyncio.to_thread(collection.update, ids=[cid for cid, _, _ in part],
+                                            metadatas=[meta for _, _, meta in part])
+                progress.chunks_deleted += len(stale)
+                progress.chunks_reused += len(kept)
+        entry = (state["mtime_ns"], state["size"], state["sha256"],
+                 {cid: meta["chunk_hash"] for cid, _, meta in chunks})
+        self._open_files[rel] = {"remaining": len(fresh), "failed": False, "entry": entry}
+        if not fresh:
+            await self._close_file(rel)
+        return fresh
+
+    async def _chunks_settled(self, batch: List[Tuple[str, ...]], ok: bool) -> None:
+        counts: Dict[str, int] = {}
+        for chunk in batch:
+            rel = chunk[2]["source_rel_path"]
+            counts[rel] = counts.get(rel, 0) + 1
+        for rel, count in counts.items():
+            open_file = self._open_files.get(rel)
+            if open_file is None:
+                continue
+            open_file["remaining"] -= count
+            open_file["failed"] = open_file["failed"] or not ok
+            if open_file["remaining"] <= 0:
+                await self._close_file(rel)
+
+    async def _close_file(self, rel: str) -> None:
+        open_file = self._open_files.pop(rel)
+        if self.manifest is not None and not open_file["failed"]:
+            await asyncio.to_thread(self.manifest.record, rel, *open_file["entry"])
+
+    # --- Embedding ---
+    async def _embed(self, texts: List[str], progress: IngestionProgress) -> List[List[float]]:
+        attempt = 0
+        while True:
+            try:
+                async with self._embed_slots:
+                    return await asyncio.to_thread(self.embeddings.embed_documents, texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > EMBED_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                delay = min(EMBED_MAX_BACKOFF_SECONDS, EMBED_BACKOFF_SECONDS * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                progress.retries += 1
+                print(f"Embedding batch failed ({e}); retry {attempt}/{EMBED_MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _embed_and_store(self, batch: List[Tuple[str, str, Dict[str, Any]]], progress: IngestionProgress) -> None:
+        texts = [text for _, text, _ in batch]
+        try:
+            vectors = await self._embed(texts, progress)
+        except Exception as e:
+            progress.chunks_failed += len(batch)
+            progress.error(f"Embedding failed for {len(batch)} chunk(s): {e}")
+            await self._chunks_settled(batch, ok=False)
+            return
+        progress.chunks_embedded += len(batch)
+        progress.tokens_embedded += sum(len(t) for t in texts) // 4  # ~4 characters per token
+        self._to_upsert.extend((cid, text, meta, vector) for (cid, text, meta), vector in zip(batch, vectors))
+        if len(self._to_upsert) >= self.upsert_batch_size:
+            await self._flush_upserts(progress)
+        await progress.publish()
+
+    # --- Upserts ---
+    async def _flush_upserts(self, progress: IngestionProgress) -> None:
+        settled = []
+        async with self._upsert_lock:  # Chroma's SQLite has a single writer
+            while self._to_upsert:
+                batch = self._to_upsert[:self.upsert_batch_size]
+                del self._to_upsert[:self.upsert_batch_size]
+                try:
+                    await asyncio.to_thread(
+                        self.vector_store._collection.upsert,
+                        ids=[cid for cid, _, _, _ in batch],
+                        documents=[text for _, text, _, _ in batch],
+                        metadatas=[meta for _, _, meta, _ in batch],
+                        embeddings=[vector for _, _, _, vector in batch],
+                    )
+                    progress.chunks_upserted += len(batch)
+                    settled.append((batch, True))
+                    if self.keyword_index is not None:
+                        await self._index_keywords(batch)
+                except Exception as e:
+                    progress.chunks_failed += len(batch)
+                    progress.error(f"Upsert failed for {len(batch)} chunk(s): {e}")
+                    settled.append((batch, False))
+        for batch, ok in settled:
+            await self._chunks_settled(batch, ok)
+
+    async def _index_keywords(self, batch: List[Tuple[str, str, Dict[str, Any], List[float]]]) -> None:
+        try:
+            await asyncio.to_thread(self.keyword_index.upsert,
+                                    [(cid, text, meta.get("source_rel_path", "")) for cid, text, meta, _ in batch])
+        except Exception as e:
+            # Dense search still finds these chunks; the manifest entry is kept so the file is not re-embedded
+            print(f"Warning: Keyword index update failed for {len(batch)} chunk(s): {e}")
+
+    # --- Driver ---
+    async def run(self, files: List[Tuple[Path, str]], progress: Optional[IngestionProgress] = None) -> IngestionProgress:
+        progress = progress or IngestionProgress(uuid.uuid4().hex[:12], len(files))
+        await progress.publish(force=True)
+        use_processes = len(files) > 1
+        pending = set()
+        batch: List[Tuple[str, str, Dict[str, Any]]] = []
+        batch_chars = 0
+
+        async def submit(current):
+            pending.add(asyncio.ensure_future(self._embed_and_store(current, progress)))
+            if len(pending) >= self._max_pending:
+                # Backpressure: loaders may outrun the embedding API
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                pending.difference_update(done)
+
+        try:
+            for next_file in asyncio.as_completed([self._load(path, rel, use_processes) for path, rel in files]):
+                rel, state, chunks, error = await next_file
+                if error is not None:
+                    progress.files_failed += 1
+                    progress.error(f"{rel}: {error}")
+                    continue
+                progress.files_done += 1
+                if state is None:
+                    progress.files_unchanged += 1
+                    continue
+                try:
+                    chunks = await self._reconcile(rel, state, chunks, progress)
+                except Exception as e:
+                    progress.files_failed += 1
+                    progress.error(f"{rel}: could not remove stale chunks: {e}")
+                    continue
+                progress.chunks_total += len(chunks)
+                for chunk in chunks:
+                    batch.append(chunk)
+                    batch_chars += len(chunk[1])
+                    if len(batch) >= self.batch_size or batch_chars >= EMBED_BATCH_MAX_CHARS:
+                        await submit(batch)
+                        batch, batch_chars = [], 0
+            if batch:
+                await submit(batch)
+            if pending:
+                await asyncio.gather(*pending)
+            await self._flush_upserts(progress)
+            progress.state = "failed" if progress.chunks_upserted == 0 and (progress.files_failed or progress.chunks_failed) else "done"
+        except asyncio.CancelledError:
+            for task in pending:
+                task.cancel()
+            progress.state = "cancelled"
+            raise
+        except Exception as e:
+            progress.state = "failed"
+            progress.error(str(e))
+        finally:
+            progress.finished = time.monotonic()
+            try:
+                await progress.publish(force=True)
+            except Exception as e:
+                print(f"Warning: Could not publish ingestion progress: {e}")
+        snapshot = progress.snapshot()
+        print(f"Ingestion {progress.job_id} {progress.state}: {snapshot['files_done']}/{snapshot['files_total']} files "
+              f"({snapshot['files_unchanged']} unchanged), {snapshot['chunks_upserted']} chunks embedded, "
+              f"{snapshot['chunks_reused']} reused, {snapshot['chunks_deleted']} deleted, "
+              f"{snapshot['chunks_per_second']} chunks/s, {snapshot['tokens_per_second']} tokens/s")
+        return progress
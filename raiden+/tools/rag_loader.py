@@ -0,0 +1,52 @@
+"""Entry point of the document loader processes: python -m tools.rag_loader.
+
+Loaders are started as plain subprocesses, not through multiprocessing,
+so the server's main module (app.py) is never re-imported in them: a
+loader imports this module, tools.rag_ingest and the langchain loaders
+only. Requests and results are length-prefixed pickles on stdin/stdout;
+whatever the loaders print goes to stderr.
+"""
+import os
+import sys
+import pickle
+import struct
+from typing import Any, BinaryIO, Optional
+
+_HEADER = struct.Struct(">I")
+
+
+def write_frame(stream: BinaryIO, obj: Any) -> None:
+    data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+def read_frame(stream: BinaryIO) -> Optional[Any]:
+    """The next object, or None once the other side has closed the pipe"""
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    data = stream.read(_HEADER.unpack(header)[0])
+    return pickle.loads(data)
+
+
+def main() -> None:
+    requests = sys.stdin.buffer
+    results = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    # Keeps stray prints (Python or native) off the results pipe
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    from tools.rag_ingest import load_and_split
+
+    while True:
+        request = read_frame(requests)
+        if request is None:
+            break
+        try:
+            write_frame(results, ("ok", load_and_split(*request)))
+        except Exception as e:
+            # The exception itself may not pickle; its message is enough for the job's error list
+            write_frame(results, ("error", f"{type(e).__name__}: {e}"))
+
+
+if __name__ == "__main__":
+    main()
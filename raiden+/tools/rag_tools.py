@@ -3,10 +3,13 @@
 # sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
 
 import os
+import re
+import hashlib
 import traceback
+import uuid
 import asyncio
 from pathlib import Path
-from typing import List, Any
+from typing import Dict, List, Any, Tuple
 
 # --- Langchain Core ---
 from langchain_core.tools import tool
@@ -16,20 +19,16 @@ from langchain_core.runnables import RunnablePassthrough, RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
 
 # --- Langchain Community Components ---
-from langchain_community.document_loaders import (
-    PyMuPDFLoader,
-    Docx2txtLoader,
-    TextLoader,
-    UnstructuredMarkdownLoader,
-    CSVLoader,
-)
 from langchain_huggingface import HuggingFaceEmbeddings  # Updated import for embeddings
 from langchain_chroma import Chroma  # Updated import for Chroma vector store
 
-# --- Langchain Text Splitters ---
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-
 # --- Project Imports ---
+from utils.local_embeddings import LocalEmbeddings, LOCAL_EMBEDDING_MODEL
+from utils.embedding_cache import CachedEmbeddings, embedding_cache, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_DB
+from tools.rag_bm25 import KeywordIndex, backfill, fuse, is_keyword_query
+from tools.rag_ingest import (
+    IndexManifest, IngestionPipeline, IngestionProgress, SUPPORTED_EXTENSIONS, chunk_hash, get_job, resolve_files,
+)
 try:
     from app import WORKSPACE_DIR, color_text
 except ImportError:
@@ -41,38 +40,92 @@ except ImportError:
 VECTORSTORE_DIR = WORKSPACE_DIR / "vectorstore"
 VECTORSTORE_DIR.mkdir(exist_ok=True)
 EMBEDDING_MODEL = "models/text-embedding-004"  # Updated to Google's latest embedding model
+# "google", "local" (ONNX Runtime / sentence-transformers, works offline) or "auto" (google when GOOGLE_API_KEY is set)
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "auto").lower()
+if EMBEDDING_BACKEND == "auto":
+    EMBEDDING_BACKEND = "google" if os.environ.get("GOOGLE_API_KEY") else "local"
+DEFAULT_COLLECTION_NAME = "raiden_collection"
 CHUNK_SIZE = 1000
 CHUNK_OVERLAP = 150
+# BM25 keyword index over the same chunks, fused with vector search in query_documents
+HYBRID_SEARCH = os.environ.get("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes")
+# Excerpts returned per query, candidates taken from each ranking before fusion, and the vector relevance floor
+RAG_TOP_K = int(os.environ.get("RAG_TOP_K", "5"))
+RAG_FETCH_K = int(os.environ.get("RAG_FETCH_K", "20"))
+RAG_SCORE_THRESHOLD = float(os.environ.get("RAG_SCORE_THRESHOLD", "0.5"))
+EMBEDDING_CACHE_PATH = EMBEDDING_CACHE_DB or VECTORSTORE_DIR / "embedding_cache.sqlite3"
 
 # --- Global Variables ---
 embedding_function = None
+# Collection for the embedding model's vectors; set by initialize_rag_components
+collection_name = None
 vector_store = None
+manifest = None
+keyword_index = None
+
+def collection_for(model_id: str) -> str:
+    """Vectors from different models (or an int8 variant of one) cannot share a collection; the Google one keeps its original name"""
+    if model_id == EMBEDDING_MODEL:
+        return DEFAULT_COLLECTION_NAME
+    slug = re.sub(r"[^A-Za-z0-9_-]+", "-", model_id.split("/")[-1])
+    if len(slug) > 40:
+        # Truncated names keep a hash of the full id, so they stay distinct
+        slug = slug[:31] + "-" + hashlib.sha256(model_id.encode("utf-8")).hexdigest()[:8]
+    return f"{DEFAULT_COLLECTION_NAME}_{slug}"
+
+def store_path(kind: str, collection: str) -> Path:
+    """SQLite file of the manifest or keyword index kept for a collection"""
+    return VECTORSTORE_DIR / (f"{kind}.sqlite3" if collection == DEFAULT_COLLECTION_NAME else f"{kind}_{collection}.sqlite3")
 
 def initialize_rag_components():
-    """Initialize RAG components with Google's text-embedding-004"""
-    global embedding_function, vector_store
+    """Initialize RAG components with Google's text-embedding-004 or a local embedding model"""
+    global embedding_function, vector_store, keyword_index, collection_name
     try:
         if embedding_function is None:
             try:
-                from langchain_google_genai import GoogleGenerativeAIEmbeddings
-                print(color_text(f"Initializing Google embeddings model: {EMBEDDING_MODEL}", "CYAN"))
-                embedding_function = GoogleGenerativeAIEmbeddings(
-                    model=EMBEDDING_MODEL,
-                    google_api_key=os.environ.get("GOOGLE_API_KEY")
-                )
-                print(color_text("Google embeddings initialized.", "GREEN"))
+                if EMBEDDING_BACKEND == "local":
+                    device = "cuda" if _is_cuda_available() else "cpu"
+                    print(color_text(f"Initializing local embeddings model: {LOCAL_EMBEDDING_MODEL} ({device})", "CYAN"))
+                    embedding_function = LocalEmbeddings(LOCAL_EMBEDDING_MODEL, device=device)
+                    model_id = embedding_function.model_id
+                    print(color_text("Local embeddings initialized.", "GREEN"))
+                else:
+                    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+                    print(color_text(f"Initializing Google embeddings model: {EMBEDDING_MODEL}", "CYAN"))
+                    embedding_function = GoogleGenerativeAIEmbeddings(
+                        model=EMBEDDING_MODEL,
+                        google_api_key=os.environ.get("GOOGLE_API_KEY")
+                    )
+                    model_id = EMBEDDING_MODEL
+                    print(color_text("Google embeddings initialized.", "GREEN"))
+                collection_name = collection_for(model_id)
+                # Identical chunks (re-indexed, or under another file name) are embedded once
+                if EMBEDDING_CACHE_ENABLED and embedding_cache.open(EMBEDDING_CACHE_PATH):
+                    embedding_function = CachedEmbeddings(embedding_function, embedding_cache, model_id)
             except Exception as e:
-                print(color_text(f"Warning: Failed to initialize Google embeddings: {e}", "YELLOW"))
+                print(color_text(f"Warning: Failed to initialize {EMBEDDING_BACKEND} embeddings: {e}", "YELLOW"))
                 embedding_function = None
 
-        if vector_store is None:
-            print(color_text(f"Initializing vector store at: {VECTORSTORE_DIR}", "CYAN"))
+        # The collection is named after the model, so it waits for the embeddings
+        if vector_store is None and embedding_function is not None:
+            print(color_text(f"Initializing vector store at: {VECTORSTORE_DIR} ({collection_name})", "CYAN"))
             vector_store = Chroma(
                 persist_directory=str(VECTORSTORE_DIR.resolve()),
                 embedding_function=embedding_function,
-                collection_name="raiden_collection"  # Ensure a collection name is provided
+                collection_name=collection_name
             )
             print(color_text("Vector store initialized.", "GREEN"))
+
+        if HYBRID_SEARCH and keyword_index is None and vector_store is not None:
+            try:
+                keyword_index = KeywordIndex(store_path("keywords", collection_name))
+                if keyword_index.count() == 0 and vector_store._collection.count() > 0:
+                    # Documents indexed before the keyword index existed
+                    added = backfill(keyword_index, vector_store._collection)
+                    print(color_text(f"Keyword index built from {added} existing chunk(s).", "GREEN"))
+            except Exception as e:
+                print(color_text(f"Warning: Keyword index unavailable, vector search only: {e}", "YELLOW"))
+                keyword_index = None
     except Exception as e:
         print(color_text(f"Error initializing RAG components: {e}", "RED"))
         traceback.print_exc()
@@ -84,45 +137,61 @@ def _is_cuda_available():
     except ImportError:
         return False
 
-initialize_rag_components()
-
-def _get_document_loader(file_path: Path):
-    extension = file_path.suffix.lower()
-    str_file_path = str(file_path.resolve())
-    if extension == ".pdf":
-        return PyMuPDFLoader(str_file_path)
-    elif extension == ".docx":
-        return Docx2txtLoader(str_file_path)
-    elif extension == ".txt":
-        return TextLoader(str_file_path, encoding="utf-8")
-    elif extension == ".md":
-        return UnstructuredMarkdownLoader(str_file_path, mode="elements")
-    elif extension == ".csv":
-        return CSVLoader(str_file_path, encoding="utf-8")
-    else:
-        print(color_text(f"Unsupported file type: {extension}", "YELLOW"))
-        return None
-
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=CHUNK_SIZE,
-    chunk_overlap=CHUNK_OVERLAP,
-    length_function=len,
-    add_start_index=True,
-)
+async def _ensure_rag_components():
+    """Initializes the embeddings and vector store on first use (off the event loop)"""
+    if vector_store is None or embedding_function is None:
+        await asyncio.to_thread(initialize_rag_components)
+
+# Seconds index_documents waits for its job before returning the job id (under TOOL_CALL_TIMEOUT)
+INGEST_TOOL_WAIT = float(os.environ.get("INGEST_TOOL_WAIT", "45"))
+
+# Running ingestion jobs, kept referenced so they are not garbage collected mid-run
+_ingest_tasks: Dict[str, asyncio.Task] = {}
+
+def _pipeline() -> IngestionPipeline:
+    global manifest
+    if manifest is None:
+        try:
+            # Per-file record of what is indexed, so re-indexing embeds only new chunks
+            manifest = IndexManifest(store_path("manifest", collection_name))
+        except Exception as e:
+            print(color_text(f"Warning: Index manifest unavailable, re-indexing embeds every chunk: {e}", "YELLOW"))
+    return IngestionPipeline(embedding_function, vector_store, CHUNK_SIZE, CHUNK_OVERLAP, manifest=manifest,
+                             keyword_index=keyword_index)
+
+async def start_ingestion(files: List[Tuple[Path, str]]) -> Tuple[IngestionProgress, asyncio.Task]:
+    """Starts a background ingestion job for (path, workspace-relative path) pairs"""
+    await _ensure_rag_components()
+    if vector_store is None or embedding_function is None:
+        raise RuntimeError("RAG components not initialized. Cannot index documents.")
+    progress = IngestionProgress(uuid.uuid4().hex[:12], len(files))
+    await progress.publish(force=True)
+    task = asyncio.create_task(_pipeline().run(files, progress))
+    _ingest_tasks[progress.job_id] = task
+    task.add_done_callback(lambda _: _ingest_tasks.pop(progress.job_id, None))
+    return progress, task
+
+def _summarize(s: Dict[str, Any]) -> str:
+    summary = (f"{s['files_done']}/{s['files_total']} file(s) ({s['files_unchanged']} unchanged), "
+               f"{s['chunks_upserted']} chunk(s) embedded, {s['chunks_reused']} reused, {s['chunks_deleted']} removed "
+               f"in {s['elapsed_seconds']}s ({s['chunks_per_second']} chunks/s, {s['tokens_per_second']} tokens/s)")
+    if s["errors"]:
+        summary += "\nErrors:\n" + "\n".join(f"- {e}" for e in s["errors"])
+    return summary
 
 @tool
 async def index_document(file_path: str) -> str:
     """
     Indexes a document into the vector store for semantic search.
-    
+
     Args:
         file_path (str): The path to the document to be indexed.
-    
+
     Returns:
         str: A message indicating the success or failure of the indexing process.
     """
-    global vector_store, embedding_function
     print(color_text(f"--- RAG: Indexing Document: {file_path} ---", "CYAN"))
+    await _ensure_rag_components()
 
     if vector_store is None or embedding_function is None:
         return "Error: RAG components not initialized. Cannot index document."
@@ -133,30 +202,76 @@ async def index_document(file_path: str) -> str:
 
         if not safe_doc_path.is_file():
             return f"Error: Document not found at workspace path: '{file_path}'"
-
-        loader = _get_document_loader(safe_doc_path)
-        if loader is None:
+        if safe_doc_path.suffix.lower() not in SUPPORTED_EXTENSIONS:
             return f"Error: Unsupported file type for document: '{file_path}'"
 
-        docs = await asyncio.to_thread(loader.load)
-        if not docs:
+        # A large document outlasts the tool call timeout; it then finishes as a background job
+        progress, task = await start_ingestion([(safe_doc_path, file_path)])
+        done, _ = await asyncio.wait({task}, timeout=INGEST_TOOL_WAIT)
+        if not done:
+            return (f"Indexing '{file_path}' continues in the background as job '{progress.job_id}'. "
+                    f"Progress so far: {_summarize(progress.snapshot())}. Check it with ingestion_status.")
+        progress = task.result()
+        if progress.errors:
+            return f"Error indexing document '{file_path}': {progress.errors[0]}"
+        if progress.files_unchanged:
+            return f"Document '{file_path}' is already indexed and unchanged. It can be queried."
+        if progress.chunks_upserted == 0 and progress.chunks_reused == 0:
             return f"Error: Could not load any content from document: '{file_path}'"
 
-        for doc in docs:
-            doc.metadata["source_rel_path"] = file_path
+        return (f"Successfully indexed document '{file_path}' ({progress.chunks_upserted} new chunk(s), "
+                f"{progress.chunks_reused} unchanged, {progress.chunks_deleted} removed). It can now be queried.")
+    except Exception as e:
+        print(color_text(f"Error indexing document '{file_path}': {e}", "RED"))
+        traceback.print_exc()
+        return f"Error indexing document '{file_path}': {e}"
 
-        chunks = await asyncio.to_thread(text_splitter.split_documents, docs)
-        if not chunks:
-            return f"Error: Failed to split document '{file_path}' into chunks."
+@tool
+async def index_documents(pattern: str) -> str:
+    """
+    Indexes many workspace documents at once, e.g. every PDF in a folder.
 
-        ids = [f"{file_path}_{i}" for i in range(len(chunks))]
-        await asyncio.to_thread(vector_store.add_documents, documents=chunks, ids=ids)
+    Args:
+        pattern (str): A workspace glob such as 'reports/**/*.pdf' or 'docs/*', or a comma-separated list of paths.
 
-        return f"Successfully indexed document '{file_path}'. It can now be queried."
+    Returns:
+        str: A summary with throughput, or a job id to check with ingestion_status if indexing is still running.
+    """
+    print(color_text(f"--- RAG: Indexing Documents: {pattern} ---", "CYAN"))
+    try:
+        if any(c in pattern for c in "*?["):
+            files = await asyncio.to_thread(resolve_files, WORKSPACE_DIR, pattern=pattern)
+        else:
+            files = await asyncio.to_thread(resolve_files, WORKSPACE_DIR, paths=pattern.split(","))
+        if not files:
+            return f"No supported documents (PDF, DOCX, TXT, MD, CSV) match '{pattern}' in the workspace."
+
+        progress, task = await start_ingestion(files)
+        done, _ = await asyncio.wait({task}, timeout=INGEST_TOOL_WAIT)
+        if not done:
+            return (f"Indexing {len(files)} document(s) continues in the background as job '{progress.job_id}'. "
+                    f"Progress so far: {_summarize(progress.snapshot())}. Check it with ingestion_status.")
+        return f"Indexing {progress.state}: {_summarize(progress.snapshot())}"
     except Exception as e:
-        print(color_text(f"Error indexing document '{file_path}': {e}", "RED"))
+        print(color_text(f"Error indexing documents '{pattern}': {e}", "RED"))
         traceback.print_exc()
-        return f"Error indexing document '{file_path}': {e}"
+        return f"Error indexing documents '{pattern}': {e}"
+
+@tool
+async def ingestion_status(job_id: str) -> str:
+    """
+    Reports the progress of a background indexing job started by index_document or index_documents.
+
+    Args:
+        job_id (str): The job id index_document or index_documents returned.
+
+    Returns:
+        str: The job's state, counts and throughput.
+    """
+    status = await get_job(job_id.strip())
+    if status is None:
+        return f"No indexing job '{job_id}' found."
+    return f"Job '{status['job_id']}' is {status['state']}: {_summarize(status)}"
 
 RAG_PROMPT_TEMPLATE = """You are Raiden, an AI assistant. Answer the following question based *only* on the provided context. If the context doesn't contain the answer, state clearly that you cannot answer based on the provided documents. Be concise and helpful.
 
@@ -173,7 +288,7 @@ rag_prompt = ChatPromptTemplate.from_template(RAG_PROMPT_TEMPLATE)
 @tool
 async def query_documents(query: str) -> str:
     """
-    Queries the vector store to retrieve relevant documents based on the input query.
+    Queries the indexed documents (vector and keyword search) for excerpts relevant to the input query.
     
     Args:
         query (str): The search query.
@@ -183,25 +298,32 @@ async def query_documents(query: str) -> str:
     """
     global vector_store
     print(color_text(f"--- RAG: Querying Documents: '{query}' ---", "CYAN"))
+    await _ensure_rag_components()
 
     if vector_store is None:
         return "Error: Vector store not initialized. Cannot query documents."
 
     try:
-        retriever = vector_store.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={'k': 5, 'score_threshold': 0.5}
-        )
-
-        def format_docs(docs: List[Document]) -> str:
-            return "\n\n".join(f"Source: {doc.metadata.get('source_rel_path', 'Unknown')}\nContent: {doc.page_content}" for doc in docs)
-
-        # Fetch documents first
-        docs = await asyncio.to_thread(retriever.get_relevant_documents, query)
-        if not docs:
+        # (source, text) hits from the BM25 index; exact identifiers, codes and file names rank here
+        keyword_hits = []
+        if keyword_index is not None:
+            found = await asyncio.to_thread(keyword_index.search, query, RAG_FETCH_K)
+            keyword_hits = [(source, text) for _, text, source, _ in found]
+
+        if keyword_hits and is_keyword_query(query):
+            # Keyword-heavy query: BM25 alone ranks it well, and the query needs no embedding call
+            hits = keyword_hits[:RAG_TOP_K]
+        else:
+            scored = await asyncio.to_thread(vector_store.similarity_search_with_relevance_scores, query, k=RAG_FETCH_K)
+            vector_hits = [(doc.metadata.get('source_rel_path', 'Unknown'), doc.page_content)
+                           for doc, score in scored if score >= RAG_SCORE_THRESHOLD]
+            # Reciprocal rank fusion of both rankings; the same chunk found by both counts twice
+            hits = fuse([vector_hits, keyword_hits], key=lambda hit: (hit[0], chunk_hash(hit[1])))[:RAG_TOP_K]
+
+        if not hits:
             return "No relevant documents found for your query."
 
-        formatted_context = format_docs(docs)
+        formatted_context = "\n\n".join(f"Source: {source}\nContent: {text}" for source, text in hits)
         
         response = f"Here are the relevant document excerpts for your query:\n\n{formatted_context}"
         return response
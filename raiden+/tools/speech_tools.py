@@ -17,10 +17,18 @@ except ImportError:
             raise ValueError("Path traversal attempt detected.")
         return target_path
 
-# Initialize AWS Polly client
+# AWS Polly client, built by init_polly_client() (app warm-up, or the first speech tool call)
 polly_client = None
-if (aws_access_key_id := os.environ.get("AWS_ACCESS_KEY_ID")) and \
-   (aws_secret_access_key := os.environ.get("AWS_SECRET_ACCESS_KEY")):
+
+def init_polly_client():
+    """Builds the Polly client if AWS credentials are set. Returns False when they are missing."""
+    global polly_client
+    if polly_client is not None:
+        return True
+    aws_access_key_id = os.environ.get("AWS_ACCESS_KEY_ID")
+    aws_secret_access_key = os.environ.get("AWS_SECRET_ACCESS_KEY")
+    if not (aws_access_key_id and aws_secret_access_key):
+        return False
     try:
         polly_client = boto3.client(
             'polly',
@@ -29,8 +37,16 @@ if (aws_access_key_id := os.environ.get("AWS_ACCESS_KEY_ID")) and \
             region_name=os.environ.get("AWS_REGION", "us-east-1")
         )
         print(color_text("AWS Polly client initialized.", "GREEN"))
+        return True
     except Exception as e:
         print(color_text(f"Error initializing AWS Polly: {e}", "RED"))
+        raise
+
+def _polly_available() -> bool:
+    try:
+        return bool(init_polly_client())
+    except Exception:
+        return False
 
 # Voice presets for different use cases
 VOICE_PRESETS = {
@@ -62,7 +78,7 @@ def text_to_speech(
     Returns:
         str: Path to the generated audio file or error message
     """
-    if not polly_client:
+    if not polly_client and not _polly_available():
         return "Error: AWS Polly client not available. Check AWS credentials."
     
     print(color_text(f"--- Converting to Speech: {voice_preset} voice ---", "CYAN"))
@@ -117,7 +133,7 @@ def text_to_speech(
 @tool
 def get_available_voices() -> str:
     """Lists all available AWS Polly voices with their details."""
-    if not polly_client:
+    if not polly_client and not _polly_available():
         return "Error: AWS Polly client not available. Check AWS credentials."
     
     try:
@@ -173,7 +189,7 @@ def create_speech_with_effects(
     Returns:
         str: Path to the generated audio file or error message
     """
-    if not polly_client:
+    if not polly_client and not _polly_available():
         return "Error: AWS Polly client not available. Check AWS credentials."
     
     try:
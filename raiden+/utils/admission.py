@@ -0,0 +1,285 @@
+import os
+import math
+import hashlib
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.shared_state import shared_state
+
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# "memory" keeps buckets per worker; "redis" shares them through SHARED_STATE_URL
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory").lower()
+# Token buckets as (requests per minute, burst). API keys get the authenticated rate,
+# anonymous clients are limited per IP; every session also has its own bucket.
+RATE_LIMITS = {
+    "key": (float(os.environ.get("RATE_LIMIT_KEY_PER_MINUTE", "100")), float(os.environ.get("RATE_LIMIT_KEY_BURST", "20"))),
+    "client": (float(os.environ.get("RATE_LIMIT_CLIENT_PER_MINUTE", "60")), float(os.environ.get("RATE_LIMIT_CLIENT_BURST", "10"))),
+    "session": (float(os.environ.get("RATE_LIMIT_SESSION_PER_MINUTE", "30")), float(os.environ.get("RATE_LIMIT_SESSION_BURST", "5"))),
+}
+# Idle buckets kept in memory; the least recently used are dropped (a dropped bucket starts full)
+RATE_LIMIT_MAX_BUCKETS = int(os.environ.get("RATE_LIMIT_MAX_BUCKETS", "10000"))
+
+# Chat runs executing at once in this worker; further requests wait in a bounded queue
+MAX_INFLIGHT_CHATS = int(os.environ.get("MAX_INFLIGHT_CHATS", "32"))
+CHAT_QUEUE_SIZE = int(os.environ.get("CHAT_QUEUE_SIZE", "64"))
+# Seconds a queued request waits for a slot before it is rejected
+CHAT_QUEUE_TIMEOUT = float(os.environ.get("CHAT_QUEUE_TIMEOUT", "10"))
+# Chat runs one session may have in flight (e.g. several open tabs)
+MAX_INFLIGHT_PER_SESSION = int(os.environ.get("MAX_INFLIGHT_PER_SESSION", "2"))
+# Identify anonymous clients by X-Forwarded-For (only behind a proxy that sets it)
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+
+# Atomic token bucket: KEYS[1] = bucket, ARGV = rate per second, burst, now, cost.
+# Returns {allowed, seconds until enough tokens}.
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return {allowed, tostring(wait)}
+"""
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a request is refused; rendered as 429 with Retry-After by rate_limit_handler"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucketLimiter:
+    """Token buckets per (kind, identity), in memory or in Redis.
+
+    A bucket holds up to `burst` tokens and refills at its per-minute rate;
+    each request takes one token. A refused request learns how long until a
+    token is available, which becomes its Retry-After.
+    """
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS,
+                 backend: str = RATE_LIMIT_BACKEND, max_buckets: int = RATE_LIMIT_MAX_BUCKETS):
+        self.limits = limits
+        self.max_buckets = max_buckets
+        # "kind:identity" -> (tokens, time of last refill)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._script = None
+        if backend == "redis":
+            if shared_state.shared:
+                self._script = shared_state.client.register_script(_TOKEN_BUCKET_LUA)
+            else:
+                print("Warning: RATE_LIMIT_BACKEND=redis without SHARED_STATE_URL; rate limits are per worker")
+        self.rejected: Dict[str, int] = {kind: 0 for kind in limits}
+
+    @property
+    def shared(self) -> bool:
+        return self._script is not None
+
+    def _take_local(self, bucket: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(bucket, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[bucket] = (tokens, now)
+            self._buckets.move_to_end(bucket)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def _take_shared(self, bucket: str, rate: float, burst: float) -> float:
+        try:
+            allowed, wait = self._script(keys=[f"{shared_state.prefix}:ratelimit:{bucket}"],
+                                         args=[rate, burst, time.time(), 1])
+        except Exception as e:
+            # Redis trouble must not take the API down; fall back to this worker's buckets
+            print(f"Warning: Shared rate limiter unavailable ({e}); using local buckets")
+            return self._take_local(bucket, rate, burst)
+        return 0.0 if int(allowed) else float(wait)
+
+    def check(self, kind: str, identity: str) -> float:
+        """Takes a token from the bucket; returns 0 when allowed, else seconds until a retry can succeed"""
+        per_minute, burst = self.limits[kind]
+        if per_minute <= 0:
+            return 0.0
+        rate = per_minute / 60.0
+        bucket = f"{kind}:{identity}"
+        wait = self._take_shared(bucket, rate, burst) if self._script is not None else self._take_local(bucket, rate, burst)
+        if wait > 0:
+            with self._lock:
+                self.rejected[kind] += 1
+        return wait
+
+    async def acheck(self, kind: str, identity: str) -> float:
+        if self._script is not None:
+            return await asyncio.to_thread(self.check, kind, identity)
+        return self.check(kind, identity)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"backend": "redis" if self.shared else "memory", "buckets": len(self._buckets),
+                    "rejected": dict(self.rejected)}
+
+
+class AdmissionController:
+    """Caps the chat runs in flight in this worker, with a bounded wait queue and per-session caps.
+
+    Requests beyond `max_inflight` wait for a slot; when `queue_size`
+    requests are already waiting, or a slot does not free up within
+    `queue_timeout`, the request is refused at once instead of piling up
+    behind provider timeouts.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT_CHATS, queue_size: int = CHAT_QUEUE_SIZE,
+                 queue_timeout: float = CHAT_QUEUE_TIMEOUT, per_session: int = MAX_INFLIGHT_PER_SESSION):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.per_session = per_session
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.inflight = 0
+        self.waiting = 0
+        self._sessions: Dict[str, int] = {}
+        self.rejected = {"queue_full": 0, "queue_timeout": 0, "session": 0}
+        # Recent run times, for a Retry-After that reflects how fast slots free up
+        self._avg_seconds = 5.0
+
+    def _sem(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_inflight)
+        return self._semaphore
+
+    def _retry_after(self) -> float:
+        return self._avg_seconds * (self.waiting + 1) / max(1, self.max_inflight)
+
+    async def acquire(self, session_id: Optional[str]) -> None:
+        """Takes a slot for a chat run or raises RateLimitExceeded; pair with release()"""
+        if session_id:
+            if self._sessions.get(session_id, 0) >= self.per_session:
+                self.rejected["session"] += 1
+                raise RateLimitExceeded("Too many concurrent requests for this session", self._avg_seconds)
+            # Counted while queued too, so one session cannot fill the queue
+            self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            self._release_session(session_id)
+            raise
+        self.inflight += 1
+
+    async def _acquire_slot(self) -> None:
+        if self.max_inflight <= 0:
+            return  # Global cap disabled
+        semaphore = self._sem()
+        if not semaphore.locked():
+            await semaphore.acquire()
+            return
+        if self.waiting >= self.queue_size:
+            self.rejected["queue_full"] += 1
+            raise RateLimitExceeded("Server is at capacity", self._retry_after())
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected["queue_timeout"] += 1
+            raise RateLimitExceeded("Server is at capacity", self._retry_after())
+        finally:
+            self.waiting -= 1
+
+    def _release_session(self, session_id: Optional[str]) -> None:
+        if not session_id:
+            return
+        remaining = self._sessions.get(session_id, 1) - 1
+        if remaining > 0:
+            self._sessions[session_id] = remaining
+        else:
+            self._sessions.pop(session_id, None)
+
+    def release(self, session_id: Optional[str], seconds: Optional[float] = None) -> None:
+        self.inflight -= 1
+        self._release_session(session_id)
+        if seconds is not None:
+            self._avg_seconds = 0.9 * self._avg_seconds + 0.1 * seconds
+        if self.max_inflight > 0:
+            self._sem().release()
+
+    @asynccontextmanager
+    async def slot(self, session_id: Optional[str]):
+        await self.acquire(session_id)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(session_id, time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"inflight": self.inflight, "waiting": self.waiting, "max_inflight": self.max_inflight,
+                "queue_size": self.queue_size, "avg_seconds": round(self._avg_seconds, 3),
+                "rejected": dict(self.rejected)}
+
+
+def _valid_api_key(api_key: str) -> bool:
+    try:
+        from security import security_manager  # Imported lazily: security imports from this module
+    except ImportError:
+        return False
+    return security_manager.is_valid_key(api_key)
+
+
+def client_identity(headers: Any, client_host: Optional[str],
+                    key_validator: Callable[[str], bool] = _valid_api_key) -> Tuple[str, str]:
+    """("key", hashed api key) for a key SecurityManager accepts, else ("client", client address).
+
+    Unvalidated keys are ignored: otherwise a client could rotate the header
+    to get a fresh key-tier bucket per request and escape its address's limit.
+    """
+    authorization = headers.get("authorization") or ""
+    api_key = headers.get("x-api-key") or (authorization[7:].strip() if authorization.lower().startswith("bearer ") else "")
+    if api_key and key_validator(api_key):
+        # Hashed so raw keys never end up in bucket names (or Redis)
+        return "key", hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:32]
+    if RATE_LIMIT_TRUST_FORWARDED and headers.get("x-forwarded-for"):
+        return "client", headers["x-forwarded-for"].split(",")[0].strip()
+    return "client", client_host or "unknown"
+
+
+async def check_rate_limits(headers: Any, client_host: Optional[str], session_id: Optional[str]) -> None:
+    """Takes a token from the caller's and the session's buckets; raises RateLimitExceeded when either is empty"""
+    if not RATE_LIMIT_ENABLED:
+        return
+    kind, identity = client_identity(headers, client_host)
+    wait = await rate_limiter.acheck(kind, identity)
+    if wait > 0:
+        raise RateLimitExceeded("Rate limit exceeded", wait)
+    if session_id:
+        wait = await rate_limiter.acheck("session", session_id)
+        if wait > 0:
+            raise RateLimitExceeded("Rate limit exceeded for this session", wait)
+
+
+rate_limiter = TokenBucketLimiter()
+admission = AdmissionController()
@@ -0,0 +1,33 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# Threads for blocking file and database work started from request handlers
+IO_THREADS = int(os.environ.get("IO_THREADS", "8"))
+# Bytes read from an upload and written to disk per step (see utils/uploads.py)
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+
+
+def io_pool() -> ThreadPoolExecutor:
+    """Dedicated pool, so slow disk or SQLite work cannot starve the default executor (used by to_thread)"""
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_THREADS, thread_name_prefix="raiden-io")
+    return _io_pool
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Runs a blocking call on the I/O pool and awaits its result"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), functools.partial(func, *args, **kwargs))
+
+
+def shutdown() -> None:
+    global _io_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
@@ -0,0 +1,212 @@
+import os
+import json
+import hashlib
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+from utils.shared_state import shared_state, acall
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character estimate
+    tiktoken = None
+
+# Prompt-token budget per provider (input side only; completion tokens are separate)
+PROVIDER_TOKEN_BUDGETS = {
+    "ChatGroq": 6000,                  # Keeps requests under Groq's per-minute token limits
+    "ChatGoogleGenerativeAI": 32000,
+    "ChatTogether": 6000,              # Llama 3 70B has an 8K context window
+    "ChatDeepSeek": 32000,
+}
+DEFAULT_TOKEN_BUDGET = 8000
+# Overrides every provider budget when set
+CONTEXT_TOKEN_BUDGET = os.environ.get("CONTEXT_TOKEN_BUDGET")
+
+# tiktoken encoding used to count tokens for each provider; others use the default
+PROVIDER_ENCODINGS = {
+    "ChatGroq": "cl100k_base",
+    "ChatTogether": "cl100k_base",
+    "ChatDeepSeek": "cl100k_base",
+    "ChatGoogleGenerativeAI": "cl100k_base",  # Approximation; Gemini counting needs a network call
+}
+DEFAULT_ENCODING = "cl100k_base"
+
+# Per-message overhead for role markers and separators
+MESSAGE_TOKEN_OVERHEAD = 4
+# Longest excerpt of a single message passed to the summarizer
+SUMMARY_EXCERPT_CHARS = 2000
+# Seconds an idle session's rolling summary stays in the shared backend
+SUMMARY_CACHE_TTL = float(os.environ.get("SUMMARY_CACHE_TTL", "86400"))
+# Tag used to keep summarizer tokens out of the /chat/stream output
+INTERNAL_RUN_TAG = "raiden_internal"
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and the assistant Raiden.
+Keep facts, decisions, user preferences, file names, tool results that matter later and open tasks.
+Be concise. Reply with the updated summary only.
+
+Current summary:
+{summary}
+
+New messages to fold in:
+{transcript}"""
+
+
+class ContextWindowManager:
+    """Keeps the prompt within a per-provider token budget.
+
+    The newest turns are sent verbatim; older turns are folded into a rolling
+    summary produced by the model and persisted as the session summary.
+    """
+
+    def __init__(self, max_sessions: int = 256):
+        self.max_sessions = max_sessions
+        # session_id -> JSON {"summary": text, "folded": fingerprints of the folded messages still in the history}
+        self._summaries = shared_state.namespace("summary", max_local_entries=max_sessions)
+        self._encodings: Dict[str, Any] = {}
+
+    # --- Token counting ---
+    def _encoding(self, provider: str):
+        if tiktoken is None:
+            return None
+        name = PROVIDER_ENCODINGS.get(provider, DEFAULT_ENCODING)
+        if name not in self._encodings:
+            try:
+                self._encodings[name] = tiktoken.get_encoding(name)
+            except Exception as e:
+                print(f"Warning: tiktoken encoding '{name}' unavailable, estimating tokens: {e}")
+                self._encodings[name] = None
+        return self._encodings[name]
+
+    def count_tokens(self, message: BaseMessage, provider: str) -> int:
+        text = message.content if isinstance(message.content, str) else str(message.content)
+        if getattr(message, "tool_calls", None):
+            text += str(message.tool_calls)
+        encoding = self._encoding(provider)
+        if encoding is None:
+            return len(text) // 4 + MESSAGE_TOKEN_OVERHEAD
+        return len(encoding.encode(text, disallowed_special=())) + MESSAGE_TOKEN_OVERHEAD
+
+    @staticmethod
+    def token_budget(provider: str) -> int:
+        if CONTEXT_TOKEN_BUDGET:
+            return int(CONTEXT_TOKEN_BUDGET)
+        return PROVIDER_TOKEN_BUDGETS.get(provider, DEFAULT_TOKEN_BUDGET)
+
+    # --- Trimming ---
+    @staticmethod
+    def _split_turns(messages: List[BaseMessage]) -> List[List[BaseMessage]]:
+        """Group messages into turns that each start at a user message"""
+        turns: List[List[BaseMessage]] = []
+        for msg in messages:
+            if isinstance(msg, HumanMessage) or not turns:
+                turns.append([])
+            turns[-1].append(msg)
+        return turns
+
+    def _trim(self, messages: List[BaseMessage], provider: str,
+              budget: int) -> Tuple[List[BaseMessage], List[BaseMessage], List[BaseMessage]]:
+        """Returns (leading system messages, dropped messages, kept messages)"""
+        head = 0
+        while head < len(messages) and isinstance(messages[head], SystemMessage):
+            head += 1
+        system_messages, body = messages[:head], messages[head:]
+
+        remaining = budget - sum(self.count_tokens(m, provider) for m in system_messages)
+        turns = self._split_turns(body)
+        kept_turns: List[List[BaseMessage]] = []
+        for turn in reversed(turns):
+            cost = sum(self.count_tokens(m, provider) for m in turn)
+            # The current turn is always kept so an in-flight tool loop stays intact
+            if kept_turns and cost > remaining:
+                break
+            kept_turns.insert(0, turn)
+            remaining -= cost
+
+        kept = [m for turn in kept_turns for m in turn]
+        dropped = body[:len(body) - len(kept)]
+        return system_messages, dropped, kept
+
+    # --- Rolling summary ---
+    @staticmethod
+    def _fingerprint(message: BaseMessage) -> str:
+        raw = f"{message.__class__.__name__}:{message.content}:{getattr(message, 'tool_call_id', '')}"
+        return hashlib.sha1(raw.encode("utf-8", errors="replace")).hexdigest()
+
+    @staticmethod
+    def _transcript(messages: List[BaseMessage]) -> str:
+        labels = {HumanMessage: "User", AIMessage: "Assistant", ToolMessage: "Tool result", SystemMessage: "Note"}
+        lines = []
+        for msg in messages:
+            content = msg.content if isinstance(msg.content, str) else str(msg.content)
+            if len(content) > SUMMARY_EXCERPT_CHARS:
+                content = content[:SUMMARY_EXCERPT_CHARS] + " ... [truncated]"
+            if isinstance(msg, AIMessage) and msg.tool_calls:
+                content += " [called: " + ", ".join(tc["name"] for tc in msg.tool_calls) + "]"
+            lines.append(f"{labels.get(type(msg), 'Message')}: {content}")
+        return "\n".join(lines)
+
+    async def get_summary(self, session_id: Optional[str]) -> Optional[str]:
+        """Current rolling summary of a session, if any turns were folded"""
+        if not session_id:
+            return None
+        raw = await acall(self._summaries, "get", session_id)
+        return json.loads(raw)["summary"] if raw else None
+
+    async def _load_summary(self, session_id: str, memory) -> Tuple[str, Set[str]]:
+        raw = await acall(self._summaries, "get", session_id)
+        if raw:
+            entry = json.loads(raw)
+            return entry["summary"], set(entry["folded"])
+        # Not cached (restart, expired, another host): the database copy knows what it already covers
+        stored = await memory.aget_conversation_summary(session_id) if memory is not None else None
+        if not stored:
+            return "", set()
+        return stored["summary"], set(stored.get("folded") or [])
+
+    async def _store_summary(self, session_id: str, summary: str, folded: Set[str], memory) -> None:
+        raw = json.dumps({"summary": summary, "folded": sorted(folded)})
+        await acall(self._summaries, "set", session_id, raw, SUMMARY_CACHE_TTL)
+        if memory is not None:
+            await memory.asave_rolling_summary(session_id, summary, sorted(folded))
+
+    async def _fold(self, session_id: str, dropped: List[BaseMessage], llm, memory) -> str:
+        summary, folded = await self._load_summary(session_id, memory)
+        dropped_fingerprints = [self._fingerprint(m) for m in dropped]
+        new_messages = [m for m, fp in zip(dropped, dropped_fingerprints) if fp not in folded]
+        if not new_messages:
+            return summary
+        try:
+            prompt = SUMMARY_PROMPT.format(summary=summary or "(none)", transcript=self._transcript(new_messages))
+            response = await llm.ainvoke([HumanMessage(content=prompt)], config={"tags": [INTERNAL_RUN_TAG]})
+            summary = response.content if isinstance(response.content, str) else str(response.content)
+        except Exception as e:
+            print(f"Warning: Failed to update conversation summary: {e}")
+            return summary
+        # Every dropped message is folded in now. Fingerprints of messages that have left the loaded
+        # history are not kept: they cannot come back, and keeping them would grow the entry forever.
+        await self._store_summary(session_id, summary, set(dropped_fingerprints), memory)
+        return summary
+
+    async def fit(self, session_id: Optional[str], messages: List[BaseMessage], llm, memory=None) -> List[BaseMessage]:
+        """Returns the messages to send: system prompt, rolling summary, then the newest turns within budget"""
+        provider = type(llm).__name__
+        budget = self.token_budget(provider)
+        system_messages, dropped, kept = self._trim(messages, provider, budget)
+        if not dropped:
+            return messages
+
+        print(f"Context budget {budget} tokens ({provider}): folding {len(dropped)} older message(s) into summary")
+        summary = await self._fold(session_id, dropped, llm, memory) if session_id else ""
+        if summary:
+            # Merged into the first system message: some providers reject system messages mid-history
+            note = f"# SUMMARY OF THE EARLIER CONVERSATION\n{summary}"
+            if system_messages:
+                first = system_messages[0]
+                system_messages = [SystemMessage(content=f"{first.content}\n\n{note}")] + system_messages[1:]
+            else:
+                system_messages = [SystemMessage(content=note)]
+        return system_messages + kept
+
+
+context_manager = ContextWindowManager()
@@ -0,0 +1,158 @@
+import os
+import re
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# SQLite file for cached vectors (default: embedding_cache.sqlite3 next to the vector store)
+EMBEDDING_CACHE_DB = os.environ.get("EMBEDDING_CACHE_DB")
+# Maximum cached vectors; least recently used are evicted first (~3 KB each for 768 dimensions)
+EMBEDDING_CACHE_SIZE = int(os.environ.get("EMBEDDING_CACHE_SIZE", "200000"))
+# Share of entries evicted at once when the cap is reached, so eviction is not paid on every write
+EVICTION_FRACTION = 0.05
+
+
+def text_key(model: str, kind: str, text: str) -> str:
+    """Same key for text differing only in Unicode form or whitespace"""
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text).strip())
+    return f"{model}:{kind}:" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Vectors by (model, kind, normalized text hash) in SQLite, stored as float32 blobs with LRU eviction"""
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._count = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, db_path: str) -> bool:
+        """Opens (or creates) the cache file; False leaves the cache off"""
+        with self._lock:
+            if self._db is not None:
+                return True
+            try:
+                self._db = sqlite3.connect(str(db_path), check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute("PRAGMA synchronous=NORMAL")
+                self._db.execute('''
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL
+                )
+                ''')
+                self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+                self._db.commit()
+                self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                return True
+            except Exception as e:
+                print(f"Warning: Embedding cache disabled: {e}")
+                self._db = None
+                return False
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        if self._db is None or not keys:
+            return {}
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):  # SQLite's bound-parameter limit
+                part = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array.array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, k) for k in found])
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if self._db is None or not items:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array.array("f", vector).tobytes(), now) for key, vector in items.items()]
+            )
+            self._count += len(items)
+            if self._count > self.max_entries:
+                self._count = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                excess = self._count - self.max_entries
+                if excess > 0:
+                    excess += int(self.max_entries * EVICTION_FRACTION)
+                    self._db.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (excess,)
+                    )
+                    self.evictions += excess
+                    self._count = max(0, self._count - excess)
+            self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"enabled": self._db is not None, "entries": self._count, "max_entries": self.max_entries,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0}
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that answers repeated texts from an EmbeddingCache.
+
+    Documents and queries are cached apart: some models (Google's
+    text-embedding-004 among them) embed them with different task types.
+    Only the texts missing from the cache are sent, once each.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(self.model, "doc", text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = text_key(self.model, "query", text)
+        found = self.cache.get_many([key])
+        if key in found:
+            return found[key]
+        vector = self.embeddings.embed_query(text)
+        self.cache.put_many({key: vector})
+        return vector
+
+    def __getattr__(self, attr: str) -> Any:
+        if attr == "embeddings":  # Not set yet (e.g. while unpickling)
+            raise AttributeError(attr)
+        return getattr(self.embeddings, attr)
+
+
+embedding_cache = EmbeddingCache()
@@ -0,0 +1,151 @@
+import os
+import re
+import stat
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from starlette.responses import Response, StreamingResponse
+
+from utils.async_io import run_blocking
+
+# Bytes read per step when streaming a file or a range of it
+FILE_CHUNK_SIZE = int(os.environ.get("FILE_CHUNK_SIZE", str(256 * 1024)))
+# Content-addressed uploads and the randomly named generated images and speech never change
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+# Everything else (e.g. plot.png, overwritten by each new plot) is revalidated with its ETag
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+# Only names the server itself generates; a user's backup_20231015.csv may well be rewritten
+_IMMUTABLE_NAMES = (
+    re.compile(r"^uploads/[0-9a-f]{24}\.[A-Za-z0-9]+$"),  # ContentStore
+    re.compile(r"^gemini_image_[0-9a-f]{32}\.[A-Za-z0-9]+$"),  # generate_image, in the workspace root
+    re.compile(r"^speech_[A-Za-z]+_[0-9a-f]{8}\.mp3$"),  # text_to_speech, in the workspace root
+)
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# Types missing from some platforms' mime tables
+for _type, _extension in (("image/webp", ".webp"), ("text/markdown", ".md"), ("audio/mpeg", ".mp3"),
+                          ("application/vnd.openxmlformats-officedocument.wordprocessingml.document", ".docx")):
+    mimetypes.add_type(_type, _extension)
+
+
+def media_type(path: Path) -> str:
+    guessed, _ = mimetypes.guess_type(path.name)
+    if guessed is None:
+        return "application/octet-stream"
+    if guessed.startswith("text/") or guessed in ("application/json", "application/javascript"):
+        return f"{guessed}; charset=utf-8"
+    return guessed
+
+
+def cache_control(relative_path: str) -> str:
+    if any(pattern.match(relative_path) for pattern in _IMMUTABLE_NAMES):
+        return IMMUTABLE_CACHE_CONTROL
+    return REVALIDATE_CACHE_CONTROL
+
+
+def etag(file_stat: os.stat_result) -> str:
+    return f'"{file_stat.st_mtime_ns:x}-{file_stat.st_size:x}"'
+
+
+def _etag_matches(header: str, current: str) -> bool:
+    # Weak comparison, as If-None-Match requires
+    candidates = [c.strip() for c in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == current for c in candidates)
+
+
+def not_modified(headers: Any, current_etag: str, mtime: float) -> bool:
+    """True when the client's cached copy is current (If-None-Match wins over If-Modified-Since)"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        return _etag_matches(if_none_match, current_etag)
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(first, last) byte for a single 'bytes=' range, None to serve the whole file.
+
+    Raises ValueError for a range that cannot be satisfied. Multiple ranges
+    are answered with the whole file, which the spec allows.
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:  # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _read_chunk(handle: Any, length: int) -> bytes:
+    return handle.read(length)
+
+
+async def _file_chunks(path: Path, start: int, length: int):
+    handle = await run_blocking(open, path, "rb")
+    try:
+        await run_blocking(handle.seek, start)
+        remaining = length
+        while remaining > 0:
+            chunk = await run_blocking(_read_chunk, handle, min(FILE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        await run_blocking(handle.close)
+
+
+async def file_response(path: Path, relative_path: str, headers: Any, method: str = "GET") -> Response:
+    """Serves a file with validators, 304 handling and single byte ranges; raises FileNotFoundError"""
+    file_stat = await run_blocking(os.stat, path)
+    if not stat.S_ISREG(file_stat.st_mode):
+        raise FileNotFoundError(relative_path)
+
+    current_etag = etag(file_stat)
+    common: Dict[str, str] = {
+        "ETag": current_etag,
+        "Last-Modified": formatdate(file_stat.st_mtime, usegmt=True),
+        "Cache-Control": cache_control(relative_path),
+        "Accept-Ranges": "bytes",
+    }
+    if not_modified(headers, current_etag, file_stat.st_mtime):
+        return Response(status_code=304, headers=common)
+
+    size = file_stat.st_size
+    byte_range = None
+    if_range = headers.get("if-range")
+    if if_range is None or if_range.strip() == current_etag:
+        try:
+            byte_range = parse_range(headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={**common, "Content-Range": f"bytes */{size}"})
+
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = end - start + 1 if size else 0
+    response_headers = {**common, "Content-Length": str(length)}
+    status_code = 200
+    if byte_range:
+        status_code = 206
+        response_headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    body = _file_chunks(path, start, length) if method != "HEAD" and length else iter(())
+    return StreamingResponse(body, status_code=status_code, media_type=media_type(path), headers=response_headers)
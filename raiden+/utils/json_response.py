@@ -0,0 +1,29 @@
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard encoder
+    orjson = None
+
+# Non-string dict keys (e.g. ints in tool outputs) are stringified like json.dumps does
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+
+
+def dumps(content: Any) -> bytes:
+    """Compact UTF-8 JSON, via orjson when installed"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(content, option=ORJSON_OPTIONS)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits or unknown types; json.dumps below raises or stringifies
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (several times faster on large tool outputs)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
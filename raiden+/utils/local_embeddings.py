@@ -0,0 +1,154 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+try:
+    import psutil
+except ImportError:  # Fall back to logical cores
+    psutil = None
+
+# Sentence-embedding model run locally (384 dimensions, ~90 MB; any BERT-style sentence-transformers model works)
+LOCAL_EMBEDDING_MODEL = os.environ.get("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# "onnx" (ONNX Runtime) or "torch" (sentence-transformers)
+LOCAL_EMBEDDING_RUNTIME = os.environ.get("LOCAL_EMBEDDING_RUNTIME", "onnx").lower()
+# "int8" quantizes the ONNX model's weights (roughly 2-3x faster on CPU, a little less accurate)
+LOCAL_EMBEDDING_QUANTIZE = os.environ.get("LOCAL_EMBEDDING_QUANTIZE", "").lower()
+# Texts per forward pass; texts are sorted by length first so each batch pads little
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.environ.get("LOCAL_EMBEDDING_BATCH_SIZE", "32"))
+# Tokens per text (MiniLM was trained on 256)
+LOCAL_EMBEDDING_MAX_LENGTH = int(os.environ.get("LOCAL_EMBEDDING_MAX_LENGTH", "256"))
+# Intra-op threads; physical cores by default (hyper-threads do not help matrix multiplies)
+LOCAL_EMBEDDING_THREADS = int(os.environ.get("LOCAL_EMBEDDING_THREADS", "0"))
+# Exported (and quantized) ONNX models, so later starts need no network
+LOCAL_EMBEDDING_CACHE_DIR = Path(os.environ.get("LOCAL_EMBEDDING_CACHE_DIR", Path.home() / ".cache" / "raiden" / "onnx"))
+
+
+def _default_threads() -> int:
+    if psutil is not None:
+        physical = psutil.cpu_count(logical=False)
+        if physical:
+            return physical
+    return max(1, (os.cpu_count() or 2) // 2)
+
+
+class LocalEmbeddings(Embeddings):
+    """Sentence embeddings computed in-process, via ONNX Runtime (default) or sentence-transformers.
+
+    The model is exported to ONNX once (optionally quantized to int8) and
+    loaded from LOCAL_EMBEDDING_CACHE_DIR afterwards. Texts are sorted by
+    length and batched, mean-pooled and L2-normalized. Inference is
+    serialized: one call already uses every configured thread.
+    """
+
+    def __init__(self, model_name: str = LOCAL_EMBEDDING_MODEL, device: str = "cpu",
+                 runtime: str = LOCAL_EMBEDDING_RUNTIME, quantize: str = LOCAL_EMBEDDING_QUANTIZE,
+                 batch_size: int = LOCAL_EMBEDDING_BATCH_SIZE, max_length: int = LOCAL_EMBEDDING_MAX_LENGTH,
+                 threads: int = LOCAL_EMBEDDING_THREADS):
+        self.model_name = model_name
+        self.device = device
+        self.runtime = runtime
+        # int8 kernels are CPU-only
+        self.quantize = quantize if runtime == "onnx" and device == "cpu" and quantize == "int8" else ""
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.threads = threads or _default_threads()
+        self._lock = threading.Lock()
+        self._session = None
+        self._tokenizer = None
+        self._input_names: List[str] = []
+        self._model = None
+        if runtime == "torch":
+            self._load_torch()
+        else:
+            self._load_onnx()
+
+    @property
+    def model_id(self) -> str:
+        """Identifies the vectors this backend produces (cache keys, collection names)"""
+        return self.model_name + (f"-{self.quantize}" if self.quantize else "")
+
+    # --- Loading ---
+    def _load_torch(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+        if self.device == "cpu":
+            torch.set_num_threads(self.threads)
+        self._model = SentenceTransformer(self.model_name, device=self.device)
+        self._model.max_seq_length = self.max_length
+
+    def _export_dir(self) -> Path:
+        export_dir = LOCAL_EMBEDDING_CACHE_DIR / re.sub(r"[^A-Za-z0-9_.-]+", "--", self.model_name)
+        if not (export_dir / "model.onnx").is_file():
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+            from transformers import AutoTokenizer
+            print(f"Exporting {self.model_name} to ONNX in {export_dir} (first use only)")
+            ORTModelForFeatureExtraction.from_pretrained(self.model_name, export=True).save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(self.model_name).save_pretrained(export_dir)
+        return export_dir
+
+    def _model_file(self, export_dir: Path) -> Path:
+        if not self.quantize:
+            return export_dir / "model.onnx"
+        quantized = export_dir / "model_int8.onnx"
+        if not quantized.is_file():
+            from onnxruntime.quantization import quantize_dynamic, QuantType
+            print(f"Quantizing {self.model_name} to int8")
+            quantize_dynamic(str(export_dir / "model.onnx"), str(quantized), weight_type=QuantType.QInt8)
+        return quantized
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        export_dir = self._export_dir()
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        providers = ["CPUExecutionProvider"]
+        if self.device == "cuda" and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, "CUDAExecutionProvider")
+        self._session = ort.InferenceSession(str(self._model_file(export_dir)), options, providers=providers)
+        self._input_names = [i.name for i in self._session.get_inputs()]
+        self._tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+        print(f"Local embeddings: {self.model_id} on {self._session.get_providers()[0]}, {self.threads} thread(s)")
+
+    # --- Inference ---
+    def _encode_onnx(self, texts: List[str]):
+        import numpy as np
+        encoded = self._tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feed = {name: encoded[name].astype(np.int64) for name in self._input_names if name in encoded}
+        if "token_type_ids" in self._input_names and "token_type_ids" not in feed:
+            feed["token_type_ids"] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+        hidden = self._session.run(None, feed)[0]
+        mask = encoded["attention_mask"][..., None].astype(hidden.dtype)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        if self._model is not None:
+            with self._lock:
+                vectors = self._model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True,
+                                             convert_to_numpy=True, show_progress_bar=False)
+            return vectors.tolist()
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        with self._lock:
+            for start in range(0, len(order), self.batch_size):
+                indices = order[start:start + self.batch_size]
+                vectors = self._encode_onnx([texts[i] for i in indices])
+                for i, vector in zip(indices, vectors.tolist()):
+                    results[i] = vector
+        return results
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(list(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text])[0]
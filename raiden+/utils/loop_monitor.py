@@ -0,0 +1,103 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import deque
+from typing import Any, Dict, Optional
+
+LOOP_MONITOR_ENABLED = os.environ.get("LOOP_MONITOR_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds the event loop may be blocked before it is reported
+LOOP_LAG_THRESHOLD = float(os.environ.get("LOOP_LAG_THRESHOLD", "0.1"))
+# Seconds between heartbeats on the loop (and watchdog checks)
+LOOP_LAG_INTERVAL = float(os.environ.get("LOOP_LAG_INTERVAL", "0.05"))
+# asyncio debug mode also names each slow callback, at a cost on every callback; off by default
+LOOP_DEBUG = os.environ.get("LOOP_DEBUG", "false").lower() in ("1", "true", "yes")
+# Innermost frames printed for a blocked loop
+STACK_DEPTH = 12
+
+
+class LoopLagMonitor:
+    """Reports event loop stalls and what caused them.
+
+    A heartbeat task measures how late each wake-up is. A watchdog thread
+    notices a heartbeat that is overdue by more than the threshold and
+    prints the loop thread's stack while it is still blocked, which names
+    the synchronous call responsible.
+    """
+
+    def __init__(self, threshold: float = LOOP_LAG_THRESHOLD, interval: float = LOOP_LAG_INTERVAL):
+        self.threshold = threshold
+        self.interval = interval
+        self.lags = deque(maxlen=1000)
+        self.stalls = 0
+        self.max_lag = 0.0
+        self.last_stall: Optional[Dict[str, Any]] = None
+        self._beat = time.monotonic()
+        self._reported = False
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self._beat = now
+            self.lags.append(lag)
+            self.max_lag = max(self.max_lag, lag)
+            if lag > self.threshold:
+                self.stalls += 1
+                if not self._reported:
+                    # Shorter than a watchdog tick: no stack was captured
+                    self.last_stall = {"seconds": round(lag, 3), "at": time.time()}
+                    print(f"Warning: Event loop blocked for {lag * 1000:.0f} ms")
+            self._reported = False
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            blocked = time.monotonic() - self._beat - self.interval
+            if blocked <= self.threshold or self._reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_stack(frame)[-STACK_DEPTH:]
+            self._reported = True
+            self.last_stall = {"seconds": round(blocked, 3), "at": time.time(),
+                               "stack": [line.strip().splitlines()[0] for line in stack]}
+            print(f"Warning: Event loop blocked for over {blocked * 1000:.0f} ms in:\n{''.join(stack)}")
+
+    def start(self) -> None:
+        """Starts monitoring the running loop; call from inside it (e.g. the app lifespan)"""
+        loop = asyncio.get_running_loop()
+        if LOOP_DEBUG:
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="raiden-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        p99 = lags[min(len(lags) - 1, int(len(lags) * 0.99))] if lags else 0.0
+        return {"threshold_ms": round(self.threshold * 1000), "p99_lag_ms": round(p99 * 1000, 1),
+                "max_lag_ms": round(self.max_lag * 1000, 1), "stalls": self.stalls,
+                "last_stall": self.last_stall}
+
+
+loop_monitor = LoopLagMonitor()
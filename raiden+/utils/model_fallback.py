@@ -1,83 +1,396 @@
 import os
+import time
+import asyncio
 import logging
-from typing import Dict, Any, Optional, Callable, List, TypeVar
-from langchain_core.language_models import BaseLLM
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_groq import ChatGroq
-from langchain_together import ChatTogether
-from langchain_deepseek import ChatDeepSeek
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable, List, Set, TypeVar, Tuple, Awaitable
+
+from langchain_core.messages import AIMessage, message_chunk_to_message
+
+from utils.model_registry import ModelRegistry, model_registry
 
 T = TypeVar('T')
 
+# Seconds a single provider call may take before it counts as a failure
+MODEL_CALL_TIMEOUT = float(os.environ.get("MODEL_CALL_TIMEOUT", "60"))
+# Calls kept per provider for latency percentiles and error rate
+HEALTH_WINDOW = 100
+# Consecutive failures, or error rate over at least MIN_CALLS_FOR_RATE calls, that open the circuit
+FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3"))
+ERROR_RATE_THRESHOLD = 0.5
+MIN_CALLS_FOR_RATE = 10
+# Seconds an open circuit waits before letting one trial request through
+RECOVERY_TIMEOUT = float(os.environ.get("CIRCUIT_RECOVERY_TIMEOUT", "30"))
+
+# Hedging: if the primary has not produced its first token within its own HEDGE_DELAY_PERCENTILE
+# time-to-first-token, the same request is sent to the next provider and the first to answer wins
+HEDGE_REQUESTS = os.environ.get("HEDGE_REQUESTS", "false").lower() in ("1", "true", "yes")
+HEDGE_DELAY_PERCENTILE = float(os.environ.get("HEDGE_DELAY_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY = 0.3        # Seconds; never hedge sooner than this
+HEDGE_DEFAULT_DELAY = 2.0    # Seconds; used until MIN_HEDGE_SAMPLES first-token times are known
+MIN_HEDGE_SAMPLES = 5
+# Largest share of a primary provider's recent requests that may be hedged
+HEDGE_BUDGET_RATIO = float(os.environ.get("HEDGE_BUDGET_RATIO", "0.1"))
+# Per-provider overrides of HEDGE_BUDGET_RATIO (0 disables hedging away from that provider)
+HEDGE_PROVIDER_BUDGETS = {
+    "groq-llama": HEDGE_BUDGET_RATIO,
+    "google-gemini": HEDGE_BUDGET_RATIO,
+    "together-llama": HEDGE_BUDGET_RATIO,
+    "deepseek-chat": HEDGE_BUDGET_RATIO,
+}
+
+
+class CircuitOpenError(RuntimeError):
+    """A provider was skipped: its half-open probe is already taken by another request"""
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+class CircuitBreaker:
+    """closed -> open after repeated failures -> half_open after RECOVERY_TIMEOUT -> closed on success"""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, recovery_timeout: float = RECOVERY_TIMEOUT):
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Whether a call may be routed here; does not claim the half-open probe"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            return not self._trial_in_flight  # Only one probe while half-open
+        return self.state == self.CLOSED
+
+    def begin_call(self) -> bool:
+        """Claims the half-open probe; False when another call already holds it"""
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            self.state = self.HALF_OPEN
+            self._trial_in_flight = False
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+        return True
+
+    def release(self):
+        """Frees the half-open probe of a call that ended without an outcome (e.g. cancelled)"""
+        self._trial_in_flight = False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def trip(self):
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+class ProviderHealth:
+    """Rolling latency/error statistics and the circuit breaker of one provider"""
+
+    def __init__(self, window: int = HEALTH_WINDOW):
+        self.latencies = deque(maxlen=window)   # Seconds, successful calls only
+        self.outcomes = deque(maxlen=window)    # True = success
+        self.first_token_latencies = deque(maxlen=window)  # Seconds, streamed calls only
+        self.hedge_log = deque(maxlen=window)   # Per hedging-mode request as primary: True = hedged
+        self.hedges_fired = 0
+        self.hedges_won = 0                     # Hedges whose second provider answered first
+        self.consecutive_failures = 0
+        self.breaker = CircuitBreaker()
+
+    @property
+    def error_rate(self) -> float:
+        return (self.outcomes.count(False) / len(self.outcomes)) if self.outcomes else 0.0
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        return _percentile(sorted(self.latencies), fraction)
+
+    def first_token_percentile(self, fraction: float) -> Optional[float]:
+        return _percentile(sorted(self.first_token_latencies), fraction)
+
+    def record(self, latency: float, ok: bool):
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.breaker.record_success()
+            return
+        self.consecutive_failures += 1
+        rate_exceeded = len(self.outcomes) >= MIN_CALLS_FOR_RATE and self.error_rate >= ERROR_RATE_THRESHOLD
+        if (self.breaker.state == CircuitBreaker.HALF_OPEN
+                or self.consecutive_failures >= FAILURE_THRESHOLD or rate_exceeded):
+            self.breaker.trip()
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        ttft_p95 = self.first_token_percentile(0.95)
+        return {
+            "state": self.breaker.state,
+            "calls": len(self.outcomes),
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_failures": self.consecutive_failures,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "first_token_p95_ms": round(ttft_p95 * 1000) if ttft_p95 is not None else None,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedge_rate": round(sum(self.hedge_log) / len(self.hedge_log), 3) if self.hedge_log else 0.0,
+        }
+
+
 class ModelFallbackManager:
-    def __init__(self):
+    def __init__(self, registry: ModelRegistry = model_registry):
+        self.registry = registry
         self.models = []
         self.current_model_index = 0
-        
+        self.health: Dict[str, ProviderHealth] = {}
+        self._lock = threading.Lock()
+
         # Setup logging
         logging.basicConfig(
             filename='model_fallback.log',
             level=logging.INFO,
             format='%(asctime)s - %(levelname)s - %(message)s'
         )
-        
+
     def initialize_models(self):
         """Initialize backup models in priority order"""
         # Clear existing models
         self.models = []
-        
-        # Add available models based on API keys
-        if os.environ.get("GOOGLE_API_KEY"):
-            self.models.append({
-                "name": "google-gemini",
-                "instance": ChatGoogleGenerativeAI(
-                    model="gemini-2.0-flash",
-                    temperature=0.7,
-                    max_tokens=4096
-                )
-            })
-            
-        if os.environ.get("TOGETHER_API_KEY"):
-            self.models.append({
-                "name": "together-llama",
-                "instance": ChatTogether(
-                    model="meta-llama/Llama-3-70b-chat-hf",
-                    temperature=0.7,
-                    max_tokens=4096
-                )
-            })
-            
-        if os.environ.get("DEEPSEEK_API_KEY"):
-            self.models.append({
-                "name": "deepseek-chat",
-                "instance": ChatDeepSeek(
-                    model="deepseek-chat",
-                    temperature=0.7,
-                    max_tokens=4096
-                )
-            })
-    
+
+        # Add available models based on API keys; clients are built by the registry on first use
+        for key in self.registry.available():
+            self.models.append({"name": key, "display_name": self.registry.display_name(key)})
+            self.health.setdefault(key, ProviderHealth())
+
+    # --- Health tracking & routing ---
+    def _health(self, name: str) -> ProviderHealth:
+        with self._lock:
+            return self.health.setdefault(name, ProviderHealth())
+
+    def record(self, name: str, latency: float, ok: bool):
+        health = self._health(name)
+        with self._lock:
+            previous_state = health.breaker.state
+            health.record(latency, ok)
+            state = health.breaker.state
+        if state != previous_state:
+            logging.warning(f"Circuit for {name}: {previous_state} -> {state}")
+            print(f"Circuit for {name}: {previous_state} -> {state}")
+
+    def _score(self, name: str) -> float:
+        """Lower is better: p95 latency inflated by the error rate"""
+        health = self._health(name)
+        p95 = health.percentile(0.95)
+        # Providers without samples rank as average so they still get explored
+        known = [h.percentile(0.95) for h in list(self.health.values()) if h.latencies]
+        baseline = sum(known) / len(known) if known else 1.0
+        return (p95 if p95 is not None else baseline) * (1 + 4 * health.error_rate)
+
+    def route(self, preferred: Optional[str] = None) -> List[str]:
+        """Model keys to try in order: the preferred model if its circuit allows, then healthiest/fastest first"""
+        names = [m["name"] for m in self.models] or self.registry.available()
+        with self._lock:
+            allowed = [n for n in names if self.health.setdefault(n, ProviderHealth()).breaker.allow_request()]
+        ranked = sorted((n for n in allowed if n != preferred), key=self._score)
+        if preferred in allowed:
+            ranked.insert(0, preferred)
+        if not ranked:
+            # Every circuit is open: fail open in the usual priority order rather than refuse outright
+            ranked = ([preferred] if preferred in names else []) + [n for n in names if n != preferred]
+        return ranked
+
+    async def ainvoke(self, name: str, runnable: Any, messages: List[Any],
+                      timeout: float = MODEL_CALL_TIMEOUT, **kwargs: Any) -> Any:
+        """Invoke a provider runnable, recording latency and outcome for `name`"""
+        health = self._health(name)
+        with self._lock:
+            # route() may hand the same half-open provider to several requests; one of them probes it
+            claimed = health.breaker.begin_call()
+        if not claimed:
+            raise CircuitOpenError(f"{name} is recovering; its trial request is in flight")
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(runnable.ainvoke(messages, **kwargs), timeout=timeout)
+        except asyncio.CancelledError:
+            with self._lock:
+                health.breaker.release()
+            raise
+        except Exception:
+            self.record(name, time.monotonic() - started, ok=False)
+            raise
+        self.record(name, time.monotonic() - started, ok=True)
+        return result
+
+    # --- Hedged requests ---
+    async def _astream(self, name: str, runnable: Any, messages: List[Any], first_token: asyncio.Event,
+                       timeout: float = MODEL_CALL_TIMEOUT) -> AIMessage:
+        """Streams a provider call into one message, setting `first_token` when output starts"""
+        health = self._health(name)
+        with self._lock:
+            claimed = health.breaker.begin_call()
+        if not claimed:
+            raise CircuitOpenError(f"{name} is recovering; its trial request is in flight")
+        started = time.monotonic()
+
+        async def consume():
+            message = None
+            async for chunk in runnable.astream(messages):
+                if message is None:
+                    with self._lock:
+                        health.first_token_latencies.append(time.monotonic() - started)
+                    first_token.set()
+                    message = chunk
+                else:
+                    message = message + chunk
+            return message_chunk_to_message(message) if message is not None else AIMessage(content="")
+
+        try:
+            result = await asyncio.wait_for(consume(), timeout=timeout)
+        except asyncio.CancelledError:
+            with self._lock:
+                health.breaker.release()
+            raise
+        except Exception:
+            self.record(name, time.monotonic() - started, ok=False)
+            raise
+        self.record(name, time.monotonic() - started, ok=True)
+        return result
+
+    def hedge_delay(self, name: str) -> float:
+        """Seconds to wait for the primary's first token before hedging"""
+        health = self._health(name)
+        if len(health.first_token_latencies) < MIN_HEDGE_SAMPLES:
+            return HEDGE_DEFAULT_DELAY
+        return max(HEDGE_MIN_DELAY, health.first_token_percentile(HEDGE_DELAY_PERCENTILE))
+
+    def _hedge_budget_allows(self, name: str) -> bool:
+        health = self._health(name)
+        budget = HEDGE_PROVIDER_BUDGETS.get(name, HEDGE_BUDGET_RATIO)
+        with self._lock:
+            used = sum(health.hedge_log) / len(health.hedge_log) if health.hedge_log else 0.0
+        return budget > 0 and used < budget
+
+    async def ainvoke_hedged(self, primary: str, alternatives: List[str],
+                             prepare: Callable[[str], Awaitable[Tuple[Any, List[Any]]]],
+                             tried: Optional[Set[str]] = None) -> Tuple[str, Any]:
+        """Calls `primary`, hedging to the first of `alternatives` when its first token is late.
+
+        `prepare(model_key)` returns the (runnable, messages) for a provider. Returns
+        (model key that answered, response). Without HEDGE_REQUESTS this is a plain ainvoke.
+        Every provider called is added to `tried`, so a caller falling back after a
+        failure (including one after the first token) can skip those already attempted.
+        """
+        tried = tried if tried is not None else set()
+        tried.add(primary)
+        runnable, messages = await prepare(primary)
+        secondary = alternatives[0] if alternatives else None
+        if not HEDGE_REQUESTS or secondary is None:
+            return primary, await self.ainvoke(primary, runnable, messages)
+
+        primary_health = self._health(primary)
+        attempts: Dict[str, Tuple[asyncio.Task, asyncio.Event]] = {}
+        first_token = asyncio.Event()
+        attempts[primary] = (asyncio.ensure_future(self._astream(primary, runnable, messages, first_token)), first_token)
+        try:
+            waiter = asyncio.ensure_future(first_token.wait())
+            await asyncio.wait({attempts[primary][0], waiter}, timeout=self.hedge_delay(primary),
+                               return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            if first_token.is_set() or attempts[primary][0].done() or not self._hedge_budget_allows(primary):
+                with self._lock:
+                    primary_health.hedge_log.append(False)
+                return primary, await attempts[primary][0]
+
+            with self._lock:
+                primary_health.hedge_log.append(True)
+                primary_health.hedges_fired += 1
+            print(f"Hedging {primary} -> {secondary} after {self.hedge_delay(primary):.2f}s without a first token")
+            tried.add(secondary)
+            hedge_runnable, hedge_messages = await prepare(secondary)
+            hedge_first_token = asyncio.Event()
+            attempts[secondary] = (
+                asyncio.ensure_future(self._astream(secondary, hedge_runnable, hedge_messages, hedge_first_token)),
+                hedge_first_token,
+            )
+
+            winner = await self._first_to_answer(attempts)
+            if winner == secondary:
+                with self._lock:
+                    primary_health.hedges_won += 1
+            for name, (task, _) in attempts.items():
+                if name != winner:
+                    task.cancel()
+            return winner, await attempts[winner][0]
+        finally:
+            # Covers cancellation of the caller and the loser of the race
+            for task, _ in attempts.values():
+                if not task.done():
+                    task.cancel()
+
+    @staticmethod
+    async def _first_to_answer(attempts: Dict[str, Tuple[asyncio.Task, asyncio.Event]]) -> str:
+        """Name of the attempt that streams a token (or completes) first; failed attempts drop out"""
+        remaining = dict(attempts)
+        last_error: Optional[BaseException] = None
+        while remaining:
+            signals = {}
+            for name, (task, event) in remaining.items():
+                signals[task] = name
+                signals[asyncio.ensure_future(event.wait())] = name
+            done, pending = await asyncio.wait(signals, return_when=asyncio.FIRST_COMPLETED)
+            for future in pending:
+                if future not in (task for task, _ in remaining.values()):
+                    future.cancel()
+
+            for future in done:
+                name = signals[future]
+                if name not in remaining:
+                    continue
+                task = remaining[name][0]
+                if task.done() and (task.cancelled() or task.exception() is not None):
+                    last_error = task.exception() if not task.cancelled() else asyncio.CancelledError()
+                    remaining.pop(name, None)
+                else:
+                    return name
+        raise last_error or RuntimeError("No provider answered")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {name: health.snapshot() for name, health in self.health.items()}
+
     async def execute_with_fallback(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
-        """Execute a function with model fallback on failure"""
+        """Execute a function with model fallback on failure.
+
+        Each attempt passes the model key to `func` as `model=`, trying
+        models in route() order; the shared registry instance (and its cached
+        tool binding) is reused, nothing global is rebound.
+        """
         if not self.models:
             raise RuntimeError("No fallback models available")
-        
+
         last_error = None
-        for model in self.models:
+        for name in self.route():
             try:
-                # Update global LLM instance
-                from app import selected_llm_instance, llm_name, llm_with_tools, available_tools_list
-                selected_llm_instance = model["instance"]
-                llm_name = model["name"]
-                llm_with_tools = selected_llm_instance.bind_tools(available_tools_list)
-                
-                print(f"Trying fallback model: {model['name']}")
-                result = await func(*args, **kwargs)
+                print(f"Trying fallback model: {name}")
+                result = await func(*args, model=name, **kwargs)
                 return result
-                
+
             except Exception as e:
                 last_error = e
-                print(f"Fallback model {model['name']} failed: {e}")
+                print(f"Fallback model {name} failed: {e}")
                 continue
-        
+
         raise RuntimeError(f"All fallback models failed. Last error: {last_error}")
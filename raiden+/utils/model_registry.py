@@ -0,0 +1,105 @@
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+
+# Provider packages are imported by the factories, so only the models actually used are loaded
+
+def _groq_llama():
+    from langchain_groq import ChatGroq
+    return ChatGroq(temperature=0.7, model_name="deepseek-r1-distill-llama-70b", max_tokens=8192)
+
+
+def _google_gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-2.0-flash", temperature=0.7, max_tokens=4096)
+
+
+def _together_llama():
+    from langchain_together import ChatTogether
+    return ChatTogether(model="meta-llama/Llama-3-70b-chat-hf", temperature=0.7, max_tokens=4096)
+
+
+def _deepseek_chat():
+    from langchain_deepseek import ChatDeepSeek
+    return ChatDeepSeek(model="deepseek-chat", temperature=0.7, max_tokens=4096)
+
+
+# Supported chat models in default priority order: Groq > Google > Together > DeepSeek
+MODEL_SPECS: Dict[str, Dict[str, Any]] = {
+    "groq-llama": {
+        "display_name": "Groq Llama 3",
+        "env_key": "GROQ_API_KEY",
+        "factory": _groq_llama,
+    },
+    "google-gemini": {
+        "display_name": "Google Gemini Flash",
+        "env_key": "GOOGLE_API_KEY",
+        "factory": _google_gemini,
+    },
+    "together-llama": {
+        "display_name": "Together Llama 3",
+        "env_key": "TOGETHER_API_KEY",
+        "factory": _together_llama,
+    },
+    "deepseek-chat": {
+        "display_name": "DeepSeek Chat",
+        "env_key": "DEEPSEEK_API_KEY",
+        "factory": _deepseek_chat,
+    },
+}
+
+
+class ModelRegistry:
+    """Builds each provider client once and hands the same instance to every request.
+
+    Reusing instances keeps their HTTP connection pools warm, and because the
+    model is chosen per request nothing process-wide is mutated when users
+    pick different models concurrently.
+    """
+
+    def __init__(self, specs: Dict[str, Dict[str, Any]] = MODEL_SPECS):
+        self.specs = specs
+        self._instances: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def available(self) -> List[str]:
+        """Model keys whose API key is configured, in priority order"""
+        return [key for key, spec in self.specs.items() if os.environ.get(spec["env_key"])]
+
+    def is_available(self, key: Optional[str]) -> bool:
+        return key in self.specs and bool(os.environ.get(self.specs[key]["env_key"]))
+
+    @property
+    def default_key(self) -> Optional[str]:
+        available = self.available()
+        return available[0] if available else None
+
+    def display_name(self, key: Optional[str] = None) -> str:
+        key = key or self.default_key
+        return self.specs[key]["display_name"] if key in self.specs else "None"
+
+    def get(self, key: Optional[str] = None) -> Any:
+        """Returns the shared client for `key` (default model when None), building it on first use"""
+        key = key or self.default_key
+        if not self.is_available(key):
+            raise ValueError(f"Model '{key}' is not supported or API key is missing.")
+        instance = self._instances.get(key)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(key)
+                if instance is None:
+                    instance = self.specs[key]["factory"]()
+                    self._instances[key] = instance
+        return instance
+
+    def warm(self) -> None:
+        """Builds every available client up front (no network calls)"""
+        for key in self.available():
+            try:
+                self.get(key)
+            except Exception as e:
+                print(f"Warning: Failed to initialize model '{key}': {e}")
+
+
+model_registry = ModelRegistry()
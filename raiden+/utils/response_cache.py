@@ -0,0 +1,207 @@
+import os
+import re
+import math
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+
+from utils.shared_state import shared_state, acall
+
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Seconds a cached answer stays valid
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+# Maximum cached answers; least recently used are evicted first
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "512"))
+# Models sampling hotter than this are never cached (a replayed answer stands in for a fresh sample).
+# The default covers the registry's models (0.7); lower it, e.g. to 0, to opt sampled models out
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.environ.get("RESPONSE_CACHE_MAX_TEMPERATURE", "1.0"))
+# Embedding-similarity layer (reuses the RAG embedding function); off unless enabled
+RESPONSE_CACHE_SEMANTIC = os.environ.get("RESPONSE_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIMILARITY = float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.95"))
+# Questions longer than this are not worth caching (and rarely repeat verbatim)
+MAX_CACHEABLE_QUESTION_CHARS = 2000
+
+
+def _normalize(text: Any) -> str:
+    text = text if isinstance(text, str) else str(text)
+    text = re.sub(r"\s+", " ", text.strip().lower())
+    return text.rstrip("?!. ")
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8", errors="replace")).hexdigest()
+
+
+class ResponseCache:
+    """Caches final tool-free answers to repeated questions.
+
+    A standalone question (no earlier user turn, no rolling summary) keys on
+    the model, the system prompt and the normalized question only, so every
+    session asking it shares one entry. A question with earlier context also
+    keys on the session, the whole earlier history and the summary, so a
+    context-dependent question ("what's my name?") is never answered from
+    another session or an earlier state of this one. The optional semantic
+    layer matches a differently worded question within the same context by
+    cosine similarity of its embedding.
+
+    With a shared state backend, exact entries are also written there so
+    every worker can answer from them; the semantic layer stays per process.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 semantic: bool = RESPONSE_CACHE_SEMANTIC, similarity: float = RESPONSE_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+        # key -> (expires at, context key, unit question vector or None, answer)
+        self._entries: "OrderedDict[str, Tuple[float, str, Optional[List[float]], str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared = shared_state.namespace("response") if shared_state.shared else None
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    # --- Keys ---
+    @staticmethod
+    def _tail(messages: List[BaseMessage]) -> Optional[Tuple[str, str, bool]]:
+        """(digest of everything before the question, question, standalone) when the turn ends in a fresh user question"""
+        if not messages or not isinstance(messages[-1], HumanMessage):
+            return None  # Mid tool loop or nothing to answer
+        question = _normalize(messages[-1].content)
+        if not question or len(question) > MAX_CACHEABLE_QUESTION_CHARS:
+            return None
+        history = _digest(*(f"{m.type}:{m.content}" for m in messages[:-1]))
+        standalone = not any(isinstance(m, HumanMessage) for m in messages[:-1])
+        return history, question, standalone
+
+    def keys(self, messages: List[BaseMessage], model: Optional[str], session_id: Optional[str] = None,
+             summary: Optional[str] = None) -> Optional[Tuple[str, str, str]]:
+        """(exact key, context key, normalized question), or None when the turn is not cacheable"""
+        tail = self._tail(messages)
+        if tail is None:
+            return None
+        history, question, standalone = tail
+        if standalone and not summary:
+            # Only the system prompt precedes the question: the answer does not depend on the session
+            context_key = _digest("standalone", model or "auto", history)
+        else:
+            context_key = _digest(model or "auto", session_id or "", history, summary or "")
+        return _digest(context_key, question), context_key, question
+
+    @staticmethod
+    def cacheable_temperature(llm: Any) -> bool:
+        temperature = getattr(llm, "temperature", None)
+        return temperature is None or temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+
+    # --- Embeddings ---
+    @staticmethod
+    def _embedding_function():
+        try:
+            from tools import rag_tools  # Imported lazily: rag_tools imports from app
+        except Exception:
+            return None
+        return rag_tools.embedding_function
+
+    async def _embed(self, text: str) -> Optional[List[float]]:
+        embeddings = self._embedding_function()
+        if embeddings is None:
+            return None
+        try:
+            vector = await asyncio.to_thread(embeddings.embed_query, text)
+        except Exception as e:
+            print(f"Warning: Response cache embedding failed: {e}")
+            return None
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    # --- Lookup / store ---
+    async def aget(self, messages: List[BaseMessage], model: Optional[str], session_id: Optional[str] = None,
+                   summary: Optional[str] = None) -> Optional[AIMessage]:
+        keys = self.keys(messages, model, session_id, summary)
+        if keys is None:
+            return None
+        key, context_key, question = keys
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return AIMessage(content=entry[3])
+            if entry is not None:
+                del self._entries[key]
+
+        if self._shared is not None:
+            answer = await acall(self._shared, "get", key)
+            if answer is not None:
+                with self._lock:
+                    self.hits += 1
+                return AIMessage(content=answer)
+
+        if self.semantic:
+            vector = await self._embed(question)
+            if vector is not None:
+                answer = self._nearest(context_key, vector, now)
+                if answer is not None:
+                    with self._lock:
+                        self.semantic_hits += 1
+                    return AIMessage(content=answer)
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _nearest(self, context_key: str, vector: List[float], now: float) -> Optional[str]:
+        with self._lock:
+            candidates = [(k, e) for k, e in self._entries.items() if e[1] == context_key and e[2] is not None]
+        best_key, best_score = None, self.similarity
+        for key, (expires, _, other, _) in candidates:
+            if expires <= now or len(other) != len(vector):
+                continue
+            score = sum(a * b for a, b in zip(vector, other))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(best_key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(best_key)
+            return entry[3]
+
+    async def aput(self, messages: List[BaseMessage], model: Optional[str], response: AIMessage,
+                   session_id: Optional[str] = None, summary: Optional[str] = None) -> None:
+        """Stores a final answer; answers with tool calls or non-text content are skipped"""
+        if getattr(response, "tool_calls", None) or not isinstance(response.content, str) or not response.content:
+            return
+        keys = self.keys(messages, model, session_id, summary)
+        if keys is None:
+            return
+        key, context_key, question = keys
+        vector = await self._embed(question) if self.semantic else None
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, context_key, vector, response.content)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if self._shared is not None:
+            await acall(self._shared, "set", key, response.content, self.ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits,
+                    "semantic_hits": self.semantic_hits, "misses": self.misses, "shared": self._shared is not None}
+
+
+response_cache = ResponseCache()
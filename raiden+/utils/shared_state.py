@@ -0,0 +1,188 @@
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+# redis://host:port/db for state shared by every worker, fakeredis:// for tests;
+# unset keeps state in the process (fine for a single worker).
+# Only caches and counters live here. Conversation memory, summaries, sessions, the
+# vector store and its manifests stay in SQLite files under WORKSPACE_DIR, so a
+# deployment is single-host: any number of workers, but one machine and one workspace.
+SHARED_STATE_URL = os.environ.get("SHARED_STATE_URL") or os.environ.get("REDIS_URL")
+# Key prefix so several deployments can share one Redis
+SHARED_STATE_PREFIX = os.environ.get("SHARED_STATE_PREFIX", "raiden")
+# Number of server worker processes (uvicorn and gunicorn both read WEB_CONCURRENCY)
+WORKER_COUNT = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+
+class LocalNamespace:
+    """In-process store for one namespace: string values and lists with TTL, LRU-capped"""
+
+    shared = False
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        # key -> (expires at or None, str value or list of str)
+        self._data: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _live(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return entry[1]
+
+    def _store(self, key: str, value: Any, ttl: Optional[float]) -> None:
+        self._data[key] = (time.monotonic() + ttl if ttl else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def list_get(self, key: str) -> Optional[List[str]]:
+        with self._lock:
+            values = self._live(key)
+            return list(values) if values is not None else None
+
+    def list_set(self, key: str, values: List[str], max_len: int, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._store(key, list(values)[-max_len:], ttl)
+
+    def list_append_existing(self, key: str, values: List[str], max_len: int, ttl: Optional[float] = None) -> None:
+        """Appends only when the list exists (a missing list is rebuilt from the source of truth)"""
+        with self._lock:
+            current = self._live(key)
+            if current is not None:
+                self._store(key, (current + list(values))[-max_len:], ttl)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisNamespace:
+    """Same interface as LocalNamespace, backed by Redis keys '<prefix>:<namespace>:<key>'"""
+
+    shared = True
+
+    def __init__(self, client: Any, prefix: str):
+        self.client = client
+        self.prefix = prefix
+
+    def _k(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    @staticmethod
+    def _ttl_ms(ttl: Optional[float]) -> Optional[int]:
+        return max(1, int(ttl * 1000)) if ttl else None
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(self._k(key))
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None) -> None:
+        self.client.set(self._k(key), value, px=self._ttl_ms(ttl))
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self._k(key))
+
+    def list_get(self, key: str) -> Optional[List[str]]:
+        k = self._k(key)
+        with self.client.pipeline() as pipe:
+            exists, values = pipe.exists(k).lrange(k, 0, -1).execute()
+        return values if exists else None
+
+    def list_set(self, key: str, values: List[str], max_len: int, ttl: Optional[float] = None) -> None:
+        k = self._k(key)
+        with self.client.pipeline() as pipe:
+            pipe.delete(k)
+            if values:
+                pipe.rpush(k, *values[-max_len:])
+                if ttl:
+                    pipe.pexpire(k, self._ttl_ms(ttl))
+            pipe.execute()
+
+    def list_append_existing(self, key: str, values: List[str], max_len: int, ttl: Optional[float] = None) -> None:
+        if not values:
+            return
+        k = self._k(key)
+        with self.client.pipeline() as pipe:
+            pipe.rpushx(k, *values)  # No-op when the list is missing
+            pipe.ltrim(k, -max_len, -1)
+            if ttl:
+                pipe.pexpire(k, self._ttl_ms(ttl))
+            pipe.execute()
+
+    def clear(self) -> None:
+        for k in self.client.scan_iter(match=f"{self.prefix}:*"):
+            self.client.delete(k)
+
+
+class SharedState:
+    """Hands out namespaces on the configured backend (Redis, fakeredis or in-process)"""
+
+    def __init__(self, url: Optional[str] = SHARED_STATE_URL, prefix: str = SHARED_STATE_PREFIX):
+        self.url = url
+        self.prefix = prefix
+        self.client = None
+        if url:
+            try:
+                self.client = self._connect(url)
+                self.client.ping()
+                print(f"Shared state backend: {url.split('@')[-1]}")
+            except Exception as e:
+                print(f"Warning: Shared state backend unavailable ({e}); keeping state in process")
+                self.client = None
+        if self.client is None and WORKER_COUNT > 1:
+            print(f"Warning: {WORKER_COUNT} workers without SHARED_STATE_URL; caches are per worker")
+
+    @staticmethod
+    def _connect(url: str) -> Any:
+        if url.startswith("fakeredis://"):
+            import fakeredis
+            return fakeredis.FakeRedis(decode_responses=True)
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True, health_check_interval=30)
+
+    @property
+    def shared(self) -> bool:
+        return self.client is not None
+
+    def namespace(self, name: str, max_local_entries: int = 1024):
+        """Store for one kind of state; `max_local_entries` caps the in-process fallback only"""
+        if self.client is not None:
+            return RedisNamespace(self.client, f"{self.prefix}:{name}")
+        return LocalNamespace(max_local_entries)
+
+    def status(self) -> Dict[str, Any]:
+        return {"backend": "redis" if self.shared else "local", "workers": WORKER_COUNT}
+
+
+async def acall(store: Any, method: str, *args, **kwargs) -> Any:
+    """Runs a store operation; network backends run in a worker thread to keep the event loop free"""
+    fn = getattr(store, method)
+    if store.shared:
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+shared_state = SharedState()
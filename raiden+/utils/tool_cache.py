@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from utils.shared_state import shared_state
+
+# Entries kept in process; least recently used are evicted first
+TOOL_CACHE_SIZE = int(os.environ.get("TOOL_CACHE_SIZE", "1024"))
+# SQLite file for a second, restart-surviving tier (disabled when unset)
+TOOL_CACHE_DB = os.environ.get("TOOL_CACHE_DB")
+
+# Per-tool cache policy:
+#   ttl       seconds a result stays valid
+#   key_args  arguments that identify a call (default: all of them)
+#   fold_case lowercase string arguments before keying
+#   files     workspace path arguments (with their default); the entry is dropped when
+#             the file's mtime or size changes
+TOOL_CACHE_POLICIES: Dict[str, Dict[str, Any]] = {
+    "get_weather": {"ttl": 600, "key_args": ["location"], "fold_case": True},
+    "get_location_info": {"ttl": 86400, "key_args": ["coordinates"]},
+    "analyze_domain": {"ttl": 3600, "key_args": ["domain"], "fold_case": True},
+    "check_website": {"ttl": 60, "key_args": ["url"]},
+    "wikipedia": {"ttl": 86400, "fold_case": True},
+    "wikipedia_query_run": {"ttl": 86400, "fold_case": True},
+    "tavily_search_results_json": {"ttl": 900, "fold_case": True},
+    "brave_web_search": {"ttl": 900, "fold_case": True},
+    "youtube_search_tool": {"ttl": 3600, "fold_case": True},
+    "list_repo_contents": {"ttl": 120},
+    "get_repo_file_content": {"ttl": 120},
+    "read_file": {"ttl": 3600, "files": {"filename": None}},
+    "list_directory": {"ttl": 3600, "files": {"path": "."}},
+    "analyze_image": {"ttl": 86400, "files": {"image_path": None}},
+}
+
+# Tools with side effects are never cached, even if a policy is added for them
+SIDE_EFFECT_TOOLS = {
+    "write_file_confirmed", "delete_file_confirmed", "send_gmail_confirmed", "open_application_confirmed",
+    "create_or_update_repo_file", "delete_repo_file", "request_confirmation", "python_repl",
+}
+
+# Successful calls of these tools drop every cached result of the listed tools
+INVALIDATES = {
+    "create_or_update_repo_file": ["list_repo_contents", "get_repo_file_content"],
+    "delete_repo_file": ["list_repo_contents", "get_repo_file_content"],
+}
+_INVALIDATED_TOOLS = {name for targets in INVALIDATES.values() for name in targets}
+
+
+def _is_error_result(result: Any) -> bool:
+    return isinstance(result, str) and result.lstrip().lower().startswith("error")
+
+
+class ToolResultCache:
+    """Caches tool results per declarative TOOL_CACHE_POLICIES entry.
+
+    An in-memory LRU sits in front of an optional SQLite tier; only string
+    results (what tools return almost everywhere) go to SQLite. With a
+    shared state backend, entries live there instead (JSON results only) so
+    every worker shares them. Error results are never stored.
+    """
+
+    def __init__(self, max_entries: int = TOOL_CACHE_SIZE, db_path: Optional[str] = TOOL_CACHE_DB,
+                 policies: Dict[str, Dict[str, Any]] = TOOL_CACHE_POLICIES):
+        self.max_entries = max_entries
+        self.policies = {name: policy for name, policy in policies.items() if name not in SIDE_EFFECT_TOOLS}
+        # key -> (tool name, expires at (wall clock), file fingerprint, result)
+        self._entries: "OrderedDict[str, Tuple[str, float, str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        # Expiry is left to the backend; invalidation bumps a per-tool generation that is part of the key
+        self._shared = shared_state.namespace("tool") if shared_state.shared else None
+        self.hits = 0
+        self.misses = 0
+        if db_path and self._shared is not None:
+            print("Tool cache: shared state backend in use; SQLite tier not opened")
+        elif db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute('''
+                CREATE TABLE IF NOT EXISTS tool_cache (
+                    key TEXT PRIMARY KEY,
+                    tool TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    result TEXT NOT NULL
+                )
+                ''')
+                self._db.commit()
+            except Exception as e:
+                print(f"Warning: Tool cache SQLite tier disabled: {e}")
+                self._db = None
+
+    # --- Keys ---
+    def _key(self, tool_name: str, args: Dict[str, Any], generation: str = "") -> str:
+        policy = self.policies[tool_name]
+        if not isinstance(args, dict):
+            args = {"input": args}
+        key_args = policy.get("key_args")
+        selected = {k: v for k, v in args.items() if key_args is None or k in key_args}
+        if policy.get("fold_case"):
+            selected = {k: v.strip().lower() if isinstance(v, str) else v for k, v in selected.items()}
+        raw = json.dumps([tool_name, selected, generation], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _fingerprint(self, tool_name: str, args: Dict[str, Any],
+                     resolve_path: Optional[Callable[[str], Any]]) -> Optional[str]:
+        """mtime/size of the workspace files a call reads; None when they cannot be resolved"""
+        files = self.policies[tool_name].get("files")
+        if not files:
+            return ""
+        if resolve_path is None or not isinstance(args, dict):
+            return None
+        parts = []
+        for arg, default in files.items():
+            value = args.get(arg, default)
+            if value is None:
+                return None
+            try:
+                stat = resolve_path(value).stat()
+                parts.append(f"{value}:{stat.st_mtime_ns}:{stat.st_size}")
+            except FileNotFoundError:
+                parts.append(f"{value}:missing")
+            except Exception:
+                return None  # Path outside the workspace etc.; let the tool report it
+        return "|".join(parts)
+
+    # --- Tiers ---
+    def _generation(self, tool_name: str) -> str:
+        if self._shared is None or tool_name not in _INVALIDATED_TOOLS:
+            return ""
+        return self._shared.get(f"gen:{tool_name}") or ""
+
+    def _lookup(self, tool_name: str, args: Dict[str, Any], fingerprint: str) -> Tuple[str, bool, Any]:
+        """(key, found, result); runs in a worker thread"""
+        key = self._key(tool_name, args, self._generation(tool_name))
+        found, result = self._get(key, fingerprint)
+        return key, found, result
+
+    def _get(self, key: str, fingerprint: str) -> Tuple[bool, Any]:
+        if self._shared is not None:
+            raw = self._shared.get(key)
+            if raw is None:
+                return False, None
+            entry = json.loads(raw)
+            return (True, entry["result"]) if entry["fingerprint"] == fingerprint else (False, None)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] > now and entry[2] == fingerprint:
+                    self._entries.move_to_end(key)
+                    return True, entry[3]
+                del self._entries[key]
+        if self._db is None:
+            return False, None
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tool, expires_at, fingerprint, result FROM tool_cache WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[1] <= now or row[2] != fingerprint:
+            return False, None
+        self._remember(key, row[0], row[1], row[2], row[3])
+        return True, row[3]
+
+    def _remember(self, key: str, tool_name: str, expires_at: float, fingerprint: str, result: Any) -> None:
+        with self._lock:
+            self._entries[key] = (tool_name, expires_at, fingerprint, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _put(self, key: str, tool_name: str, fingerprint: str, result: Any) -> None:
+        if self._shared is not None:
+            try:
+                raw = json.dumps({"fingerprint": fingerprint, "result": result})
+            except (TypeError, ValueError):
+                return  # Not JSON-serializable; other workers could not use it either
+            self._shared.set(key, raw, self.policies[tool_name]["ttl"])
+            return
+        expires_at = time.time() + self.policies[tool_name]["ttl"]
+        self._remember(key, tool_name, expires_at, fingerprint, result)
+        if self._db is not None and isinstance(result, str):
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO tool_cache (key, tool, expires_at, fingerprint, result) VALUES (?, ?, ?, ?, ?)",
+                    (key, tool_name, expires_at, fingerprint, result)
+                )
+                self._db.execute("DELETE FROM tool_cache WHERE expires_at <= ?", (time.time(),))
+                self._db.commit()
+
+    def invalidate_tool(self, tool_name: str) -> None:
+        if self._shared is not None:
+            # Entries keyed by the old generation are unreachable and expire on their own
+            self._shared.set(f"gen:{tool_name}", str(time.time_ns()))
+            return
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if e[0] == tool_name]:
+                del self._entries[key]
+            if self._db is not None:
+                self._db.execute("DELETE FROM tool_cache WHERE tool = ?", (tool_name,))
+                self._db.commit()
+
+    # --- Calls ---
+    async def call(self, tool_name: str, tool: Any, args: Dict[str, Any],
+                   resolve_path: Optional[Callable[[str], Any]] = None) -> Any:
+        """Runs the tool through the cache (uncached tools run directly)"""
+        key = fingerprint = None
+        if tool_name in self.policies:
+            fingerprint = await asyncio.to_thread(self._fingerprint, tool_name, args, resolve_path)
+            if fingerprint is not None:
+                key, found, result = await asyncio.to_thread(self._lookup, tool_name, args, fingerprint)
+                with self._lock:
+                    if found:
+                        self.hits += 1
+                    else:
+                        self.misses += 1
+                if found:
+                    print(f"Tool cache hit: {tool_name}")
+                    return result
+
+        if getattr(tool, "coroutine", None) is not None:
+            result = await tool.ainvoke(args)
+        else:
+            result = await asyncio.to_thread(tool.invoke, args)
+
+        if key is not None and not _is_error_result(result):
+            await asyncio.to_thread(self._put, key, tool_name, fingerprint, result)
+        if tool_name in INVALIDATES and not _is_error_result(result):
+            for stale in INVALIDATES[tool_name]:
+                await asyncio.to_thread(self.invalidate_tool, stale)
+        return result
+
+    def wrap_tools(self, tools_map: Dict[str, Any],
+                   resolve_path: Optional[Callable[[str], Any]] = None) -> Dict[str, Any]:
+        """Returns a copy of `tools_map` whose cached and invalidating tools go through this cache"""
+        wrapped = {}
+        for name, tool in tools_map.items():
+            if name in self.policies or name in INVALIDATES:
+                wrapped[name] = CachedTool(name, tool, self, resolve_path)
+            else:
+                wrapped[name] = tool
+        return wrapped
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "sqlite": self._db is not None, "shared": self._shared is not None}
+
+
+class CachedTool:
+    """Stands in for a tool in executable_tools_map; other attributes pass through to the tool"""
+
+    def __init__(self, name: str, tool: Any, cache: ToolResultCache,
+                 resolve_path: Optional[Callable[[str], Any]] = None):
+        self._name = name
+        self._tool = tool
+        self._cache = cache
+        self._resolve_path = resolve_path
+        # ToolExecutor awaits tools that expose a coroutine; sync tools are threaded inside call()
+        self.coroutine = self.ainvoke
+
+    async def ainvoke(self, args: Dict[str, Any]) -> Any:
+        return await self._cache.call(self._name, self._tool, args, self._resolve_path)
+
+    def invoke(self, args: Dict[str, Any]) -> Any:
+        return self._tool.invoke(args)
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._tool, attr)
+
+
+tool_cache = ToolResultCache()
@@ -0,0 +1,170 @@
+import os
+import posixpath
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# Default number of simultaneous calls allowed per tool
+DEFAULT_TOOL_CONCURRENCY = int(os.environ.get("TOOL_CONCURRENCY_LIMIT", "4"))
+# Seconds a single tool call may run before it is reported as timed out
+DEFAULT_TOOL_TIMEOUT = float(os.environ.get("TOOL_CALL_TIMEOUT", "60"))
+
+# Tools that must not run concurrently with themselves
+PER_TOOL_CONCURRENCY = {
+    "python_repl": 1,          # Shares one interpreter namespace
+    "test_network_speed": 1,   # Parallel runs would skew each other's measurements
+    "index_document": 2,       # Embedding calls are rate limited upstream
+    "index_documents": 1,      # Each job already embeds with EMBED_CONCURRENCY requests
+}
+
+# Tools whose effects later calls may depend on without sharing a path argument (interpreter state,
+# repository contents, sent mail). In a batch they run alone, after the calls before them.
+STATEFUL_TOOLS = {
+    "python_repl",
+    "write_file_confirmed",
+    "delete_file_confirmed",
+    "send_gmail_confirmed",
+    "open_application_confirmed",
+    "create_or_update_repo_file",
+    "delete_repo_file",
+}
+
+# Confirmation-gated actions: the user approved them, so they run to completion instead of timing out
+UNTIMED_TOOLS = {
+    "write_file_confirmed",
+    "delete_file_confirmed",
+    "send_gmail_confirmed",
+    "open_application_confirmed",
+}
+
+# Argument names (by suffix) holding file or directory paths; calls on overlapping paths run in order
+PATH_ARG_SUFFIXES = ("path", "paths", "filename", "directory")
+
+
+def _call_paths(tool_args: Dict[str, Any]) -> Set[str]:
+    paths = set()
+    for name, value in (tool_args or {}).items():
+        if not name.lower().endswith(PATH_ARG_SUFFIXES):
+            continue
+        for item in value if isinstance(value, (list, tuple)) else [value]:
+            if isinstance(item, str) and item.strip():
+                paths.add(posixpath.normpath(item.strip().replace("\\", "/")).lstrip("/"))
+    return paths
+
+
+def _overlap(a: Set[str], b: Set[str]) -> bool:
+    """Same path, or one inside the other (a directory listing and a file written in it)"""
+    for x in a:
+        for y in b:
+            if x == y or x == "." or y == "." or y.startswith(x + "/") or x.startswith(y + "/"):
+                return True
+    return False
+
+
+class ToolExecutor:
+    """Runs tool calls concurrently with a per-tool concurrency limit and a per-call timeout.
+
+    Async tools (e.g. index_document, query_documents) are awaited through
+    ainvoke; sync tools run in a worker thread. Calls that may depend on each
+    other (stateful tools, overlapping paths) keep the order they were made in.
+    """
+
+    def __init__(self, default_concurrency: int = DEFAULT_TOOL_CONCURRENCY,
+                 timeout: float = DEFAULT_TOOL_TIMEOUT,
+                 per_tool_concurrency: Optional[Dict[str, int]] = None):
+        self.default_concurrency = max(1, default_concurrency)
+        self.timeout = timeout
+        self.per_tool_concurrency = dict(PER_TOOL_CONCURRENCY)
+        self.per_tool_concurrency.update(per_tool_concurrency or {})
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, tool_name: str) -> asyncio.Semaphore:
+        if tool_name not in self._semaphores:
+            limit = self.per_tool_concurrency.get(tool_name, self.default_concurrency)
+            self._semaphores[tool_name] = asyncio.Semaphore(max(1, limit))
+        return self._semaphores[tool_name]
+
+    @staticmethod
+    def is_async_tool(tool: Any) -> bool:
+        """True when the tool has a native coroutine implementation"""
+        return getattr(tool, "coroutine", None) is not None
+
+    async def run(self, tool_name: str, tool: Any, tool_args: Dict[str, Any], timed: bool = True) -> Any:
+        """Runs a single tool call. Raises asyncio.TimeoutError when it exceeds the timeout.
+
+        Untimed calls (`timed=False`, or a tool in UNTIMED_TOOLS) run to completion.
+        The tool's concurrency slot is held until the call really ends: a timed-out
+        thread cannot be cancelled and keeps its slot until it finishes.
+        """
+        semaphore = self._semaphore(tool_name)
+        await semaphore.acquire()
+        if self.is_async_tool(tool):
+            call = asyncio.ensure_future(tool.ainvoke(tool_args))
+        else:
+            # Shielded below, so a timeout leaves the future pending until the thread returns
+            call = asyncio.ensure_future(asyncio.to_thread(tool.invoke, tool_args))
+        call.add_done_callback(self._release(semaphore))
+        if not timed or tool_name in UNTIMED_TOOLS:
+            return await call
+        if self.is_async_tool(tool):
+            return await asyncio.wait_for(call, timeout=self.timeout)
+        return await asyncio.wait_for(asyncio.shield(call), timeout=self.timeout)
+
+    @staticmethod
+    def _release(semaphore: asyncio.Semaphore):
+        def done(future: asyncio.Future) -> None:
+            semaphore.release()
+            if not future.cancelled():
+                future.exception()  # Retrieved, so a timed-out call's late error is not logged as unhandled
+        return done
+
+    @staticmethod
+    def plan(calls: List[Tuple[str, Any, Dict[str, Any]]]) -> List[List[List[int]]]:
+        """Splits calls into phases run one after another; each phase holds chains that run
+        concurrently, and the calls of a chain (indices into `calls`) run in order.
+
+        A stateful tool is a phase of its own. Within a phase, calls on overlapping
+        paths share a chain, so a file is read only after an earlier call wrote it.
+        """
+        phases: List[List[List[int]]] = []
+        current: List[Tuple[List[int], Set[str]]] = []
+        for index, (name, _, args) in enumerate(calls):
+            if name in STATEFUL_TOOLS:
+                if current:
+                    phases.append(sorted(chain for chain, _ in current))
+                    current = []
+                phases.append([[index]])
+                continue
+            paths = _call_paths(args)
+            overlapping = [entry for entry in current if _overlap(paths, entry[1])]
+            if not overlapping:
+                current.append(([index], paths))
+                continue
+            # Merge every chain this call depends on, keeping call order
+            merged = sorted(i for chain, _ in overlapping for i in chain) + [index]
+            merged_paths = paths.union(*(chain_paths for _, chain_paths in overlapping))
+            current = [entry for entry in current if entry not in overlapping] + [(merged, merged_paths)]
+        if current:
+            phases.append(sorted(chain for chain, _ in current))
+        return phases
+
+    async def run_many(self, calls: List[Tuple[str, Any, Dict[str, Any]]]) -> List[Any]:
+        """Runs (tool_name, tool, args) calls, concurrently where plan() allows.
+
+        Results come back in the order of `calls`; a failed call yields its exception.
+        """
+        results: List[Any] = [None] * len(calls)
+
+        async def run_chain(chain: List[int]) -> None:
+            for index in chain:
+                name, tool, args = calls[index]
+                try:
+                    results[index] = await self.run(name, tool, args)
+                except Exception as e:
+                    results[index] = e
+
+        for phase in self.plan(calls):
+            await asyncio.gather(*(run_chain(chain) for chain in phase))
+        return results
+
+
+tool_executor = ToolExecutor()
@@ -0,0 +1,182 @@
+import ast
+import asyncio
+import importlib
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# JSON schema types for the annotations used by tool signatures
+_JSON_TYPES = {"str": "string", "int": "integer", "float": "number", "bool": "boolean",
+               "dict": "object", "Dict": "object", "list": "array", "List": "array"}
+
+
+def _annotation_schema(node: Optional[ast.expr]) -> Dict[str, Any]:
+    """JSON schema for a parameter annotation (str, int, Optional[X], List[X], ...)"""
+    if node is None:
+        return {"type": "string"}
+    if isinstance(node, ast.Name):
+        return {"type": _JSON_TYPES.get(node.id, "string")}
+    if isinstance(node, ast.Constant) and isinstance(node.value, str):
+        return _annotation_schema(ast.parse(node.value, mode="eval").body)
+    if isinstance(node, ast.Subscript):
+        outer = node.value.id if isinstance(node.value, ast.Name) else getattr(node.value, "attr", "")
+        inner = node.slice.value if isinstance(node.slice, getattr(ast, "Index", ())) else node.slice
+        if outer == "Optional":
+            return _annotation_schema(inner)
+        if outer in ("List", "list"):
+            return {"type": "array", "items": _annotation_schema(inner)}
+        return {"type": _JSON_TYPES.get(outer, "string")}
+    return {"type": "string"}
+
+
+def _is_tool_decorator(node: ast.expr) -> bool:
+    target = node.func if isinstance(node, ast.Call) else node
+    return isinstance(target, ast.Name) and target.id == "tool"
+
+
+def read_tool_specs(module: str) -> List[Dict[str, Any]]:
+    """Schemas of the plain `@tool` functions of a module, read from its source without importing it"""
+    spec = importlib.util.find_spec(module)
+    if spec is None or not spec.origin:
+        raise ImportError(f"Tool module '{module}' not found")
+    with open(spec.origin, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=spec.origin)
+
+    specs = []
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        decorators = [d for d in node.decorator_list if _is_tool_decorator(d)]
+        if not decorators:
+            continue
+        if isinstance(decorators[0], ast.Call):
+            # @tool("name", args_schema=...) etc. need the real object to describe them
+            raise ValueError(f"{module}.{node.name} uses a configured @tool decorator")
+
+        args = node.args.args
+        defaults = [None] * (len(args) - len(node.args.defaults)) + list(node.args.defaults)
+        properties, required = {}, []
+        for arg, default in zip(args, defaults):
+            properties[arg.arg] = _annotation_schema(arg.annotation)
+            if default is None:
+                required.append(arg.arg)
+            elif isinstance(default, ast.Constant) and default.value is not None:
+                properties[arg.arg]["default"] = default.value
+        specs.append({
+            "name": node.name,
+            "description": ast.get_docstring(node) or node.name,
+            "parameters": {"type": "object", "properties": properties, "required": required},
+        })
+    return specs
+
+
+class LazyTool:
+    """A tool whose schema is known up front; its implementation is built on first call.
+
+    Exposes what the router, system prompt and ToolExecutor need (name,
+    description, an OpenAI-style schema for bind_tools, ainvoke/invoke).
+    """
+
+    def __init__(self, name: str, description: str, parameters: Dict[str, Any], loader: Callable[[], Any]):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self._loader = loader
+        self._tool = None
+        self._lock = threading.Lock()
+        # ToolExecutor awaits tools that expose a coroutine; sync implementations are threaded in ainvoke
+        self.coroutine = self.ainvoke
+
+    @property
+    def loaded(self) -> bool:
+        return self._tool is not None
+
+    @property
+    def openai_schema(self) -> Dict[str, Any]:
+        return {"type": "function",
+                "function": {"name": self.name, "description": self.description, "parameters": self.parameters}}
+
+    def load(self) -> Any:
+        if self._tool is None:
+            with self._lock:
+                if self._tool is None:
+                    self._tool = self._loader()
+                    print(f"Loaded tool implementation: {self.name}")
+        return self._tool
+
+    async def ainvoke(self, args: Any) -> Any:
+        tool = self._tool if self._tool is not None else await asyncio.to_thread(self.load)
+        if getattr(tool, "coroutine", None) is not None:
+            return await tool.ainvoke(args)
+        return await asyncio.to_thread(tool.invoke, args)
+
+    def invoke(self, args: Any) -> Any:
+        return self.load().invoke(args)
+
+
+def bindable(tool: Any) -> Any:
+    """What to pass to bind_tools for a registry entry: the schema of lazy tools, the tool otherwise"""
+    return tool.openai_schema if isinstance(tool, LazyTool) else tool
+
+
+class ToolRegistry:
+    """Single list of the agent's tools, in prompt order, plus name aliases for execution.
+
+    Tools defined in app.py are registered as they are; tool modules are
+    described from source and only imported when one of their tools runs.
+    """
+
+    def __init__(self):
+        self._tools: "OrderedDict[str, Any]" = OrderedDict()
+        self._aliases: Dict[str, str] = {}
+
+    def add(self, tool: Any, aliases: Iterable[str] = ()) -> Any:
+        self._tools[tool.name] = tool
+        for alias in aliases:
+            self._aliases[alias] = tool.name
+        return tool
+
+    def add_lazy(self, name: str, description: str, parameters: Dict[str, Any],
+                 factory: Callable[[], Any], aliases: Iterable[str] = ()) -> LazyTool:
+        """Registers a tool built by `factory` on first call (e.g. third-party tool classes)"""
+        return self.add(LazyTool(name, description, parameters, factory), aliases)
+
+    def add_module(self, module: str, names: Optional[Iterable[str]] = None) -> None:
+        """Registers the @tool functions of `module` without importing it"""
+        wanted = set(names) if names is not None else None
+        try:
+            specs = read_tool_specs(module)
+        except Exception as e:
+            # Unusual declarations: fall back to importing the module now
+            print(f"Warning: Importing {module} eagerly ({e})")
+            loaded = importlib.import_module(module)
+            found = wanted or [n for n, v in vars(loaded).items() if hasattr(v, "args_schema") and hasattr(v, "invoke")]
+            for name in found:
+                self.add(getattr(loaded, name))
+            return
+
+        for spec in specs:
+            if wanted is not None and spec["name"] not in wanted:
+                continue
+            name = spec["name"]
+            loader = (lambda module=module, name=name: getattr(importlib.import_module(module), name))
+            self.add(LazyTool(name, spec["description"], spec["parameters"], loader))
+        missing = (wanted or set()) - set(self._tools)
+        if missing:
+            print(f"Warning: Tools not found in {module}: {', '.join(sorted(missing))}")
+
+    def tools(self) -> List[Any]:
+        return list(self._tools.values())
+
+    def executable_map(self) -> Dict[str, Any]:
+        """Tool name (and alias) -> tool, for the tool node and /confirm"""
+        mapping = dict(self._tools)
+        mapping.update({alias: self._tools[target] for alias, target in self._aliases.items()})
+        return mapping
+
+    def loaded(self) -> List[str]:
+        return [name for name, tool in self._tools.items() if not isinstance(tool, LazyTool) or tool.loaded]
+
+
+tool_registry = ToolRegistry()
@@ -0,0 +1,191 @@
+import os
+import re
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List
+
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+
+from utils.tool_registry import bindable
+
+# Maximum number of routed tools bound per turn (0 binds every tool)
+TOOL_ROUTER_TOP_K = int(os.environ.get("TOOL_ROUTER_TOP_K", "8"))
+# Number of bound-model variants (and subset system prompts) kept per process
+BOUND_MODEL_CACHE_SIZE = 64
+
+# Tools bound on every turn regardless of the query
+ALWAYS_INCLUDE = ["request_confirmation", "get_current_datetime", "brave_web_search"]
+
+# Extra trigger words per tool, on top of the words in its name and description
+KEYWORD_RULES = {
+    "tavily_search_results_json": ["search", "web", "news", "latest", "current", "lookup", "internet", "online"],
+    "brave_web_search": ["search", "web", "news", "latest", "current", "lookup", "internet", "online"],
+    "calculator": ["calculate", "math", "sum", "plus", "minus", "times", "divide", "percent", "equation", "compute"],
+    "get_current_datetime": ["date", "time", "today", "now", "day", "clock", "tomorrow", "yesterday"],
+    "read_file": ["file", "read", "open", "content", "workspace"],
+    "list_directory": ["folder", "directory", "files", "list", "workspace", "ls"],
+    "list_repo_contents": ["github", "repo", "repository", "files", "list"],
+    "get_repo_file_content": ["github", "repo", "repository", "file", "source"],
+    "create_or_update_repo_file": ["github", "repo", "repository", "commit", "push", "update"],
+    "delete_repo_file": ["github", "repo", "repository", "delete", "remove"],
+    "analyze_image": ["image", "photo", "picture", "label", "text", "ocr", "objects", "faces"],
+    "compare_faces": ["face", "faces", "compare", "match", "same", "person"],
+    "detect_personal_protective_equipment": ["ppe", "helmet", "mask", "gloves", "safety", "protective"],
+    "email_drafter": ["email", "mail", "draft", "write", "letter"],
+    "write_file_confirmed": ["write", "save", "create", "file", "overwrite"],
+    "delete_file_confirmed": ["delete", "remove", "file"],
+    "send_gmail_confirmed": ["email", "mail", "gmail", "send"],
+    "open_application_confirmed": ["open", "launch", "start", "app", "application", "program"],
+    "index_document": ["document", "index", "pdf", "docx", "ingest", "rag", "knowledge"],
+    "index_documents": ["documents", "index", "folder", "directory", "all", "bulk", "ingest", "rag"],
+    "ingestion_status": ["ingestion", "indexing", "job", "progress", "status"],
+    "query_documents": ["document", "documents", "pdf", "rag", "knowledge", "indexed", "according"],
+    "generate_image_gemini": ["generate", "draw", "image", "picture", "illustration", "art", "create"],
+    "wikipedia": ["wikipedia", "wiki", "who", "history", "biography", "encyclopedia"],
+    "wikipedia_query_run": ["wikipedia", "wiki", "who", "history", "biography", "encyclopedia"],
+    "youtube_search": ["youtube", "video", "videos", "watch"],
+    "python_repl": ["python", "code", "plot", "chart", "graph", "visualize", "data", "run", "execute", "script"],
+    "get_weather": ["weather", "temperature", "forecast", "rain", "wind", "humidity", "sunny"],
+    "get_location_info": ["location", "coordinates", "latitude", "longitude", "place", "where"],
+    "resize_image": ["resize", "scale", "image", "thumbnail", "dimensions"],
+    "apply_filter": ["filter", "blur", "sharpen", "grayscale", "image"],
+    "adjust_image": ["brightness", "contrast", "saturation", "adjust", "image"],
+    "merge_pdfs": ["pdf", "merge", "combine", "join"],
+    "add_watermark": ["pdf", "watermark", "stamp"],
+    "extract_pdf_pages": ["pdf", "extract", "pages", "split"],
+    "check_website": ["website", "site", "url", "up", "down", "status", "online"],
+    "analyze_domain": ["domain", "dns", "whois", "records", "mx"],
+    "test_network_speed": ["speed", "bandwidth", "internet", "network", "download", "upload"],
+    "get_system_info": ["system", "os", "hardware", "machine", "info"],
+    "get_resource_usage": ["cpu", "memory", "ram", "disk", "usage", "resources"],
+    "list_running_processes": ["processes", "process", "running", "tasks"],
+    "monitor_network_connections": ["connections", "ports", "network", "sockets"],
+    "convert_document": ["convert", "conversion", "docx", "pdf", "document", "format"],
+    "convert_image": ["convert", "conversion", "png", "jpg", "jpeg", "webp", "image", "format"],
+    "convert_data_format": ["convert", "conversion", "csv", "json", "xlsx", "excel", "format"],
+}
+
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "with", "is", "are", "was", "be",
+    "it", "this", "that", "me", "my", "i", "you", "your", "can", "could", "please", "what", "how",
+    "do", "does", "from", "at", "by", "as", "using", "use", "tool", "tools", "returns", "s",
+}
+
+
+def _tokens(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    # Crude plural folding so "files" matches "file"
+    return [w[:-1] if len(w) > 3 and w.endswith("s") else w for w in words if w not in STOPWORDS]
+
+
+class ToolRouter:
+    """Picks the tools relevant to a turn and caches model bindings per tool subset.
+
+    Scoring is IDF-weighted keyword overlap between the recent user messages
+    and each tool's name, description and KEYWORD_RULES entry. Tools called
+    since the previous user message stay bound so follow-ups keep working.
+    """
+
+    def __init__(self, tools: List[Any], prompt_builder: Callable[[List[Any]], str],
+                 top_k: int = TOOL_ROUTER_TOP_K, always_include: Iterable[str] = ALWAYS_INCLUDE):
+        self.tools = {tool.name: tool for tool in tools}
+        self.prompt_builder = prompt_builder
+        self.top_k = top_k
+        self.always_include = [name for name in always_include if name in self.tools]
+        self._bound: "OrderedDict[Any, Any]" = OrderedDict()
+        self._system_messages: "OrderedDict[frozenset, SystemMessage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_index()
+
+    def _build_index(self):
+        self._vocab: Dict[str, Dict[str, float]] = {}
+        for name, tool in self.tools.items():
+            weights: Dict[str, float] = {}
+            for token in _tokens(getattr(tool, "description", "") or ""):
+                weights[token] = max(weights.get(token, 0.0), 1.0)
+            # Name parts and explicit rules are stronger signals than description words
+            for token in _tokens(name.replace("_", " ")) + _tokens(" ".join(KEYWORD_RULES.get(name, []))):
+                weights[token] = 2.0
+            self._vocab[name] = weights
+
+        document_frequency: Dict[str, int] = {}
+        for weights in self._vocab.values():
+            for token in weights:
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        total = len(self._vocab) or 1
+        self._idf = {token: math.log(1 + total / df) for token, df in document_frequency.items()}
+
+    @staticmethod
+    def _recent_context(messages: List[BaseMessage]):
+        """Returns (last user text, previous user text, tools called since the previous user message)"""
+        human_indexes = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+        last_text = messages[human_indexes[-1]].content if human_indexes else ""
+        previous_text = messages[human_indexes[-2]].content if len(human_indexes) > 1 else ""
+        since = human_indexes[-2] if len(human_indexes) > 1 else 0
+        sticky = {
+            tc["name"]
+            for m in messages[since:] if isinstance(m, AIMessage)
+            for tc in (m.tool_calls or [])
+        }
+        return str(last_text), str(previous_text), sticky
+
+    def select(self, messages: List[BaseMessage]) -> List[str]:
+        """Names of the tools to bind for this turn"""
+        if self.top_k <= 0:
+            return list(self.tools)
+
+        last_text, previous_text, sticky = self._recent_context(messages)
+        query: Dict[str, float] = {}
+        for token in _tokens(previous_text):
+            query[token] = 0.5
+        for token in _tokens(last_text):
+            query[token] = 1.0
+
+        scores = {}
+        for name, weights in self._vocab.items():
+            score = sum(q * weights[t] * self._idf[t] for t, q in query.items() if t in weights)
+            if score > 0:
+                scores[name] = score
+        ranked = sorted(scores, key=scores.get, reverse=True)[:self.top_k]
+
+        selected = list(self.always_include)
+        for name in sorted(sticky) + ranked:
+            if name in self.tools and name not in selected:
+                selected.append(name)
+        return selected
+
+    def bind(self, llm: Any, tool_names: List[str]) -> Any:
+        """Returns `llm` bound to the given tools, reusing a cached binding when possible"""
+        key = (id(llm), frozenset(tool_names))
+        with self._lock:
+            cached = self._bound.get(key)
+            if cached is not None and cached[0] is llm:
+                self._bound.move_to_end(key)
+                return cached[1]
+
+        bound = llm.bind_tools([bindable(self.tools[name]) for name in tool_names])
+        with self._lock:
+            # The model is stored with its binding so a recycled id() can never match
+            self._bound[key] = (llm, bound)
+            self._bound.move_to_end(key)
+            while len(self._bound) > BOUND_MODEL_CACHE_SIZE:
+                self._bound.popitem(last=False)
+        return bound
+
+    def system_message(self, tool_names: List[str]) -> SystemMessage:
+        """System prompt listing only the given tools (cached per subset)"""
+        key = frozenset(tool_names)
+        with self._lock:
+            message = self._system_messages.get(key)
+            if message is not None:
+                self._system_messages.move_to_end(key)
+                return message
+
+        # Keep the caller's order so the prompt lists tools the same way the catalogue does
+        message = SystemMessage(content=self.prompt_builder([self.tools[name] for name in tool_names]))
+        with self._lock:
+            self._system_messages[key] = message
+            while len(self._system_messages) > BOUND_MODEL_CACHE_SIZE:
+                self._system_messages.popitem(last=False)
+        return message
@@ -0,0 +1,110 @@
+import os
+import hashlib
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from utils.async_io import run_blocking, UPLOAD_CHUNK_SIZE
+
+# Largest accepted upload, in megabytes
+MAX_UPLOAD_MB = float(os.environ.get("MAX_UPLOAD_MB", "25"))
+# Workspace subdirectory of the content-addressed upload store
+UPLOAD_DIR_NAME = "uploads"
+# Hex digits of the SHA-256 used in stored file names (96 bits)
+STORED_NAME_DIGITS = 24
+
+IMAGE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp"}
+# Types index_document can load
+DOCUMENT_EXTENSIONS = {".pdf", ".docx", ".txt", ".md", ".csv"}
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedUpload(Exception):
+    pass
+
+
+class ContentStore:
+    """Content-addressed store for uploads under WORKSPACE_DIR/uploads.
+
+    Uploads are copied in fixed-size chunks to a temp file while their
+    SHA-256 is computed, and stop as soon as they exceed the size limit.
+    The finished file is renamed to its digest, so uploading the same
+    content again reuses the stored copy.
+    """
+
+    def __init__(self, workspace_dir: Path, max_bytes: int = int(MAX_UPLOAD_MB * 1024 * 1024),
+                 chunk_size: int = UPLOAD_CHUNK_SIZE):
+        self.workspace_dir = Path(workspace_dir)
+        self.root = self.workspace_dir / UPLOAD_DIR_NAME
+        self.tmp_dir = self.root / ".tmp"
+        self.max_bytes = max_bytes
+        self.chunk_size = chunk_size
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.stored = 0
+        self.deduplicated = 0
+
+    @staticmethod
+    def kind(filename: Optional[str], content_type: Optional[str]) -> str:
+        """'image' or 'document' for accepted uploads; raises UnsupportedUpload otherwise"""
+        extension = Path(filename or "").suffix.lower()
+        if extension in DOCUMENT_EXTENSIONS:
+            return "document"
+        if extension in IMAGE_EXTENSIONS or (not extension and (content_type or "").startswith("image/")):
+            return "image"
+        allowed = ", ".join(sorted(IMAGE_EXTENSIONS | DOCUMENT_EXTENSIONS))
+        raise UnsupportedUpload(f"Unsupported file type '{extension or content_type}'. Allowed: {allowed}")
+
+    def _too_large(self) -> str:
+        return f"Upload exceeds the {self.max_bytes / (1024 * 1024):g} MB limit"
+
+    @staticmethod
+    def _write_chunk(handle: Any, digest: Any, chunk: bytes) -> None:
+        digest.update(chunk)
+        handle.write(chunk)
+
+    def _commit(self, tmp_path: str, final_path: Path) -> bool:
+        """Moves the temp file into place; False when identical content is already stored"""
+        if final_path.exists():
+            os.unlink(tmp_path)
+            return False
+        os.replace(tmp_path, final_path)  # Atomic; a concurrent identical upload ends the same way
+        return True
+
+    async def save(self, upload: Any, extension: str) -> Dict[str, Any]:
+        """Stores an UploadFile; returns its workspace-relative path, sha256, size and whether it was a duplicate"""
+        fd, tmp_path = await run_blocking(tempfile.mkstemp, dir=self.tmp_dir, suffix=".part")
+        handle = os.fdopen(fd, "wb")
+        digest = hashlib.sha256()
+        size = 0
+        committed = False
+        try:
+            while True:
+                chunk = await upload.read(self.chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadTooLarge(self._too_large())
+                await run_blocking(self._write_chunk, handle, digest, chunk)
+            await run_blocking(handle.close)
+            sha256 = digest.hexdigest()
+            final_path = self.root / f"{sha256[:STORED_NAME_DIGITS]}{extension.lower()}"
+            is_new = await run_blocking(self._commit, tmp_path, final_path)
+            committed = True
+        finally:
+            if not committed:
+                handle.close()
+                await run_blocking(Path(tmp_path).unlink, missing_ok=True)
+
+        if is_new:
+            self.stored += 1
+        else:
+            self.deduplicated += 1
+        return {"path": final_path.relative_to(self.workspace_dir).as_posix(), "sha256": sha256,
+                "size": size, "deduplicated": not is_new}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"stored": self.stored, "deduplicated": self.deduplicated, "max_bytes": self.max_bytes}
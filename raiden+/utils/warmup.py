@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import threading
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+# Seconds a component may take to warm up before it is reported as timed out (it keeps going)
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "30"))
+# Seconds a tool call waits for a component that is still warming up
+COMPONENT_WAIT_SECONDS = float(os.environ.get("COMPONENT_WAIT_SECONDS", "10"))
+
+PENDING, WARMING, READY, DISABLED, FAILED, TIMEOUT = "pending", "warming", "ready", "disabled", "failed", "timeout"
+
+
+class WarmupManager:
+    """Initializes slow clients in the background once the server is listening.
+
+    Each component is a blocking initializer run in a worker thread; they run
+    concurrently, and a slow or unreachable dependency only affects its own
+    status. An initializer returning False reports the component as disabled
+    (e.g. missing credentials); raising reports it as failed.
+    """
+
+    def __init__(self, timeout: float = WARMUP_TIMEOUT):
+        self.timeout = timeout
+        self._initializers: Dict[str, Callable[[], Any]] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._done: Dict[str, threading.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._lock = threading.Lock()
+
+    def register(self, name: str, initializer: Callable[[], Any]) -> None:
+        self._initializers[name] = initializer
+        self._status[name] = {"state": PENDING}
+        self._done[name] = threading.Event()
+
+    def _finish(self, name: str, started: float, state: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._status[name] = {"state": state, "seconds": round(time.monotonic() - started, 3)}
+            if error:
+                self._status[name]["error"] = error
+            # Set under the lock, so _warm never reports a finished component as timed out
+            self._done[name].set()
+        print(f"Warm-up {name}: {state}" + (f" ({error})" if error else ""))
+
+    def _run_initializer(self, name: str, started: float) -> None:
+        try:
+            result = self._initializers[name]()
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(name, started, FAILED, str(e))
+            return
+        self._finish(name, started, DISABLED if result is False else READY)
+
+    async def _warm(self, name: str) -> None:
+        started = time.monotonic()
+        with self._lock:
+            self._status[name] = {"state": WARMING}
+        work = asyncio.get_running_loop().run_in_executor(None, self._run_initializer, name, started)
+        try:
+            await asyncio.wait_for(asyncio.shield(work), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            # The thread cannot be stopped; its final state replaces this one when it finishes
+            with self._lock:
+                if not self._done[name].is_set():
+                    self._status[name] = {"state": TIMEOUT, "seconds": round(time.monotonic() - started, 3)}
+
+    def start(self) -> None:
+        """Schedules every registered component; returns immediately"""
+        self._tasks = [asyncio.ensure_future(self._warm(name)) for name in self._initializers]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def retry(self, name: str) -> bool:
+        """Runs a failed component's initializer again in the calling thread; True if it is ready"""
+        if self.state(name) == FAILED:
+            self._run_initializer(name, time.monotonic())
+        return self.state(name) == READY
+
+    def wait_for(self, name: str, timeout: float = COMPONENT_WAIT_SECONDS) -> bool:
+        """Blocks (in a worker thread) until `name` finished warming; True if it is ready"""
+        done = self._done.get(name)
+        if done is None:
+            return False
+        done.wait(timeout)
+        return self.state(name) == READY
+
+    def state(self, name: str) -> Optional[str]:
+        with self._lock:
+            status = self._status.get(name)
+            return status["state"] if status else None
+
+    @property
+    def ready(self) -> bool:
+        """True once no component is still pending or warming"""
+        with self._lock:
+            return all(s["state"] not in (PENDING, WARMING) for s in self._status.values())
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: dict(status) for name, status in self._status.items()}
+
+
+warmup = WarmupManager()